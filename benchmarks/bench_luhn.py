@@ -0,0 +1,89 @@
+"""
+Бенчмарки алгоритма Луна: табличная и пакетная реализации против исходной.
+
+Запуск:
+    pytest benchmarks/bench_luhn.py --benchmark-only
+"""
+import io
+import os
+import random
+import sys
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import luhn_algorithm
+from luhn_algorithm import calculate_luhn_checksum, validate_luhn_checksums, add_valid_luhn_checksums
+
+# Вывод исходной реализации направляем в буфер, чтобы не засорять отчет
+_sink = io.StringIO()
+
+
+def reference_calculate_luhn_checksum(number: str) -> int:
+    """
+    Исходная реализация (цикл по цифрам с int() и print на каждую цифру).
+    """
+    checksum = 0
+    for i, digit in enumerate(reversed(number)):
+        digit = int(digit)
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        print(digit, file=_sink)
+        checksum += digit
+    _sink.seek(0)
+    _sink.truncate()
+    return checksum % 10
+
+
+random.seed(0)
+SERIALS = [f"{random.randrange(10 ** 12):012d}" for _ in range(10000)]
+PARTIALS = [serial[:11] for serial in SERIALS]
+
+
+def test_results_match_reference():
+    """Проверка, что новые реализации совпадают с исходной."""
+    expected = [reference_calculate_luhn_checksum(serial) for serial in SERIALS[:1000]]
+    assert [calculate_luhn_checksum(serial) for serial in SERIALS[:1000]] == expected
+    assert validate_luhn_checksums(SERIALS[:1000]) == [checksum == 0 for checksum in expected]
+
+
+@pytest.mark.benchmark(group="single")
+def test_single_reference(benchmark):
+    benchmark(reference_calculate_luhn_checksum, SERIALS[0])
+
+
+@pytest.mark.benchmark(group="single")
+def test_single_table(benchmark):
+    benchmark(calculate_luhn_checksum, SERIALS[0])
+
+
+@pytest.mark.benchmark(group="batch-validate-10k")
+def test_batch_reference(benchmark):
+    benchmark(lambda: [reference_calculate_luhn_checksum(serial) == 0 for serial in SERIALS])
+
+
+@pytest.mark.benchmark(group="batch-validate-10k")
+def test_batch_table(benchmark):
+    benchmark(lambda: [calculate_luhn_checksum(serial) == 0 for serial in SERIALS])
+
+
+@pytest.mark.benchmark(group="batch-validate-10k")
+def test_batch_vectorized(benchmark):
+    if luhn_algorithm._numpy() is None:
+        pytest.skip("NumPy не установлен")
+    benchmark(validate_luhn_checksums, SERIALS)
+
+
+@pytest.mark.benchmark(group="batch-validate-10k")
+def test_batch_pure_python_fallback(benchmark, monkeypatch):
+    monkeypatch.setattr(luhn_algorithm, "np", None)
+    benchmark(validate_luhn_checksums, SERIALS)
+
+
+@pytest.mark.benchmark(group="batch-complete-10k")
+def test_complete_vectorized(benchmark):
+    benchmark(add_valid_luhn_checksums, PARTIALS)
@@ -0,0 +1,183 @@
+"""
+Локальная замена Google Sheets API для нагрузочного тестирования:
+- aiohttp сервер, отвечающий на запросы gspread (метаданные таблицы, значения листа, Drive modifiedTime)
+- настраиваемые задержка ответа и число строк
+- SheetClient, запросы которого перенаправляются на этот сервер
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+from typing import List, Tuple
+import requests
+import gspread
+from aiohttp import web
+from google.oauth2.credentials import Credentials
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from luhn_algorithm import add_valid_luhn_checksums
+from sheets_client import HTTP_POOL_SIZE, SheetClient
+
+HEADERS = ["Серийный номер", "Дата производства", "Производитель", "Модель", "Комментарий"]
+MODELS = ["Сатурн", "Юпитер", "Марс", "Венера", "Меркурий"]
+
+# Хосты Google API, запросы к которым перенаправляются на локальный сервер
+GOOGLE_HOSTS = ("https://sheets.googleapis.com", "https://www.googleapis.com")
+
+
+def generate_serials(rows: int, start: int = 0) -> List[str]:
+    """
+    Возвращает rows валидных по алгоритму Луна серийных номеров (12 цифр).
+    """
+    return add_valid_luhn_checksums([f"{number:011d}" for number in range(start, start + rows)])
+
+
+def generate_values(rows: int) -> List[List[str]]:
+    """
+    Генерирует значения листа: заголовки и rows строк с данными.
+    """
+    values = [list(HEADERS)]
+    for number, serial in enumerate(generate_serials(rows)):
+        values.append([
+            serial,
+            f"2026-{number % 12 + 1:02d}-{number % 28 + 1:02d}",
+            f"Производитель {number % 100}",
+            MODELS[number % len(MODELS)],
+            f"Партия {number // 1000}",
+        ])
+    return values
+
+
+def _row_bounds(range_name: str, rows: int) -> Tuple[int, int]:
+    """
+    Возвращает границы строк (1-based, включительно) из диапазона вида 'Sheet1'!1:5000.
+    Диапазон без номеров строк означает весь лист.
+    """
+    bounds = range_name.rpartition("!")[2].split(":")
+    try:
+        first, last = (int(bound.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ") or 0) for bound in bounds)
+    except ValueError:
+        return 1, rows
+    return max(first, 1), min(last or rows, rows)
+
+
+def create_fake_sheets_app(rows: int, latency: float = 0.0, sheet_name: str = "Sheet1",
+                           modified_time: str = "2026-01-01T00:00:00.000Z") -> web.Application:
+    """
+    Создает aiohttp приложение, отвечающее как Sheets API v4 и Drive API v3.
+    Значения отдаются по запрошенному диапазону строк.
+    """
+    sheet_values = generate_values(rows)
+    total_rows = len(sheet_values)
+
+    async def delay() -> None:
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def spreadsheet(request: web.Request) -> web.Response:
+        await delay()
+        return web.json_response({
+            "spreadsheetId": request.match_info["sheet_id"],
+            "properties": {"title": "Load test"},
+            "sheets": [{"properties": {
+                "sheetId": 0,
+                "title": sheet_name,
+                "index": 0,
+                "sheetType": "GRID",
+                "gridProperties": {"rowCount": total_rows, "columnCount": len(HEADERS)},
+            }}],
+        })
+
+    async def values(request: web.Request) -> web.Response:
+        await delay()
+        first, last = _row_bounds(request.match_info["range"], total_rows)
+        body = json.dumps({
+            "range": f"'{sheet_name}'!A{first}:E{last}",
+            "majorDimension": "ROWS",
+            "values": sheet_values[first - 1:last],
+        }, ensure_ascii=False).encode("utf-8")
+        return web.Response(body=body, content_type="application/json")
+
+    async def drive_file(request: web.Request) -> web.Response:
+        await delay()
+        return web.json_response({"id": request.match_info["sheet_id"], "modifiedTime": modified_time})
+
+    app = web.Application()
+    app.router.add_get("/v4/spreadsheets/{sheet_id}", spreadsheet)
+    app.router.add_get("/v4/spreadsheets/{sheet_id}/values/{range}", values)
+    app.router.add_get("/drive/v3/files/{sheet_id}", drive_file)
+    return app
+
+
+def _serve(rows: int, latency: float, ready) -> None:
+    """
+    Точка входа процесса с сервером: сообщает порт через ready и работает до завершения процесса.
+    """
+    async def main() -> None:
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        runner = web.AppRunner(create_fake_sheets_app(rows, latency))
+        await runner.setup()
+        await web.SockSite(runner, sock).start()
+        ready.send(sock.getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def start_fake_sheets_server(rows: int, latency: float = 0.0) -> Tuple[multiprocessing.Process, str]:
+    """
+    Запускает сервер в отдельном процессе, чтобы его память и процессорное время
+    не попадали в измерения бота. Возвращает процесс и базовый адрес сервера.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_serve, args=(rows, latency, sender), daemon=True)
+    process.start()
+    if not receiver.poll(600):
+        process.terminate()
+        raise RuntimeError("Локальный сервер Sheets API не запустился")
+    return process, f"http://127.0.0.1:{receiver.recv()}"
+
+
+class _RedirectAdapter(requests.adapters.HTTPAdapter):
+    """
+    Транспорт requests, который отправляет запросы к Google API на локальный сервер.
+    """
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        for host in GOOGLE_HOSTS:
+            if request.url.startswith(host):
+                request.url = self.base_url + request.url[len(host):]
+                break
+        return super().send(request, **kwargs)
+
+
+def _local_credentials() -> Credentials:
+    """Учетные данные с токеном, который никогда не истекает."""
+    return Credentials(token="load-test")
+
+
+class LocalSheetClient(SheetClient):
+    """
+    SheetClient без авторизации, работающий с локальным сервером Sheets API.
+    """
+
+    def __init__(self, base_url: str, sheet_id: str = "load-test", sheet_name: str = "Sheet1",
+                 pool_size: int = HTTP_POOL_SIZE):
+        super().__init__(_local_credentials, sheet_id, sheet_name, pool_size)
+        self.base_url = base_url
+
+    def _authorize(self) -> gspread.Client:
+        self._credentials = self._credentials_factory()
+        session = requests.Session()
+        adapter = _RedirectAdapter(self.base_url, pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+        session.mount("https://", adapter)
+        self.stats["authorizations"] += 1
+        return gspread.Client(auth=self._credentials, session=session)
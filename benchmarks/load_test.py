@@ -0,0 +1,345 @@
+"""
+Нагрузочный тест бота: обработчик сообщений под потоком синтетических обновлений
+против локальной замены Google Sheets API (см. fake_sheets.py).
+
+Отчет в формате JSON: пропускная способность, задержки p50/p95/p99, время загрузки
+снимка и память процесса для каждого размера таблицы.
+
+Запуск:
+    python benchmarks/load_test.py --rows 1000 100000 1000000 --rate 2000 --requests 20000 --output results.json
+Сравнение двух отчетов (код возврата 1 при регрессии больше --threshold):
+    python benchmarks/load_test.py --compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройки бота для теста: один лист на локальном сервере, снимок на диск не пишется
+os.environ.setdefault("BOT_TOKEN", "load-test")
+os.environ["SHEET_ID"] = "load-test"
+os.environ["SHEET_NAME"] = "Sheet1"
+os.environ["SHEET_SOURCES"] = ""
+os.environ["SERIAL_NUMBER_COLUMN"] = "1"
+os.environ["IGNORE_COLUMNS"] = ""
+os.environ["SNAPSHOT_PATH"] = ""
+os.environ["LOOKUP_BACKEND"] = "sheets"
+
+import bot
+import google_sheets
+from luhn_algorithm import add_valid_luhn_checksum
+from rate_limit import THROTTLED_REPLY, FairScheduler, RateLimiter, rate_limited
+from sheet_federation import FederatedSync
+from sheet_sync import GspreadSheetSource, SheetSync
+from single_flight import SingleFlight
+from fake_sheets import LocalSheetClient, start_fake_sheets_server
+
+# Метрики, по которым сравниваются отчеты: имя -> True, если больше - лучше
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+    "index_load_seconds": False,
+    "index_rss_mb": False,
+}
+
+
+class FakeMessage:
+    """
+    Сообщение Telegram: ответы не отправляются, а сохраняются после задержки отправки.
+    """
+
+    __slots__ = ("text", "reply", "_latency")
+
+    def __init__(self, text: str, latency: float):
+        self.text = text
+        self.reply: Optional[str] = None
+        self._latency = latency
+
+    async def reply_text(self, text: str, **kwargs) -> None:
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        self.reply = text
+
+    async def reply_document(self, document, filename: str = "", caption: str = "", **kwargs) -> None:
+        await self.reply_text(caption)
+
+
+class FakeUser:
+    __slots__ = ("id",)
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeUpdate:
+    """
+    Обновление Telegram с текстовым сообщением пользователя.
+    """
+
+    __slots__ = ("message", "effective_message", "effective_user", "effective_chat")
+
+    def __init__(self, text: str, user_id: int, latency: float):
+        self.message = self.effective_message = FakeMessage(text, latency)
+        self.effective_user = FakeUser(user_id)
+        self.effective_chat = self.effective_user
+
+
+def current_rss_mb() -> float:
+    """
+    Текущий размер резидентной памяти процесса в МБ (Linux), иначе пиковый.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Пиковый размер резидентной памяти процесса в МБ.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux - в килобайтах
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Процентиль по отсортированному списку (метод ближайшего ранга).
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def make_inputs(rows: int, count: int, hit_ratio: float, invalid_ratio: float, seed: int) -> List[str]:
+    """
+    Генерирует ввод пользователей: существующие номера, валидные отсутствующие номера
+    и строки с ошибкой формата в заданной пропорции.
+    """
+    rng = random.Random(seed)
+    inputs = []
+    for _ in range(count):
+        draw = rng.random()
+        if draw < invalid_ratio:
+            inputs.append(str(rng.randrange(10 ** 5)))
+        elif draw < invalid_ratio + hit_ratio:
+            inputs.append(add_valid_luhn_checksum(f"{rng.randrange(rows):011d}"))
+        else:
+            inputs.append(add_valid_luhn_checksum(f"{rows + rng.randrange(10 ** 9):011d}"))
+    return inputs
+
+
+def install_fake_sheet(base_url: str) -> None:
+    """
+    Подключает модуль google_sheets к локальному серверу и сбрасывает снимок.
+    """
+    client = LocalSheetClient(base_url)
+    google_sheets._clients = [client]
+    source = GspreadSheetSource(client, google_sheets.SHEET_CHUNK_ROWS, google_sheets.SHEET_FETCH_PARALLELISM)
+    google_sheets._sync = FederatedSync([SheetSync(source, serial_column=1)])
+    google_sheets._fetch_flight = SingleFlight()
+    google_sheets._index = None
+
+
+def _classify(reply: Optional[str]) -> str:
+    if reply is None:
+        return "no_reply"
+    if reply.startswith("✅"):
+        return "hit"
+    if reply == THROTTLED_REPLY:
+        return "throttled"
+    if "не найден" in reply:
+        return "miss"
+    if "недоступна" in reply:
+        return "unavailable"
+    if "ошибка" in reply.lower():
+        return "error"
+    return "invalid"
+
+
+async def drive_load(handler, inputs: List[str], rate: float, concurrency: int, users: int,
+                     telegram_latency: float) -> Dict[str, object]:
+    """
+    Подает обновления в обработчик и измеряет задержку каждого.
+    При rate > 0 обновления приходят с постоянной частотой (открытая модель, задержка
+    отсчитывается от запланированного времени прихода). При rate = 0 обновления
+    обрабатываются без пауз в concurrency потоков.
+    """
+    latencies: List[float] = [0.0] * len(inputs)
+    updates = [FakeUpdate(text, number % users, telegram_latency) for number, text in enumerate(inputs)]
+
+    async def process(number: int, arrived: float) -> None:
+        await handler(updates[number], None)
+        latencies[number] = time.perf_counter() - arrived
+
+    started = time.perf_counter()
+    if rate > 0:
+        tasks = []
+        for number in range(len(updates)):
+            arrival = started + number / rate
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(process(number, arrival)))
+        await asyncio.gather(*tasks)
+    else:
+        queue = iter(range(len(updates)))
+
+        async def worker() -> None:
+            for number in queue:
+                await process(number, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    outcomes: Dict[str, int] = {}
+    for update in updates:
+        outcome = _classify(update.message.reply)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "requests": len(inputs),
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_rps": round(len(inputs) / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "outcomes": outcomes,
+    }
+
+
+async def run_scenario(rows: int, args: argparse.Namespace) -> Dict[str, object]:
+    """
+    Прогоняет нагрузку для таблицы из rows строк.
+    """
+    process, base_url = start_fake_sheets_server(rows, args.sheets_latency)
+    try:
+        install_fake_sheet(base_url)
+        inputs = make_inputs(rows, args.requests, args.hit_ratio, args.invalid_ratio, args.seed)
+
+        rss_before = current_rss_mb()
+        load_started = time.perf_counter()
+        await google_sheets.get_index_async()
+        index_load_seconds = time.perf_counter() - load_started
+        rss_loaded = current_rss_mb()
+
+        handler = bot.handle_message
+        if args.with_limits:
+            handler = rate_limited(RateLimiter(bot.RATE_LIMIT_RATE, bot.RATE_LIMIT_BURST),
+                                   FairScheduler(bot.MAX_CONCURRENT_REQUESTS))(handler)
+
+        result = {"rows": rows, "index_load_seconds": round(index_load_seconds, 4)}
+        result.update(await drive_load(handler, inputs, args.rate, args.concurrency, args.users,
+                                       args.telegram_latency))
+        result.update({
+            "index_rss_mb": round(rss_loaded - rss_before, 2),
+            "rss_mb": round(current_rss_mb(), 2),
+            "peak_rss_mb": round(peak_rss_mb(), 2),
+        })
+        return result
+    finally:
+        process.terminate()
+        process.join()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, object]:
+    scenarios = []
+    for rows in args.rows:
+        result = await run_scenario(rows, args)
+        print(f"rows={rows}: {result['throughput_rps']} rps, p99 {result['latency_p99_ms']} ms",
+              file=sys.stderr)
+        scenarios.append(result)
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "compare", "threshold")}
+    return {
+        "bot_version": bot.BOT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "scenarios": scenarios,
+    }
+
+
+def compare_reports(base: Dict[str, object], new: Dict[str, object], threshold: float) -> bool:
+    """
+    Печатает изменения метрик по сценариям с одинаковым числом строк.
+    Возвращает True, если какая-то метрика ухудшилась больше чем на threshold (доля).
+    """
+    base_scenarios = {scenario["rows"]: scenario for scenario in base["scenarios"]}
+    regressed = False
+    print(f"{'rows':>9}  {'metric':<20} {'base':>12} {'new':>12} {'change':>8}")
+    for scenario in new["scenarios"]:
+        old = base_scenarios.get(scenario["rows"])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = old.get(metric), scenario.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            mark = " !" if worse > threshold else ""
+            regressed = regressed or worse > threshold
+            print(f"{scenario['rows']:>9}  {metric:<20} {before:>12} {after:>12} {change:>+8.1%}{mark}")
+    return regressed
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальной заменой Google Sheets")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000],
+                        help="Размеры таблицы (по сценарию на каждый), например 1000 100000 1000000")
+    parser.add_argument("--requests", type=int, default=10000, help="Число сообщений в сценарии")
+    parser.add_argument("--rate", type=float, default=1000,
+                        help="Сообщений в секунду (0 - без пауз, см. --concurrency)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Число одновременных обработчиков при --rate 0")
+    parser.add_argument("--users", type=int, default=1000, help="Число разных пользователей")
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="Доля существующих номеров")
+    parser.add_argument("--invalid-ratio", type=float, default=0.05, help="Доля ввода с ошибкой формата")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="Задержка ответа Sheets API в секундах")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Задержка отправки ответа в Telegram")
+    parser.add_argument("--with-limits", action="store_true",
+                        help="Пропускать обновления через ограничение частоты и справедливую очередь")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора ввода")
+    parser.add_argument("--output", help="Файл для отчета (по умолчанию stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Сравнить два отчета")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое ухудшение при сравнении (доля)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as file:
+            base = json.load(file)
+        with open(args.compare[1], encoding="utf-8") as file:
+            new = json.load(file)
+        return 1 if compare_reports(base, new, args.threshold) else 0
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Масштабирование по числу процессов: N воркеров одновременно обрабатывают поток
+запросов (разбор номера, поиск, форматирование ответа) в течение --duration секунд.
+
+Режимы:
+- shared  каждый воркер отображает в память общий снимок (LOOKUP_BACKEND=shared)
+- copy    каждый воркер строит свою копию снимка в памяти (как sheets в нескольких процессах)
+
+Отчет для каждого режима и числа воркеров: суммарная пропускная способность, ускорение
+и эффективность относительно одного воркера, а также память снимка в воркере:
+anon_mb - собственная (анонимная) память, которая не делится между процессами,
+pss_mb - доля воркера в резидентной памяти с учетом общих страниц.
+Ускорение ограничено числом ядер: на машине с одним ядром пропускная способность не растет.
+
+Запуск:
+    python benchmarks/shared_scaling.py --rows 100000 --workers 1 2 4 8 --duration 5 --output scaling.json
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import cycle, islice
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from formatting import format_reply
+from luhn_algorithm import add_valid_luhn_checksum
+from row_store import ColumnarRowsBuilder
+from serial_index import SerialIndex
+from serial_number import parse_serial_number
+from shared_index import SharedIndexFile, save_shared_index
+
+MODES = ("shared", "copy")
+
+
+def build_file(directory: str, rows: int) -> str:
+    """
+    Строит снимок из rows строк и сохраняет его в файл общего снимка. Возвращает путь к файлу.
+    """
+    values = [["Серийный номер", "Дата производства", "Модель", "Комментарий"]]
+    for number in range(rows):
+        values.append([add_valid_luhn_checksum(f"{number:011d}"), f"2026-{number % 12 + 1:02d}-01",
+                       f"Модель {number % 17}", f"Партия {number // 1000}"])
+    path = os.path.join(directory, "shared_index.bin")
+    save_shared_index(SerialIndex.from_values(values, serial_column=1), path)
+    return path
+
+
+def make_inputs(rows: int, count: int, seed: int) -> List[str]:
+    """
+    Ввод пользователей: 80% существующих номеров, остальное - отсутствующие номера.
+    """
+    rng = random.Random(seed)
+    return [
+        add_valid_luhn_checksum(f"{rng.randrange(rows) if rng.random() < 0.8 else rows + rng.randrange(10 ** 9):011d}")
+        for _ in range(count)
+    ]
+
+
+def memory_mb() -> Dict[str, float]:
+    """
+    Анонимная память и PSS процесса в МБ (Linux, /proc/self/smaps_rollup).
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            for line in file:
+                name, _, rest = line.partition(":")
+                if name in ("Anonymous", "Pss"):
+                    fields[name] = int(rest.split()[0]) / 1024
+    except OSError:
+        pass
+    return {"anon_mb": fields.get("Anonymous", 0.0), "pss_mb": fields.get("Pss", 0.0)}
+
+
+def worker(mode: str, path: str, inputs: List[str], duration: float, barrier, results) -> None:
+    """
+    Загружает снимок, ждет остальных воркеров и обрабатывает запросы duration секунд.
+    """
+    before = memory_mb()
+    index = SharedIndexFile(path).index
+    if mode == "copy":
+        # Своя копия строк в памяти процесса, как после синхронизации с таблицей
+        builder = ColumnarRowsBuilder()
+        for key, data in index.items():
+            builder.add_dict(key, data)
+        index = SerialIndex(builder.build())
+    barrier.wait()
+
+    handled = 0
+    requests = cycle(inputs)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for text in islice(requests, 100):
+            is_valid, result = parse_serial_number(text)
+            if is_valid:
+                index.get_rendered(result, format_reply)
+            handled += 1
+
+    after = memory_mb()
+    results.put({
+        "handled": handled,
+        "anon_mb": after["anon_mb"] - before["anon_mb"],
+        "pss_mb": after["pss_mb"] - before["pss_mb"],
+    })
+
+
+def run(mode: str, path: str, workers: int, inputs: List[str], duration: float) -> Dict[str, float]:
+    """
+    Запускает workers процессов одновременно и собирает их результаты.
+    """
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mode, path, inputs, duration, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        "workers": workers,
+        "throughput_rps": round(sum(report["handled"] for report in reports) / duration, 1),
+        "anon_mb_per_worker": round(sum(report["anon_mb"] for report in reports) / workers, 1),
+        "pss_mb_per_worker": round(sum(report["pss_mb"] for report in reports) / workers, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Масштабирование поиска по числу процессов: общий снимок и копии")
+    parser.add_argument("--rows", type=int, default=100000, help="Строк в снимке")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Числа воркеров")
+    parser.add_argument("--duration", type=float, default=5.0, help="Длительность замера в секундах")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="Режимы")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора ввода")
+    parser.add_argument("--output", help="Файл для отчета в формате JSON")
+    args = parser.parse_args()
+
+    report = {
+        "rows": args.rows,
+        "duration": args.duration,
+        "cpu_count": os.cpu_count(),
+        "available_cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "python": sys.version.split()[0],
+        "results": {},
+    }
+    print(f"Ядер доступно: {report['available_cpus']}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = build_file(directory, args.rows)
+        inputs = make_inputs(args.rows, 10000, args.seed)
+        # Снимок, построенный для записи файлов, не должен достаться воркерам через fork
+        gc.collect()
+        for mode in args.modes:
+            results = [run(mode, path, workers, inputs, args.duration) for workers in args.workers]
+            base = results[0]["throughput_rps"] / results[0]["workers"]
+            for result in results:
+                result["speedup"] = round(result["throughput_rps"] / base, 2)
+                result["efficiency"] = round(result["speedup"] / result["workers"], 2)
+                print(f"{mode:6} workers {result['workers']:3}   {result['throughput_rps']:10.0f} req/s   "
+                      f"speedup {result['speedup']:5.2f}   efficiency {result['efficiency']:4.2f}   "
+                      f"anon {result['anon_mb_per_worker']:7.1f} MB   pss {result['pss_mb_per_worker']:7.1f} MB")
+            report["results"][mode] = results
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
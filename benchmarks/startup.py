@@ -0,0 +1,96 @@
+"""
+Замер времени холодного запуска: каждая команда выполняется в новом процессе
+интерпретатора, как при старте контейнера или запуске HEALTHCHECK.
+
+Команды:
+- interpreter  пустой запуск Python (нижняя граница)
+- import_bot   импорт модуля бота со всеми зависимостями
+- bot_ready    импорт бота и загрузка сохраненного снимка (бот готов отвечать)
+- check        python cli.py --check
+- lookup       python cli.py lookup <номер>
+
+Запуск:
+    python benchmarks/startup.py --rows 100000 --repeat 7 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from luhn_algorithm import add_valid_luhn_checksum
+from serial_index import SerialIndex
+from snapshot_store import save_snapshot
+
+
+def build_snapshot(path: str, rows: int) -> str:
+    """
+    Сохраняет снимок таблицы из rows строк и возвращает номер, который в нем есть.
+    """
+    values = [["Серийный номер", "Дата производства", "Модель", "Комментарий"]]
+    for number in range(rows):
+        serial = add_valid_luhn_checksum(f"{number * 7919 % 10 ** 11:011d}")
+        values.append([serial, "2026-01-01", f"Модель {number % 17}", "Проверено"])
+    save_snapshot(SerialIndex.from_values(values, serial_column=1), path)
+    return values[1][0]
+
+
+def measure(command: List[str], env: Dict[str, str], repeat: int) -> Dict[str, float]:
+    """
+    Запускает команду repeat раз и возвращает медиану и минимум времени в миллисекундах.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(times), 1), "min_ms": round(min(times), 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замер времени холодного запуска бота и cli.py")
+    parser.add_argument("--rows", type=int, default=100000, help="Строк в сохраненном снимке")
+    parser.add_argument("--repeat", type=int, default=7, help="Запусков каждой команды")
+    parser.add_argument("--output", help="Файл для отчета в формате JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "snapshot.sqlite3")
+        serial = build_snapshot(snapshot_path, args.rows)
+        # Фиктивные настройки: к Google и Telegram команды не обращаются
+        env = dict(
+            os.environ,
+            BOT_TOKEN="startup-test",
+            SHEET_ID="startup-test",
+            SHEET_SOURCES="",
+            SHEET_PAT="{}",
+            LOOKUP_BACKEND="sheets",
+            SNAPSHOT_PATH=snapshot_path,
+        )
+        python = sys.executable
+        commands = {
+            "interpreter": [python, "-c", "pass"],
+            "import_bot": [python, "-c", "import bot"],
+            "bot_ready": [python, "-c", "import bot, google_sheets; google_sheets.load_saved_snapshot()"],
+            "check": [python, "cli.py", "--check"],
+            "lookup": [python, "cli.py", "lookup", serial],
+        }
+        results = {name: measure(command, env, args.repeat) for name, command in commands.items()}
+
+    report = {"rows": args.rows, "repeat": args.repeat, "python": sys.version.split()[0], "results": results}
+    for name, result in results.items():
+        print(f"{name:12} median {result['median_ms']:8.1f} ms   min {result['min_ms']:8.1f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
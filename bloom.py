@@ -0,0 +1,101 @@
+"""
+Модуль с фильтром Блума для серийных номеров: компактная проверка того,
+что номера точно нет в таблице, без обращения к хранилищу строк.
+"""
+import math
+from typing import Any, Dict, Iterable, Tuple
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hashes(key: str):
+    """
+    Две 64-битные хеш-функции от серийного номера (серийные номера состоят только из цифр).
+    """
+    x = int(key) if key.isdigit() else int.from_bytes(key.encode("utf-8")[:16], "little")
+    h1 = (x * 0x9E3779B97F4A7C15 + len(key)) & _MASK64
+    h2 = (((x ^ (x >> 31)) * 0xBF58476D1CE4E5B9) & _MASK64) | 1
+    return h1, h2
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: отвечает "точно нет" или "возможно есть".
+    Размер подбирается по ожидаемому числу элементов и допустимой доле ложных срабатываний.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def from_keys(cls, keys: Iterable[str], capacity: int, error_rate: float = 0.01) -> "BloomFilter":
+        """
+        Строит фильтр по набору ключей.
+        """
+        bloom = cls(capacity, error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    @classmethod
+    def from_buffer(cls, bits, size: int, hash_count: int, count: int) -> "BloomFilter":
+        """
+        Создает фильтр поверх готового битового массива (например, memoryview файла,
+        отображенного в память): биты не копируются, фильтр только для чтения.
+        """
+        bloom = cls.__new__(cls)
+        bloom.size = size
+        bloom.hash_count = hash_count
+        bloom._bits = bits
+        bloom.count = count
+        return bloom
+
+    def export(self) -> Tuple[Dict[str, Any], bytes]:
+        """
+        Возвращает параметры фильтра и битовый массив для from_buffer().
+        """
+        return {"size": self.size, "hash_count": self.hash_count, "count": self.count}, bytes(self._bits)
+
+    def add(self, key: str) -> None:
+        """
+        Добавляет ключ в фильтр.
+        """
+        h1, h2 = _hashes(key)
+        bits, size = self._bits, self.size
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        h1, h2 = _hashes(key)
+        bits, size = self._bits, self.size
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def memory_bytes(self) -> int:
+        """Размер битового массива в байтах."""
+        return len(self._bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Ожидаемая доля ложных срабатываний при текущем заполнении."""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Возвращает метрики фильтра: число элементов, размер в байтах и долю ложных срабатываний.
+        """
+        return {
+            "items": self.count,
+            "memory_bytes": self.memory_bytes,
+            "false_positive_rate": self.false_positive_rate,
+        }
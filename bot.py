@@ -1,24 +1,104 @@
 """
 Телеграм бот для получения информации по серийному номеру.
 """
-import os
-from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from serial_number import parse_serial_number
-from google_sheets import get_data_by_serial_number, format_data_for_display
+import asyncio
+import functools
+import logging
+import multiprocessing
+from typing import Dict, List, Optional
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultsButton, Message, Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    filters,
+    ContextTypes,
+)
+from settings import get_settings
+from serial_number import INVALID_CHECKSUM_MESSAGE, format_serial_number, parse_serial_number, split_serial_candidates
+from rate_limit import RateLimiter, FairScheduler, rate_limited
+from metrics import (
+    PARSE_SECONDS,
+    INDEX_LOOKUP_SECONDS,
+    FORMAT_SECONDS,
+    TELEGRAM_SEND_SECONDS,
+    SUGGEST_SECONDS,
+    INLINE_SECONDS,
+    LOOKUPS,
+    SUGGESTIONS,
+    INLINE_QUERIES,
+    gauge,
+    add_metrics_route,
+    start_metrics_server,
+)
+from bulk_lookup import bulk_lookup, extract_serials_from_file, BULK_MAX_SERIALS, BULK_MAX_FILE_SIZE
+from lookup_backend import BackendUnavailableError, LookupBackend, create_backend
+from formatting import format_reply
+from suggestions import suggest_serials
+from inline_mode import QueryDebouncer, inline_results, INLINE_CACHE_TIME, INLINE_MIN_DIGITS
+from index_refresh import IndexRefresher, add_refresh_route, REFRESH_HOOK_PATH, REFRESH_HOOK_TOKEN
+
+logger = logging.getLogger(__name__)
 
 # Версия бота
 BOT_VERSION = "0.0.3"
 
-# Загружаем переменные окружения
-load_dotenv()
+# Настройки из переменных окружения и файла .env (см. settings.py)
+_settings = get_settings()
+
+# Токен бота (проверяется при запуске, чтобы модуль можно было импортировать без него)
+BOT_TOKEN = _settings.bot_token
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = _settings.bot_mode
+# Настройки webhook
+WEBHOOK_URL = _settings.webhook_url  # Публичный адрес бота, например https://bot.example.com
+WEBHOOK_PATH = _settings.webhook_path
+WEBHOOK_LISTEN = _settings.webhook_listen
+WEBHOOK_PORT = _settings.webhook_port
+WEBHOOK_SECRET = _settings.webhook_secret
+WEBHOOK_WORKERS = _settings.webhook_workers
+
+# Ограничение частоты запросов: токенов в секунду и размер "ведра" на пользователя
+RATE_LIMIT_RATE = _settings.rate_limit_rate
+RATE_LIMIT_BURST = _settings.rate_limit_burst
+# Максимум одновременно обрабатываемых запросов (остальные ждут в справедливой очереди)
+MAX_CONCURRENT_REQUESTS = _settings.max_concurrent_requests
+
+# Адрес и порт HTTP сервера с метриками /metrics в режиме polling (0 - не запускать).
+# В режиме webhook с одним процессом /metrics доступен на порту webhook сервера,
+# с несколькими - каждый воркер отдает свои метрики на порту METRICS_PORT + номер воркера
+METRICS_HOST = _settings.metrics_host
+METRICS_PORT = _settings.metrics_port
+
+# Пользователи, которым доступна команда /reload (пусто - команда выключена)
+ADMIN_USER_IDS = _settings.admin_ids
+
+# Типы обновлений, которые обрабатывает бот (остальные Telegram не присылает).
+# CALLBACK_QUERY - нажатия на кнопки с подсказками, INLINE_QUERY - запросы @bot в любом чате
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+# Префикс данных кнопки с подсказкой: за ним следует нормализованный номер
+SUGGESTION_CALLBACK_PREFIX = "sn:"
 
-# Токен бота из переменной окружения
-BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Ответы при сбоях: подробности ошибки пишутся в лог, пользователю они не показываются
+UNAVAILABLE_REPLY = "❌ База данных временно недоступна, попробуйте позже."
+ERROR_REPLY = "❌ Произошла ошибка при поиске данных, попробуйте позже."
 
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не установлен в переменных окружения!")
+# Источник данных для поиска (LOOKUP_BACKEND: sheets, shared, sqlite или csv)
+backend: LookupBackend = create_backend()
+
+# Устаревшие inline запросы (пользователь продолжает печатать) не обрабатываются
+inline_debouncer = QueryDebouncer()
+
+# Прогрев, обновление по расписанию и по запросу (/reload, HTTP хук)
+refresher = IndexRefresher(backend, backend.refresh_interval)
+gauge("bot_index_refresh_total", "Обновления данных: удачные, неудачные, запросы по хуку и объединенные с ними",
+      lambda: dict(refresher.stats), label="kind", metric_type="counter")
+gauge("bot_index_refresh_last_seconds", "Длительность последнего удачного обновления данных",
+      lambda: refresher.last_duration)
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -30,64 +110,402 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "Этот бот позволяет получить информацию по серийному номеру изделия.\n\n"
         "*Как пользоваться:*\n"
         "• Отправьте любой серийный номер (строкой) — бот найдёт информацию по нему в базе данных.\n"
-        "• Если номер не соответствует формату или не найден — будет выведено сообщение об ошибке.\n\n"
+        "• Если номер не соответствует формату или не найден — будет выведено сообщение об ошибке. "
+        "Если в базе есть похожие номера, бот предложит их кнопками.\n"
+        "• Чтобы проверить сразу много номеров, отправьте их списком (каждый с новой строки) "
+        "или файлом CSV/TXT — бот пришлет CSV файл с результатами.\n"
+        "• В любом чате наберите имя бота через @ и начало номера — бот предложит подходящие номера.\n\n"
         "/start — инструкция по работе с ботом\n\n"
         f"Версия бота: {BOT_VERSION}\n"
     )
     await update.message.reply_text(help_text, parse_mode="Markdown")
 
 
+async def reload_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик команды /reload (только для ADMIN_USER_IDS).
+    Обновляет данные сразу, не дожидаясь расписания.
+    """
+    await update.message.reply_text("🔄 Обновляю данные...")
+    try:
+        duration = await refresher.refresh(from_source=True)
+        index = await backend.get_index()
+    except Exception as e:
+        logger.warning("Обновление данных по команде /reload не выполнено", exc_info=True)
+        await update.message.reply_text(f"❌ Не удалось обновить данные: {e}")
+        return
+    await update.message.reply_text(f"✅ Данные обновлены за {duration:.1f} с, номеров: {len(index)}")
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Обработчик текстовых сообщений.
-    Обрабатывает серийный номер и ищет информацию в Google Sheets.
+    Обрабатывает серийный номер и ищет информацию в источнике данных.
     """
     user_input = update.message.text.strip()
     
+    # Несколько номеров в одном сообщении обрабатываются пакетно. Текст без цифр
+    # ("Привет, проверьте номер ...") не считается номером, такое сообщение - обычный поиск
+    candidates = split_serial_candidates(user_input)
+    if len(candidates) > 1:
+        await reply_bulk(update, candidates)
+        return
+    
     # Парсим и валидируем серийный номер
-    is_valid, result = parse_serial_number(user_input)
+    with PARSE_SECONDS.time():
+        is_valid, result = parse_serial_number(user_input)
     
     if not is_valid:
         # Если валидация не прошла, отправляем сообщение об ошибке
-        await update.message.reply_text(f"❌ {result}")
+        LOOKUPS.inc("invalid")
+        keyboard = None
+        if result == INVALID_CHECKSUM_MESSAGE:
+            # Возможна опечатка: предлагаем похожие номера, которые есть в базе
+            keyboard = await suggestion_keyboard(''.join(filter(str.isdigit, user_input)))
+        text = f"❌ {result}" + ("\n\nВозможно, вы имели в виду:" if keyboard else "")
+        with TELEGRAM_SEND_SECONDS.time():
+            await update.message.reply_text(text, reply_markup=keyboard)
         return
     
     # Серийный номер валиден и нормализован
-    normalized_serial = result
-    
+    await reply_lookup(update.message, result)
+
+
+def _stale_note() -> str:
+    """
+    Возвращает предупреждение для ответа по устаревшему снимку или пустую строку.
+    """
+    if not backend.is_stale():
+        return ""
+    # Источник недоступен: отвечаем по последнему сохраненному снимку
+    age_minutes = int(backend.snapshot_age() // 60)
+    logger.warning("Ответ по устаревшему снимку таблицы (%d мин)", age_minutes)
+    return f"\n\n⚠️ _Данные могут быть устаревшими: обновлены {age_minutes} мин назад_"
+
+
+async def reply_lookup(message: Message, normalized_serial: str) -> None:
+    """
+    Ищет серийный номер (в формате XXXX-XXXX-XXXX) и отвечает на сообщение.
+    """
     try:
-        # Ищем данные в Google Sheets
-        data = get_data_by_serial_number(normalized_serial)
+        # Ищем данные в снимке источника; готовый ответ кэшируется для снимка
+        index = await backend.get_index()
+        with INDEX_LOOKUP_SECONDS.time():
+            response = index.get_rendered(normalized_serial, _render_reply)
         
-        if data is None:
-            await update.message.reply_text(
-                f"❌ Серийный номер {normalized_serial} не найден в базе данных."
-            )
+        if response is None:
+            LOOKUPS.inc("miss")
+            # Номер мог появиться в таблице после последней сверки снимка
+            response = f"❌ Серийный номер {normalized_serial} не найден в базе данных." + _stale_note()
+            keyboard = await suggestion_keyboard(normalized_serial.replace("-", ""))
+            if keyboard:
+                response += "\n\nВозможно, вы имели в виду:"
+            with TELEGRAM_SEND_SECONDS.time():
+                await message.reply_text(response, reply_markup=keyboard, parse_mode="Markdown")
         else:
-            # Форматируем и отправляем данные
-            formatted_data = format_data_for_display(data)
-            response = f"✅ *Серийный номер:* {normalized_serial}\n\n{formatted_data}"
-            await update.message.reply_text(response, parse_mode="Markdown")
+            LOOKUPS.inc("hit")
+            response += _stale_note()
+            with TELEGRAM_SEND_SECONDS.time():
+                await message.reply_text(response, parse_mode="Markdown")
             
-    except Exception as e:
+    except BackendUnavailableError:
+        LOOKUPS.inc("unavailable")
+        logger.warning("Источник данных недоступен, номер %s не проверен", normalized_serial, exc_info=True)
+        await message.reply_text(UNAVAILABLE_REPLY)
+    except Exception:
+        LOOKUPS.inc("error")
+        logger.exception("Ошибка при поиске серийного номера %s", normalized_serial)
+        await message.reply_text(ERROR_REPLY)
+
+
+async def suggestion_keyboard(serial: str) -> Optional[InlineKeyboardMarkup]:
+    """
+    Возвращает кнопки с похожими номерами из базы или None, если таких нет.
+    Подсказки необязательны, поэтому ошибки источника данных здесь не показываются пользователю.
+    """
+    try:
+        index = await backend.get_index()
+        with SUGGEST_SECONDS.time():
+            serials = suggest_serials(serial, index)
+    except Exception:
+        logger.warning("Не удалось подобрать подсказки для номера %s", serial, exc_info=True)
+        return None
+    if not serials:
+        return None
+    SUGGESTIONS.inc("offered")
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(format_serial_number(serial), callback_data=SUGGESTION_CALLBACK_PREFIX + serial)]
+        for serial in serials
+    ])
+
+
+async def handle_suggestion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик нажатия на кнопку с подсказкой: ищет выбранный номер.
+    """
+    query = update.callback_query
+    await query.answer()
+    serial = query.data[len(SUGGESTION_CALLBACK_PREFIX):]
+    is_valid, result = parse_serial_number(serial)
+    if not is_valid or query.message is None:
+        return
+    SUGGESTIONS.inc("accepted")
+    await reply_lookup(query.message, result)
+
+
+def _render_reply(serial_number: str, data: Dict[str, str]) -> str:
+    """
+    Форматирует ответ с замером времени (вызывается только при промахе кэша ответов).
+    """
+    with FORMAT_SECONDS.time():
+        return format_reply(serial_number, data)
+
+
+async def reply_bulk(update: Update, candidates: List[str]) -> None:
+    """
+    Пакетный поиск: проверяет все номера по одному снимку таблицы и отправляет CSV файл с результатами.
+    """
+    if len(candidates) > BULK_MAX_SERIALS:
         await update.message.reply_text(
-            f"❌ Произошла ошибка при поиске данных: {str(e)}"
+            f"❌ Слишком много номеров: {len(candidates)}. Максимум за один запрос — {BULK_MAX_SERIALS}."
         )
+        return
+    
+    try:
+        index = await backend.get_index()
+        # Разбор и поиск тысяч номеров выполняем вне цикла событий
+        loop = asyncio.get_running_loop()
+        content, counts = await loop.run_in_executor(None, bulk_lookup, index, candidates)
+    except BackendUnavailableError:
+        LOOKUPS.inc("unavailable")
+        logger.warning("Источник данных недоступен, пакетный поиск не выполнен", exc_info=True)
+        await update.message.reply_text(UNAVAILABLE_REPLY)
+        return
+    except Exception:
+        LOOKUPS.inc("error")
+        logger.exception("Ошибка при пакетном поиске")
+        await update.message.reply_text(ERROR_REPLY)
+        return
+    
+    caption = (
+        f"Проверено номеров: {len(candidates)}\n"
+        f"✅ Найдено: {counts['found']}\n"
+        f"❔ Не найдено: {counts['not_found']}\n"
+        f"❌ С ошибкой: {counts['invalid']}"
+    )
+    await update.message.reply_document(document=content, filename="serial_numbers.csv", caption=caption)
 
-def main() -> None:
-    """Запуск бота."""
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик файлов со списком серийных номеров (CSV или TXT).
+    """
+    document = update.message.document
+    if document.file_size and document.file_size > BULK_MAX_FILE_SIZE:
+        await update.message.reply_text(
+            f"❌ Файл слишком большой. Максимальный размер — {BULK_MAX_FILE_SIZE // 1024} КБ."
+        )
+        return
+    
+    file = await document.get_file()
+    content = bytes(await file.download_as_bytearray())
+    candidates = extract_serials_from_file(content, document.file_name or "")
+    if not candidates:
+        await update.message.reply_text("❌ В файле не найдено ни одного серийного номера.")
+        return
+    
+    await reply_bulk(update, candidates)
+
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик inline запросов: по мере ввода номера предлагает номера из базы.
+    """
+    query = update.inline_query
+    digits = ''.join(filter(str.isdigit, query.query))
+    if len(digits) < INLINE_MIN_DIGITS:
+        INLINE_QUERIES.inc("short")
+        await query.answer([], cache_time=INLINE_CACHE_TIME, button=InlineQueryResultsButton(
+            text=f"Введите не меньше {INLINE_MIN_DIGITS} цифр серийного номера", start_parameter="inline",
+        ))
+        return
+    
+    user_id = query.from_user.id
+    if not await inline_debouncer.settle(user_id, query.id):
+        INLINE_QUERIES.inc("superseded")
+        return
+    
+    try:
+        index = await backend.get_index()
+        with INLINE_SECONDS.time():
+            results = inline_results(index, digits, _render_reply)
+    except Exception:
+        INLINE_QUERIES.inc("error")
+        logger.warning("Ошибка при обработке inline запроса %r", query.query, exc_info=True)
+        inline_debouncer.finish(user_id, query.id)
+        return
+    
+    # Пока искали, пользователь мог ввести следующую цифру: отвечать уже не нужно
+    if not inline_debouncer.is_current(user_id, query.id):
+        INLINE_QUERIES.inc("superseded")
+        return
+    inline_debouncer.finish(user_id, query.id)
+    INLINE_QUERIES.inc("answered" if results else "empty")
+    await query.answer(results, cache_time=INLINE_CACHE_TIME)
+
+
+def build_application() -> Application:
+    """
+    Создает приложение бота и регистрирует обработчики.
+    """
+    # Создаем приложение (обновления от разных пользователей обрабатываются параллельно)
+    application = Application.builder().token(BOT_TOKEN).concurrent_updates(True).build()
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler(["start"], start_command))
+    if ADMIN_USER_IDS:
+        # Для остальных пользователей команда /reload не существует
+        application.add_handler(CommandHandler(["reload"], reload_command, filters=filters.User(user_id=ADMIN_USER_IDS)))
+    
+    # Поиск защищен ограничением частоты запросов и справедливой очередью
+    limiter = RateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+    scheduler = FairScheduler(MAX_CONCURRENT_REQUESTS)
+    limit = rate_limited(limiter, scheduler)
+    gauge("bot_rate_limit_total", "Запросы, пропущенные и отклоненные ограничением частоты",
+          lambda: dict(limiter.stats), label="result", metric_type="counter")
+    gauge("bot_requests_in_progress", "Запросы, обрабатываемые сейчас", lambda: scheduler.active)
+    gauge("bot_requests_waiting", "Запросы в справедливой очереди", lambda: scheduler.waiting)
     
     # Регистрируем обработчик текстовых сообщений (все сообщения, кроме команд)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, limit(handle_message)))
+    
+    # Регистрируем обработчик файлов со списком серийных номеров
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("txt"),
+        limit(handle_document),
+    ))
+    
+    # Регистрируем обработчик inline запросов (@bot номер в любом чате).
+    # Вместо ограничения частоты запросы по мере ввода отсекаются паузой в вводе
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    
+    # Регистрируем обработчик нажатий на кнопки с подсказками
+    application.add_handler(CallbackQueryHandler(
+        limit(handle_suggestion), pattern=f"^{SUGGESTION_CALLBACK_PREFIX}",
+    ))
+    
+    return application
+
+
+def start_index(application: Application) -> None:
+    """
+    Подготавливает источник данных: для Google Sheets загружает сохраненный снимок
+    таблицы и планирует в JobQueue бота его прогрев и обновление по расписанию.
+    """
+    backend.start()
+    refresher.start(application.job_queue)
+
+
+def setup_web_app(app, metrics: bool = True) -> None:
+    """
+    Добавляет в HTTP сервер бота /metrics (если metrics) и, если задан REFRESH_HOOK_TOKEN, хук обновления данных.
+    """
+    if metrics:
+        add_metrics_route(app)
+    if REFRESH_HOOK_TOKEN:
+        add_refresh_route(app, refresher, REFRESH_HOOK_TOKEN, REFRESH_HOOK_PATH)
+
+
+def run_webhook_worker(number: int) -> None:
+    """
+    Запускает один процесс бота в режиме webhook.
+    Webhook в Telegram регистрирует только первый процесс.
+    """
+    application = build_application()
+    start_index(application)
+    asyncio.run(_serve_webhook_worker(application, number))
+
+
+async def _serve_webhook_worker(application: Application, number: int) -> None:
+    """
+    Обслуживает webhook в процессе number. С несколькими процессами у каждого свои счетчики,
+    а соединения на общий порт ядро раздает случайному процессу, поэтому /metrics на общем
+    порту отдавал бы метрики случайного воркера. Вместо этого каждый воркер отдает свои метрики
+    на порту METRICS_PORT + number (0 - не запускать), а сложить их можно в Prometheus.
+    """
+    from webhook import serve_webhook
+    shared_port = WEBHOOK_WORKERS > 1
+    metrics_runner = None
+    if shared_port and METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + number)
+        logger.info("Метрики воркера %d доступны на http://%s:%d/metrics", number, METRICS_HOST, METRICS_PORT + number)
+    try:
+        await serve_webhook(
+            application,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH if number == 0 else None,
+            allowed_updates=ALLOWED_UPDATES,
+            secret_token=WEBHOOK_SECRET,
+            reuse_port=shared_port,
+            setup_web_app=functools.partial(setup_web_app, metrics=not shared_port),
+        )
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+def index_loader():
+    """
+    Возвращает функцию процесса-загрузчика общего снимка (LOOKUP_BACKEND=shared) или None.
+    """
+    if backend.name != "shared":
+        return None
+    from shared_index import run_loader
+    return functools.partial(run_loader, backend.path)
+
+
+async def _start_metrics(application: Application) -> None:
+    """
+    Запускает HTTP сервер с метриками в цикле событий бота (режим polling).
+    """
+    await start_metrics_server(METRICS_HOST, METRICS_PORT, setup_web_app)
+    logger.info("Метрики доступны на http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+
+
+def main() -> None:
+    """Запуск бота."""
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s", level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    if not BOT_TOKEN:
+        raise ValueError("BOT_TOKEN не установлен в переменных окружения!")
+    
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL не установлен в переменных окружения!")
+        # Сервер webhook (aiohttp) нужен только в этом режиме
+        from webhook import run_workers
+        print(f"Бот запущен в режиме webhook ({WEBHOOK_WORKERS} процесс(ов))...")
+        run_workers(run_webhook_worker, WEBHOOK_WORKERS, loader=index_loader())
+        return
+    
+    loader = index_loader()
+    if loader is not None:
+        # Загрузчик завершается вместе с ботом
+        multiprocessing.Process(target=loader, name="index-loader", daemon=True).start()
+    
+    application = build_application()
+    if METRICS_PORT:
+        application.post_init = _start_metrics
+    elif REFRESH_HOOK_TOKEN:
+        logger.warning("HTTP хук обновления данных не запущен: в режиме polling он работает на порту METRICS_PORT")
+    start_index(application)
     
     # Запускаем бота
     print("Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
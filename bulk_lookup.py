@@ -0,0 +1,100 @@
+"""
+Модуль для пакетного поиска серийных номеров:
+- извлечение номеров из сообщения или загруженного CSV/TXT файла
+- поиск всех номеров по одному снимку таблицы за один проход
+- формирование CSV файла с результатами
+"""
+import csv
+import io
+from typing import Dict, List, Tuple
+from serial_index import SerialIndex
+from serial_number import parse_serial_numbers, split_serial_candidates
+from settings import get_settings
+
+_settings = get_settings()
+
+# Максимальное число номеров в одном пакетном запросе
+BULK_MAX_SERIALS = _settings.bulk_max_serials
+# Максимальный размер загружаемого файла со списком номеров (в байтах)
+BULK_MAX_FILE_SIZE = _settings.bulk_max_file_size
+
+STATUS_FOUND = "найден"
+STATUS_NOT_FOUND = "не найден"
+
+
+def _decode(content: bytes) -> str:
+    """
+    Декодирует содержимое файла: UTF-8 (в том числе с BOM), иначе Windows-1251 (Excel).
+    """
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return content.decode("cp1251", errors="replace")
+
+
+def extract_serials_from_file(content: bytes, filename: str = "") -> List[str]:
+    """
+    Извлекает серийные номера из файла.
+    Для CSV берется первая ячейка строки, содержащая цифры (заголовки и пустые строки пропускаются).
+    Для остальных файлов номера разбираются как в текстовом сообщении.
+    """
+    text = _decode(content)
+    if not filename.lower().endswith(".csv"):
+        return split_serial_candidates(text)
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    candidates = []
+    for row in csv.reader(io.StringIO(text), dialect):
+        for cell in row:
+            if any(char.isdigit() for char in cell):
+                candidates.append(cell.strip())
+                break
+    return candidates
+
+
+def bulk_lookup(index: SerialIndex, candidates: List[str]) -> Tuple[bytes, Dict[str, int]]:
+    """
+    Ищет все номера по одному снимку таблицы и формирует CSV файл с результатами.
+
+    Args:
+        index: Снимок таблицы
+        candidates: Номера в том виде, как их ввел пользователь
+
+    Returns:
+        Кортеж (содержимое CSV файла, счетчики found/not_found/invalid)
+    """
+    parsed = parse_serial_numbers(candidates)
+
+    found: List[Dict[str, str]] = [None] * len(candidates)
+    headers: Dict[str, None] = {}  # Заголовки всех найденных строк в порядке появления
+    counts = {"found": 0, "not_found": 0, "invalid": 0}
+    for position, (is_valid, result) in enumerate(parsed):
+        if not is_valid:
+            counts["invalid"] += 1
+            continue
+        data = index.get(result)
+        if data is None:
+            counts["not_found"] += 1
+            continue
+        counts["found"] += 1
+        found[position] = data
+        for header in data:
+            headers.setdefault(header)
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Ввод", "Серийный номер", "Статус", *headers])
+    for user_input, (is_valid, result), data in zip(candidates, parsed, found):
+        if not is_valid:
+            writer.writerow([user_input, "", result])
+        elif data is None:
+            writer.writerow([user_input, result, STATUS_NOT_FOUND])
+        else:
+            writer.writerow([user_input, result, STATUS_FOUND, *(data.get(header, "") for header in headers)])
+
+    # BOM нужен, чтобы Excel открыл файл в UTF-8
+    return output.getvalue().encode("utf-8-sig"), counts
@@ -0,0 +1,159 @@
+"""
+Модуль с командной строкой бота:
+- python cli.py            запуск бота (то же, что python bot.py)
+- python cli.py --check    проверка работоспособности (HEALTHCHECK контейнера)
+- python cli.py lookup SN  поиск серийного номера в локальных данных
+Каждая команда импортирует только нужные ей модули: проверка и поиск
+не загружают telegram, gspread и google.auth и не обращаются к сети.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Optional, Tuple
+from settings import Settings, get_settings
+
+
+def open_local_backend(settings: Settings):
+    """
+    Создает источник данных, который читается с диска без обращения к сети.
+    Для Google Sheets это сохраненный снимок таблицы: он в формате базы SQLite.
+    """
+    from lookup_backend import create_backend
+    if settings.lookup_backend == "sheets":
+        if not settings.snapshot_path:
+            raise ValueError("SNAPSHOT_PATH не задан: снимок таблицы не сохраняется на диск")
+        if not os.path.exists(settings.snapshot_path):
+            raise ValueError(f"Снимок таблицы {settings.snapshot_path} не найден (таблица еще не загружалась?)")
+        return create_backend("sqlite", settings.snapshot_path)
+    if settings.lookup_backend == "shared":
+        # Файл общего снимка публикует загрузчик, запущенный вместе с ботом
+        path = settings.lookup_data_path or settings.shared_index_path
+        if not os.path.exists(path):
+            raise ValueError(f"Общий снимок {path} не найден (загрузчик еще не опубликовал снимок?)")
+        return create_backend("shared", path)
+    return create_backend(settings.lookup_backend, settings.lookup_data_path)
+
+
+def check_health(settings: Settings) -> Tuple[List[str], str]:
+    """
+    Проверяет настройки и локальные данные бота.
+    Возвращает список проблем (пустой, если все в порядке) и краткое описание данных.
+    Google и Telegram не опрашиваются: проверка быстрая и не расходует квоту API.
+    """
+    problems = []
+    if not settings.bot_token:
+        problems.append("BOT_TOKEN не установлен")
+    if settings.bot_mode not in ("polling", "webhook"):
+        problems.append(f"Неизвестный режим BOT_MODE: {settings.bot_mode}")
+    elif settings.bot_mode == "webhook" and not settings.webhook_url:
+        problems.append("WEBHOOK_URL не установлен")
+
+    if settings.lookup_backend in ("sheets", "shared"):
+        if not settings.sheet_id and not settings.sheet_sources.strip():
+            problems.append("Не указан SHEET_ID или SHEET_SOURCES")
+        if not settings.sheet_pat and not settings.google_application_credentials:
+            problems.append("Не указан SHEET_PAT или GOOGLE_APPLICATION_CREDENTIALS")
+        if settings.lookup_backend == "sheets" and not settings.snapshot_path:
+            # Снимок есть только в памяти процесса бота, снаружи его не проверить
+            return problems, "источник sheets, снимок не сохраняется"
+
+    try:
+        backend = open_local_backend(settings)
+        backend.start()
+    except Exception as e:
+        problems.append(f"Данные недоступны: {e}")
+        return problems, f"источник {settings.lookup_backend}"
+
+    try:
+        summary = f"источник {settings.lookup_backend}, {len(backend)} номеров"
+        if settings.lookup_backend in ("sheets", "shared"):
+            # Время сверки с таблицей обновляется при каждой удачной проверке ревизии
+            age = backend.snapshot_age()
+            if age is None:
+                problems.append("В снимке таблицы нет времени обновления")
+            else:
+                summary += f", снимок сверен с таблицей {age:.0f} с назад"
+                if age > settings.snapshot_max_staleness:
+                    problems.append(f"Снимок таблицы устарел: {age:.0f} с (SNAPSHOT_MAX_STALENESS={settings.snapshot_max_staleness:.0f})")
+    finally:
+        backend.close()
+    return problems, summary
+
+
+def lookup(settings: Settings, user_input: str) -> Tuple[bool, str]:
+    """
+    Ищет серийный номер в локальных данных.
+    Возвращает признак, что номер найден, и текст ответа, как его отправил бы бот.
+    """
+    from formatting import format_reply
+    from serial_number import INVALID_CHECKSUM_MESSAGE, format_serial_number, parse_serial_number
+    from suggestions import suggest_serials
+
+    is_valid, result = parse_serial_number(user_input)
+    if not is_valid and result != INVALID_CHECKSUM_MESSAGE:
+        return False, f"❌ {result}"
+
+    backend = open_local_backend(settings)
+    backend.start()
+    try:
+        index = asyncio.run(backend.get_index())
+        if is_valid:
+            response = index.get_rendered(result, format_reply)
+            if response is not None:
+                return True, response
+            response = f"❌ Серийный номер {result} не найден в базе данных."
+        else:
+            response = f"❌ {result}"
+        serials = suggest_serials(''.join(filter(str.isdigit, user_input)), index)
+    finally:
+        backend.close()
+    if serials:
+        response += "\n\nВозможно, вы имели в виду:\n" + "\n".join(format_serial_number(serial) for serial in serials)
+    return False, response
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Разбирает аргументы командной строки и выполняет команду. Возвращает код завершения.
+    """
+    parser = argparse.ArgumentParser(description="Телеграм бот для получения информации по серийному номеру")
+    parser.add_argument("--check", action="store_true",
+                        help="проверить настройки и локальные данные (код возврата 0 - все в порядке)")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="запустить бота (по умолчанию)")
+    lookup_parser = commands.add_parser("lookup", help="найти серийный номер в локальных данных")
+    lookup_parser.add_argument("serial", help="серийный номер, например 1234-5678-9012")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = get_settings()
+    except ValueError as e:
+        print(f"FAIL: {e}", file=sys.stderr)
+        return 1
+
+    if args.check:
+        problems, summary = check_health(settings)
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        if problems:
+            return 1
+        print(f"OK: {summary}")
+        return 0
+
+    if args.command == "lookup":
+        try:
+            found, response = lookup(settings, args.serial)
+        except Exception as e:
+            print(f"❌ Данные недоступны: {e}", file=sys.stderr)
+            return 1
+        print(response)
+        return 0 if found else 1
+
+    import bot
+    bot.main()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Модуль с источником данных CSV:
+- файл отображается в память (mmap) и не читается в память процесса целиком
+- при запуске строится индекс серийный номер -> смещение записи в файле
+- при поиске разбирается только одна запись
+"""
+import csv
+import logging
+import mmap
+import os
+from bisect import bisect_left
+from itertools import islice, takewhile
+from typing import Dict, Iterable, List, Optional, Tuple
+from lookup_backend import LocalLookupBackend
+from serial_index import ColumnProjection, normalize_serial
+
+logger = logging.getLogger(__name__)
+
+_BOM = b"\xef\xbb\xbf"
+# Допустимые разделители столбцов
+_DELIMITERS = ",;\t"
+
+
+class _CsvSnapshot:
+    """
+    Отображенный в память файл и индекс смещений его записей.
+    """
+
+    def __init__(self, mm: mmap.mmap, delimiter: str, projection: ColumnProjection, offsets: Dict[str, int]):
+        self.mm = mm
+        self.delimiter = delimiter
+        self.projection = projection
+        self.offsets = offsets
+        # Отсортированные номера для поиска по префиксу
+        self.keys = sorted(offsets)
+
+
+def _record_at(mm: mmap.mmap, start: int) -> Tuple[bytes, int]:
+    """
+    Возвращает запись, начинающуюся со смещения start, и смещение следующей записи.
+    Запись продолжается на следующей строке, пока кавычки в ней не сбалансированы.
+    """
+    size = len(mm)
+    end = start
+    quotes = 0
+    while True:
+        newline = mm.find(b"\n", end)
+        stop = size if newline < 0 else newline + 1
+        quotes += mm[end:stop].count(b'"')
+        end = stop
+        if quotes % 2 == 0 or stop >= size:
+            return mm[start:end], end
+
+
+def _parse(record: bytes, delimiter: str) -> List[str]:
+    text = record.decode("utf-8", errors="replace").rstrip("\r\n")
+    return next(csv.reader([text], delimiter=delimiter), [])
+
+
+class CsvBackend(LocalLookupBackend):
+    """
+    Поиск серийных номеров в CSV файле в кодировке UTF-8 (первая строка - заголовки).
+    Разделитель (запятая, точка с запятой или табуляция) определяется по заголовкам.
+    Записи могут содержать переводы строк внутри кавычек.
+    """
+
+    name = "csv"
+
+    def __init__(self, path: str, serial_column: int = 1, ignore_columns: Iterable[int] = ()):
+        self.path = path
+        self.serial_column = serial_column
+        self.ignore_columns = set(ignore_columns)
+        self._snapshot: Optional[_CsvSnapshot] = None
+
+    def _open(self) -> _CsvSnapshot:
+        """
+        Отображает файл в память и строит индекс смещений записей.
+        """
+        if not os.path.exists(self.path):
+            raise ValueError(f"CSV файл не найден: {self.path}")
+        if os.path.getsize(self.path) == 0:
+            raise ValueError(f"CSV файл пустой: {self.path}")
+        with open(self.path, "rb") as file:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        position = len(_BOM) if mm[:len(_BOM)] == _BOM else 0
+        header, position = _record_at(mm, position)
+        # Разделитель - тот из допустимых, который чаще встречается в заголовках
+        delimiter = max(_DELIMITERS, key=lambda char: header.count(char.encode()))
+        projection = ColumnProjection(_parse(header, delimiter), self.serial_column, self.ignore_columns)
+
+        # При дубликатах используется первая запись
+        offsets: Dict[str, int] = {}
+        size = len(mm)
+        while position < size:
+            record, next_position = _record_at(mm, position)
+            key = projection.serial_key(_parse(record, delimiter))
+            if key and key not in offsets:
+                offsets[key] = position
+            position = next_position
+        return _CsvSnapshot(mm, delimiter, projection, offsets)
+
+    def start(self) -> None:
+        # Новый снимок подменяет старый одним присваиванием; старое отображение
+        # освобождается, когда его перестанут использовать читатели
+        self._snapshot = self._open()
+        logger.info("Источник данных CSV %s: %d строк", self.path, len(self))
+
+    def reload(self) -> None:
+        """
+        Перечитывает файл и перестраивает индекс смещений.
+        """
+        self.start()
+
+    def _fetch(self, key: str) -> Optional[Dict[str, str]]:
+        snapshot = self._snapshot
+        position = snapshot.offsets.get(key)
+        if position is None:
+            return None
+        record, _ = _record_at(snapshot.mm, position)
+        return snapshot.projection.project_row(_parse(record, snapshot.delimiter))
+
+    def find_existing(self, keys: Iterable[str]) -> List[str]:
+        offsets = self._snapshot.offsets
+        return [key for key in keys if key in offsets]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        prefix = normalize_serial(prefix)
+        keys = self._snapshot.keys
+        start = bisect_left(keys, prefix)
+        return list(islice(takewhile(lambda key: key.startswith(prefix), islice(keys, start, None)), limit))
+
+    def close(self) -> None:
+        self._snapshot = None
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return len(snapshot.offsets) if snapshot is not None else 0
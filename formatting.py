@@ -0,0 +1,40 @@
+"""
+Модуль для форматирования ответа пользователю по найденному серийному номеру.
+Не зависит от источника данных, поэтому используется и ботом, и cli.py.
+"""
+from typing import Dict
+
+
+def format_data_for_display(data: Dict[str, str]) -> str:
+    """
+    Форматирует данные для отображения пользователю.
+    
+    Args:
+        data: Словарь с данными (заголовок -> значение)
+    
+    Returns:
+        Отформатированная строка для вывода
+    """
+    if not data:
+        return "Данные не найдены"
+    
+    lines = []
+    for header, value in data.items():
+        if value:  # Показываем только непустые значения
+            lines.append(f"*{header}*\n{value}")
+    
+    return "\n\n".join(lines) if lines else "Данные не найдены"
+
+
+def format_reply(serial_number: str, data: Dict[str, str]) -> str:
+    """
+    Формирует полный ответ пользователю по найденному серийному номеру.
+    
+    Args:
+        serial_number: Серийный номер в формате XXXX-XXXX-XXXX
+        data: Словарь с данными (заголовок -> значение)
+    
+    Returns:
+        Текст ответа в формате Markdown
+    """
+    return f"✅ *Серийный номер:* {serial_number}\n\n{format_data_for_display(data)}"
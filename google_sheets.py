@@ -3,26 +3,59 @@
 """
 import os
 import json
-from typing import Optional, Dict, List
-from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
+import logging
+from typing import Optional, Dict
+from settings import get_settings
+from serial_index import SerialIndex
+from sheets_client import SheetClient
+from resilience import CircuitBreaker, CircuitOpenError
+from single_flight import SingleFlight
+from sheet_sync import GspreadSheetSource, SheetSync
+from sheet_federation import FederatedSync, SheetSourceConfig, parse_sheet_sources
+from snapshot_store import load_snapshot, save_snapshot, touch_snapshot
+from lookup_backend import BackendUnavailableError, LookupBackend
+from metrics import SHEET_FETCH_SECONDS, gauge
+# Форматирование ответа вынесено в formatting.py; имена остаются доступны и отсюда
+from formatting import format_data_for_display, format_reply  # noqa: F401
 
-# Загружаем переменные окружения
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Настройки из переменных окружения
-SHEET_ID = os.getenv("SHEET_ID")
-SHEET_NAME = os.getenv("SHEET_NAME", "Sheet1")
-SHEET_PAT = os.getenv("SHEET_PAT")  # Путь к JSON файлу service account или сам JSON
-GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")  # Альтернативный способ
-SERIAL_NUMBER_COLUMN = int(os.getenv("SERIAL_NUMBER_COLUMN", "1"))  # Номер столбца с серийными номерами (1-based)
-IGNORE_COLUMNS = os.getenv("IGNORE_COLUMNS", "")  # Номера столбцов через запятую, которые нужно игнорировать
+# Настройки из переменных окружения и файла .env (см. settings.py)
+_settings = get_settings()
+SHEET_ID = _settings.sheet_id
+SHEET_NAME = _settings.sheet_name
+SHEET_PAT = _settings.sheet_pat  # Путь к JSON файлу service account или сам JSON
+GOOGLE_APPLICATION_CREDENTIALS = _settings.google_application_credentials  # Альтернативный способ
+SERIAL_NUMBER_COLUMN = _settings.serial_number_column  # Номер столбца с серийными номерами (1-based)
+IGNORE_COLUMNS = _settings.ignore_columns  # Номера столбцов через запятую, которые нужно игнорировать
+INDEX_REFRESH_INTERVAL = _settings.index_refresh_interval  # Период обновления индекса в секундах
+SNAPSHOT_PATH = _settings.snapshot_path  # Файл со снимком таблицы (пусто - не сохранять)
+SNAPSHOT_MAX_STALENESS = _settings.snapshot_max_staleness  # Возраст снимка в секундах, после которого он считается устаревшим
+SHEET_SOURCES = _settings.sheet_sources  # JSON список нескольких таблиц/листов (вместо SHEET_ID и SHEET_NAME)
+SHEET_CHUNK_ROWS = _settings.sheet_chunk_rows  # Сколько строк листа скачивается одним запросом
+SHEET_FETCH_PARALLELISM = _settings.sheet_fetch_parallelism  # Сколько диапазонов строк скачивается одновременно
+SHEETS_TIMEOUT = _settings.sheets_timeout  # Таймаут одного запроса к Google API в секундах
+SHEETS_RETRIES = _settings.sheets_retries  # Повторы запроса при 429, 5xx и таймаутах
+SHEETS_BREAKER_THRESHOLD = _settings.sheets_breaker_threshold  # Сбоев подряд, после которых запросы к Google приостанавливаются
+SHEETS_BREAKER_RESET = _settings.sheets_breaker_reset  # Через сколько секунд после приостановки пробовать снова
 
-# Парсим игнорируемые столбцы
-_ignore_columns_set = set()
-if IGNORE_COLUMNS:
-    _ignore_columns_set = {int(col.strip()) for col in IGNORE_COLUMNS.split(",") if col.strip()}
+# Права доступа: чтение таблиц и метаданных файлов (modifiedTime для проверки изменений)
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets.readonly',
+    'https://www.googleapis.com/auth/drive.metadata.readonly',
+]
+
+# Источники данных. Без SHEET_SOURCES используется один лист из SHEET_ID и SHEET_NAME
+_sources = parse_sheet_sources(
+    SHEET_SOURCES,
+    SheetSourceConfig(SHEET_ID, SHEET_NAME, SERIAL_NUMBER_COLUMN, _settings.ignored_columns),
+)
+
+# Текущий снимок индекса серийных номеров. Обновление по расписанию выполняет бот (index_refresh.py)
+_index: Optional[SerialIndex] = None
+
+# Объединение одновременных загрузок листа в одну
+_fetch_flight = SingleFlight()
 
 
 def _get_credentials():
@@ -33,6 +66,7 @@ def _get_credentials():
     2. SHEET_PAT как сам JSON содержимое
     3. GOOGLE_APPLICATION_CREDENTIALS как путь к JSON файлу
     """
+    from google.oauth2.service_account import Credentials
     credentials = None
     
     # Способ 1: SHEET_PAT как путь к файлу или сам JSON
@@ -41,7 +75,7 @@ def _get_credentials():
             # Это путь к файлу
             credentials = Credentials.from_service_account_file(
                 SHEET_PAT,
-                scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
+                scopes=SCOPES
             )
         else:
             # Попробуем как JSON строку
@@ -49,7 +83,7 @@ def _get_credentials():
                 creds_dict = json.loads(SHEET_PAT)
                 credentials = Credentials.from_service_account_info(
                     creds_dict,
-                    scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
+                    scopes=SCOPES
                 )
             except json.JSONDecodeError:
                 raise ValueError("SHEET_PAT должен быть либо путем к JSON файлу, либо валидным JSON")
@@ -59,7 +93,7 @@ def _get_credentials():
         if os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
             credentials = Credentials.from_service_account_file(
                 GOOGLE_APPLICATION_CREDENTIALS,
-                scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
+                scopes=SCOPES
             )
         else:
             raise ValueError(f"GOOGLE_APPLICATION_CREDENTIALS указывает на несуществующий файл: {GOOGLE_APPLICATION_CREDENTIALS}")
@@ -73,23 +107,162 @@ def _get_credentials():
     return credentials
 
 
-def _get_sheet():
+# Автоматический выключатель, общий для всех источников: квота и доступность Google API общие.
+# Пока он разомкнут, бот отвечает по последнему снимку и не обращается к Google
+_breaker = CircuitBreaker(SHEETS_BREAKER_THRESHOLD, SHEETS_BREAKER_RESET)
+
+# Долгоживущие клиенты (по одному на источник): авторизация и открытие листа выполняются один раз
+_clients = [
+    SheetClient(_get_credentials, source.sheet_id, source.sheet_name,
+                timeout=SHEETS_TIMEOUT, retries=SHEETS_RETRIES, breaker=_breaker)
+    for source in _sources
+]
+
+# Синхронизация снимка: проверка ревизии и постраничное скачивание листа.
+# Источники синхронизируются параллельно и объединяются в один снимок
+_sync = FederatedSync([
+    SheetSync(GspreadSheetSource(client, SHEET_CHUNK_ROWS, SHEET_FETCH_PARALLELISM),
+              source.serial_column, source.ignore_columns)
+    for client, source in zip(_clients, _sources)
+])
+
+
+def get_sync_stats() -> Dict[str, int]:
+    """
+    Возвращает счетчики синхронизации: проверки ревизии, скачивания, изменившиеся и неизменившиеся блоки.
+    """
+    return dict(_sync.stats)
+
+
+def get_breaker_stats() -> Dict[str, int]:
+    """
+    Возвращает счетчики автоматического выключателя: размыкания, отклоненные запросы, сбои.
+    """
+    return dict(_breaker.stats)
+
+
+def get_client_stats() -> Dict[str, int]:
     """
-    Получает объект листа Google Sheets.
+    Возвращает счетчики авторизаций и повторов запросов клиентов Google Sheets (сумма по источникам).
     """
-    if not SHEET_ID:
+    total: Dict[str, int] = {}
+    for client in _clients:
+        for name, value in client.stats.items():
+            total[name] = total.get(name, 0) + value
+    return total
+
+
+def _fetch_index() -> SerialIndex:
+    """
+    Синхронизирует индекс серийных номеров с таблицей.
+    Если таблица не менялась, возвращает текущий снимок без скачивания данных.
+    """
+    if not _sources:
         raise ValueError("SHEET_ID не установлен в переменных окружения!")
     
-    credentials = _get_credentials()
-    gc = gspread.authorize(credentials)
-    spreadsheet = gc.open_by_key(SHEET_ID)
-    worksheet = spreadsheet.worksheet(SHEET_NAME)
-    return worksheet
+    return _sync.sync(_index)
+
+
+def _load_index() -> SerialIndex:
+    """
+    Скачивает новый снимок и атомарно подменяет текущий.
+    Читатели продолжают работать со старым снимком, пока строится новый.
+    """
+    global _index
+    old_index = _index
+    with SHEET_FETCH_SECONDS.time():
+        new_index = _fetch_index()
+    _index = new_index
+    _persist_index(new_index, changed=new_index is not old_index)
+    return new_index
+
+
+def _persist_index(index: SerialIndex, changed: bool) -> None:
+    """
+    Сохраняет снимок на диск. Ошибки записи не мешают работе бота.
+    """
+    if not SNAPSHOT_PATH:
+        return
+    try:
+        if changed:
+            save_snapshot(index, SNAPSHOT_PATH)
+        else:
+            touch_snapshot(index, SNAPSHOT_PATH)
+    except Exception:
+        logger.exception("Не удалось сохранить снимок таблицы в %s", SNAPSHOT_PATH)
+
+
+def load_saved_snapshot() -> bool:
+    """
+    Загружает сохраненный на диске снимок, если в памяти снимка еще нет.
+    Возвращает True, если снимок загружен.
+    """
+    global _index
+    if _index is not None or not SNAPSHOT_PATH:
+        return False
+    index = load_snapshot(SNAPSHOT_PATH)
+    if index is None:
+        return False
+    _index = index
+    logger.info("Загружен сохраненный снимок таблицы: %d строк, возраст %.0f с", len(index), index.age)
+    return True
+
+
+def get_snapshot_age() -> Optional[float]:
+    """
+    Возвращает возраст текущего снимка в секундах или None, если снимка нет.
+    """
+    index = _index
+    return index.age if index is not None else None
+
+
+def is_snapshot_stale() -> bool:
+    """
+    Проверяет, что текущий снимок старше SNAPSHOT_MAX_STALENESS
+    (например, Google долго недоступен и бот отвечает по сохраненным данным).
+    """
+    age = get_snapshot_age()
+    return age is not None and age > SNAPSHOT_MAX_STALENESS
+
+
+def refresh_index() -> SerialIndex:
+    """
+    Перестраивает индекс серийных номеров.
+    Если загрузка уже выполняется, ждет ее результата вместо повторного скачивания листа.
+    """
+    return _fetch_flight.do("index", _load_index)
+
+
+def get_index() -> SerialIndex:
+    """
+    Возвращает текущий снимок индекса. При первом обращении загружает его синхронно.
+    """
+    index = _index
+    if index is None:
+        index = refresh_index()
+    return index
+
+
+def get_fetch_stats() -> Dict[str, int]:
+    """
+    Возвращает счетчики загрузок листа: выполненные (originated) и объединенные (coalesced).
+    """
+    return dict(_fetch_flight.stats)
+
+
+def get_memory_stats() -> Optional[Dict[str, int]]:
+    """
+    Возвращает память под строки текущего снимка (compact) и оценку для словаря словарей (dict_estimate).
+    """
+    if _index is None:
+        return None
+    return {name[:-len("_bytes")]: value for name, value in _index.memory_stats().items() if name.endswith("_bytes")}
 
 
 def get_data_by_serial_number(serial_number: str) -> Optional[Dict[str, str]]:
     """
     Получает данные из Google Sheets по серийному номеру.
+    Поиск выполняется по снимку таблицы в памяти, без обращения к сети.
     
     Args:
         serial_number: Серийный номер для поиска (уже валидированный и нормализованный)
@@ -99,75 +272,80 @@ def get_data_by_serial_number(serial_number: str) -> Optional[Dict[str, str]]:
         Если серийный номер не найден, возвращает None.
     """
     try:
-        worksheet = _get_sheet()
-        
-        # Получаем все данные из листа
-        all_values = worksheet.get_all_values()
-        
-        if not all_values:
-            return None
-        
-        # Первая строка - заголовки
-        headers = all_values[0]
-        
-        # Определяем индекс столбца с серийными номерами (переводим из 1-based в 0-based)
-        serial_col_index = SERIAL_NUMBER_COLUMN - 1
-        
-        if serial_col_index < 0 or serial_col_index >= len(headers):
-            raise ValueError(f"Столбец {SERIAL_NUMBER_COLUMN} выходит за пределы таблицы")
-        
-        # Ищем строку с нужным серийным номером
-        # Нормализуем серийный номер для поиска (убираем дефисы, пробелы)
-        normalized_serial = ''.join(filter(str.isdigit, serial_number))
-        
-        found_row = None
-        for row_index, row in enumerate(all_values[1:], start=1):  # Пропускаем заголовок
-            if len(row) > serial_col_index:
-                # Нормализуем серийный номер из таблицы для сравнения
-                cell_value = str(row[serial_col_index]).strip()
-                normalized_cell = ''.join(filter(str.isdigit, cell_value))
-                
-                if normalized_cell == normalized_serial:
-                    found_row = row
-                    break
-        
-        if not found_row:
-            return None
-        
-        # Формируем словарь с данными
-        result = {}
-        for col_index, header in enumerate(headers):
-            # Пропускаем игнорируемые столбцы, столбцы с названиями начинающимися с _, и столбец с серийным номером
-            col_number = col_index + 1  # 1-based номер столбца
-            if col_number in _ignore_columns_set or col_index == serial_col_index or (header and header.startswith('_')):
-                continue
-            
-            # Получаем значение из найденной строки
-            value = found_row[col_index] if col_index < len(found_row) else ""
-            result[header] = value.strip() if value else ""
-        
-        return result
-        
+        index = get_index()
     except Exception as e:
-        raise Exception(f"Ошибка при получении данных из Google Sheets: {str(e)}")
+        raise BackendUnavailableError(f"Ошибка при получении данных из Google Sheets: {str(e)}") from e
+    return index.get(serial_number)
 
 
-def format_data_for_display(data: Dict[str, str]) -> str:
+async def get_index_async() -> SerialIndex:
     """
-    Форматирует данные для отображения пользователю.
-    
-    Args:
-        data: Словарь с данными (заголовок -> значение)
-    
-    Returns:
-        Отформатированная строка для вывода
+    Асинхронная версия get_index, не блокирующая цикл событий.
+    Если снимок уже загружен, он возвращается сразу. Иначе загрузка выполняется
+    в пуле потоков; одновременные вызовы ждут одну и ту же загрузку.
     """
-    if not data:
-        return "Данные не найдены"
-    
-    lines = []
-    for header, value in data.items():
-        if value:  # Показываем только непустые значения
-            lines.append(f"*{header}*\n{value}")
-    
-    return "\n\n".join(lines) if lines else "Данные не найдены"
+    index = _index
+    if index is None:
+        try:
+            index = await _fetch_flight.do_async("index", _load_index)
+        except Exception as e:
+            raise BackendUnavailableError(f"Ошибка при получении данных из Google Sheets: {str(e)}") from e
+    return index
+
+
+async def get_data_by_serial_number_async(serial_number: str) -> Optional[Dict[str, str]]:
+    """
+    Асинхронная версия get_data_by_serial_number, не блокирующая цикл событий.
+    """
+    index = await get_index_async()
+    return index.get(serial_number)
+
+
+class SheetsBackend(LookupBackend):
+    """
+    Источник данных Google Sheets: поиск по снимку таблицы в памяти,
+    который сохраняется на диск и обновляется по расписанию.
+    """
+
+    name = "sheets"
+
+    @property
+    def refresh_interval(self) -> Optional[float]:
+        return INDEX_REFRESH_INTERVAL
+
+    def start(self) -> None:
+        load_saved_snapshot()
+
+    async def get_index(self) -> SerialIndex:
+        return await get_index_async()
+
+    def reload(self) -> None:
+        try:
+            refresh_index()
+        except CircuitOpenError as e:
+            raise BackendUnavailableError(str(e)) from e
+
+    def snapshot_age(self) -> Optional[float]:
+        return get_snapshot_age()
+
+    def is_stale(self) -> bool:
+        return is_snapshot_stale()
+
+
+# Показатели снимка и обращений к Google для /metrics
+gauge("bot_snapshot_age_seconds", "Сколько секунд назад снимок сверялся с таблицей", get_snapshot_age)
+gauge("bot_snapshot_rows", "Число серийных номеров в снимке", lambda: len(_index) if _index is not None else None)
+gauge("bot_snapshot_membership", "Фильтр Блума и кэш промахов текущего снимка",
+      lambda: _index.membership_stats() if _index is not None else None, label="stat")
+gauge("bot_snapshot_memory_bytes", "Память под строки снимка и оценка для словаря словарей",
+      get_memory_stats, label="kind")
+gauge("bot_sheet_fetches_total", "Загрузки листа: выполненные и объединенные", get_fetch_stats,
+      label="kind", metric_type="counter")
+gauge("bot_sheet_sync_total", "Синхронизации снимка: проверки ревизии, скачивания, блоки", get_sync_stats,
+      label="kind", metric_type="counter")
+gauge("bot_sheet_client_total", "Авторизации и повторы запросов клиента Google Sheets", get_client_stats,
+      label="kind", metric_type="counter")
+gauge("bot_sheets_circuit_state", "Состояние выключателя Google API: 0 - замкнут, 1 - пробный запрос, 2 - разомкнут",
+      lambda: CircuitBreaker.STATE_VALUES[_breaker.state])
+gauge("bot_sheets_circuit_total", "Выключатель Google API: размыкания, отклоненные запросы, сбои", get_breaker_stats,
+      label="kind", metric_type="counter")
@@ -0,0 +1,138 @@
+"""
+Модуль для обновления данных источника через JobQueue бота:
+- прогрев снимка при запуске, до первых запросов пользователей
+- обновление по расписанию
+- обновление по запросу: команда /reload и HTTP хук для Google Apps Script (onEdit)
+Снимок строится в пуле потоков, вне цикла событий, и подменяется одним присваиванием,
+поэтому запросы пользователей не ждут перестроения и работают со старым снимком до замены.
+"""
+import asyncio
+import hmac
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+from lookup_backend import BackendUnavailableError, LookupBackend
+from settings import get_settings
+
+# aiohttp нужен только серверу с HTTP хуком и импортируется при добавлении маршрута
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+_settings = get_settings()
+REFRESH_HOOK_TOKEN = _settings.refresh_hook_token  # Секрет HTTP хука (не задан - хук выключен)
+REFRESH_HOOK_PATH = _settings.refresh_hook_path
+REFRESH_HOOK_DELAY = _settings.refresh_hook_delay  # Пауза перед обновлением по хуку: серия правок - одно обновление
+
+# Заголовок, в котором вызывающий HTTP хук передает секрет
+REFRESH_TOKEN_HEADER = "X-Refresh-Token"
+
+
+class IndexRefresher:
+    """
+    Планирует обновления данных источника в JobQueue бота.
+
+    Обновление по расписанию выполняется каждые interval секунд (None - только по запросу).
+    Запросы на обновление (HTTP хук) выполняются через delay секунд; запросы, пришедшие
+    до начала уже запланированного обновления, объединяются с ним. Все методы,
+    кроме самого обновления данных, вызываются из цикла событий, поэтому блокировка не нужна.
+    """
+
+    def __init__(self, backend: LookupBackend, interval: Optional[float], delay: float = REFRESH_HOOK_DELAY):
+        self.backend = backend
+        self.interval = interval
+        self.delay = delay
+        self._job_queue = None
+        self._pending = False
+        # Длительность последнего удачного обновления в секундах
+        self.last_duration: Optional[float] = None
+        self.stats: Dict[str, int] = {
+            "succeeded": 0,   # удачных обновлений
+            "failed": 0,      # неудачных обновлений
+            "requested": 0,   # запросов на обновление (HTTP хук)
+            "coalesced": 0,   # запросов, объединенных с уже запланированным обновлением
+        }
+
+    def start(self, job_queue) -> None:
+        """
+        Планирует прогрев и обновление по расписанию.
+        Если данные загружены с диска и еще свежие, первое обновление откладывается до срока.
+        Без обновления по расписанию данные все равно прогреваются сразу после запуска.
+        """
+        if job_queue is None:
+            raise RuntimeError("JobQueue недоступна: установите python-telegram-bot[job-queue]")
+        self._job_queue = job_queue
+        if not self.interval:
+            job_queue.run_once(self._run_scheduled, when=0, name="index-warmup")
+            return
+        age = self.backend.snapshot_age()
+        first = 0 if age is None or age >= self.interval else self.interval - age
+        job_queue.run_repeating(self._run_scheduled, interval=self.interval, first=first, name="index-refresh")
+
+    async def refresh(self, from_source: bool = False) -> float:
+        """
+        Обновляет данные источника в пуле потоков. Возвращает длительность в секундах.
+        from_source - обновление по запросу, данные сверяются с первоисточником (reload_from_source).
+        Ошибки обновления передаются вызывающему; старые данные при этом остаются в работе.
+        """
+        reload = self.backend.reload_from_source if from_source else self.backend.reload
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, reload)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        self.stats["succeeded"] += 1
+        self.last_duration = time.perf_counter() - started
+        return self.last_duration
+
+    def request_refresh(self) -> bool:
+        """
+        Запрашивает обновление через delay секунд.
+        Возвращает False, если обновление уже запланировано и запрос объединен с ним.
+        """
+        if self._job_queue is None:
+            raise RuntimeError("Обновление по запросу недоступно до вызова start()")
+        self.stats["requested"] += 1
+        if self._pending:
+            self.stats["coalesced"] += 1
+            return False
+        self._pending = True
+        self._job_queue.run_once(self._run_requested, when=self.delay, name="index-refresh-requested")
+        return True
+
+    async def _run_requested(self, context) -> None:
+        # Правки, сделанные после этого момента, требуют нового обновления
+        self._pending = False
+        await self._run_scheduled(context, from_source=True)
+
+    async def _run_scheduled(self, context, from_source: bool = False) -> None:
+        try:
+            duration = await self.refresh(from_source)
+        except BackendUnavailableError as e:
+            # Источник недоступен: отвечаем по старым данным, попробуем в следующий раз
+            logger.warning("Обновление данных пропущено: %s", e)
+            return
+        except Exception:
+            logger.exception("Не удалось обновить данные источника")
+            return
+        logger.debug("Данные источника обновлены за %.2f с", duration)
+
+
+def add_refresh_route(app: "web.Application", refresher: IndexRefresher, token: str,
+                      path: str = REFRESH_HOOK_PATH) -> None:
+    """
+    Добавляет в aiohttp приложение HTTP хук обновления данных: POST path
+    с секретом в заголовке X-Refresh-Token. Ответ 202 - обновление запланировано.
+    """
+    from aiohttp import web
+    expected = token.encode()
+
+    async def handle_refresh(request: "web.Request") -> "web.Response":
+        if not hmac.compare_digest(request.headers.get(REFRESH_TOKEN_HEADER, "").encode(), expected):
+            return web.Response(status=403)
+        scheduled = refresher.request_refresh()
+        return web.json_response({"scheduled": scheduled, "delay": refresher.delay}, status=202)
+
+    app.router.add_post(path, handle_refresh)
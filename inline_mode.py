@@ -0,0 +1,90 @@
+"""
+Модуль для inline режима (@bot 1234-... в любом чате):
+- подсказки номеров по мере ввода (поиск по префиксу в снимке)
+- отбрасывание устаревших запросов, пока пользователь печатает
+"""
+import asyncio
+from typing import Callable, Dict, Hashable, List
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from serial_number import format_serial_number
+from suggestions import suggest_serials
+from settings import get_settings
+
+_settings = get_settings()
+
+INLINE_MIN_DIGITS = _settings.inline_min_digits  # Сколько цифр нужно ввести, чтобы начать поиск
+INLINE_RESULTS_LIMIT = min(_settings.inline_results_limit, 50)  # Сколько номеров показывать (Telegram - не больше 50)
+INLINE_CACHE_TIME = _settings.inline_cache_time  # Сколько секунд Telegram кэширует ответ на одинаковый запрос
+INLINE_DEBOUNCE = _settings.inline_debounce  # Пауза в вводе (в секундах), после которой запрос обрабатывается
+
+# Длина полного серийного номера
+SERIAL_LENGTH = 12
+
+
+class QueryDebouncer:
+    """
+    Пока пользователь печатает, Telegram присылает inline запрос на каждое нажатие клавиши.
+    Запрос обрабатывается, только если за delay секунд от того же пользователя
+    не пришло более нового; устаревшие запросы завершаются без обращения к данным.
+    Все методы вызываются из цикла событий, поэтому блокировка не нужна.
+    """
+
+    def __init__(self, delay: float = INLINE_DEBOUNCE):
+        self.delay = delay
+        self._latest: Dict[Hashable, str] = {}
+
+    async def settle(self, user_id: Hashable, query_id: str) -> bool:
+        """
+        Регистрирует запрос и ждет паузы в вводе. Возвращает False, если запрос устарел.
+        """
+        self._latest[user_id] = query_id
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        return self.is_current(user_id, query_id)
+
+    def is_current(self, user_id: Hashable, query_id: str) -> bool:
+        return self._latest.get(user_id) == query_id
+
+    def finish(self, user_id: Hashable, query_id: str) -> None:
+        """
+        Забывает обработанный запрос, чтобы словарь не рос с числом пользователей.
+        """
+        if self.is_current(user_id, query_id):
+            del self._latest[user_id]
+
+
+def _display_serial(serial: str) -> str:
+    return format_serial_number(serial) if len(serial) == SERIAL_LENGTH else serial
+
+
+def inline_results(index, digits: str, render: Callable[[str, Dict[str, str]], str],
+                   limit: int = INLINE_RESULTS_LIMIT) -> List[InlineQueryResultArticle]:
+    """
+    Строит результаты inline запроса по введенным цифрам.
+    Для неполного номера - номера снимка с таким началом; для полного -
+    сам номер или, если его нет, похожие номера (опечатка).
+
+    Args:
+        index: Снимок (SerialIndex или локальный источник)
+        digits: Введенные цифры
+        render: Функция форматирования ответа render(serial_number, data)
+        limit: Максимальное число результатов
+    """
+    if len(digits) == SERIAL_LENGTH and not index.find_existing([digits]):
+        serials = suggest_serials(digits, index, limit)
+    else:
+        serials = index.complete(digits, limit)
+
+    results = []
+    for serial in serials:
+        data = index.get(serial)
+        if data is None:
+            continue
+        display = _display_serial(serial)
+        results.append(InlineQueryResultArticle(
+            id=serial,
+            title=display,
+            description=", ".join(value for value in data.values() if value)[:100],
+            input_message_content=InputTextMessageContent(index.get_rendered(display, render), parse_mode="Markdown"),
+        ))
+    return results
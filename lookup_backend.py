@@ -0,0 +1,152 @@
+"""
+Модуль с общим интерфейсом источников данных для поиска по серийному номеру:
+- Google Sheets (снимок таблицы в памяти, по умолчанию)
+- общий снимок Google Sheets для нескольких процессов (файл, отображенный в память)
+- локальная база SQLite
+- локальный CSV файл, отображенный в память
+Бот работает только с интерфейсом LookupBackend и не зависит от конкретного источника.
+"""
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional
+from serial_index import normalize_serial
+from settings import get_settings
+
+_settings = get_settings()
+
+# Источник данных: sheets (Google Sheets), shared (общий снимок Google Sheets), sqlite или csv
+LOOKUP_BACKEND = _settings.lookup_backend
+# Путь к файлу с данными для sqlite и csv (для sqlite по умолчанию используется SNAPSHOT_PATH)
+LOOKUP_DATA_PATH = _settings.lookup_data_path
+
+
+class BackendUnavailableError(Exception):
+    """
+    Источник данных недоступен, а снимка, по которому можно ответить, нет.
+    """
+
+
+class LookupBackend(ABC):
+    """
+    Источник данных для поиска по серийному номеру.
+
+    get_index() возвращает согласованный снимок данных: объект с методами
+    get(serial), get_rendered(serial, render), find_existing(keys) и
+    complete(prefix, limit), как у SerialIndex.
+    Все номера пакетного запроса ищутся по одному такому снимку.
+    """
+
+    name = ""
+    # Период обновления данных по расписанию в секундах (None - только по запросу)
+    refresh_interval: Optional[float] = None
+
+    def start(self) -> None:
+        """
+        Подготавливает источник к работе (вызывается один раз при запуске бота).
+        """
+
+    @abstractmethod
+    async def get_index(self):
+        """
+        Возвращает текущий снимок данных для поиска.
+        """
+
+    def reload(self) -> None:
+        """
+        Перечитывает данные источника.
+        """
+
+    def reload_from_source(self) -> None:
+        """
+        Обновляет данные по запросу (команда /reload, HTTP хук): сверяет их с первоисточником,
+        даже если источник обычно только подхватывает чужие обновления. По умолчанию - reload().
+        """
+        self.reload()
+
+    def snapshot_age(self) -> Optional[float]:
+        """
+        Возвращает возраст данных в секундах или None, если он неизвестен.
+        """
+        return None
+
+    def is_stale(self) -> bool:
+        """
+        Проверяет, что данные могут быть устаревшими (ответ помечается предупреждением).
+        """
+        return False
+
+    def close(self) -> None:
+        """
+        Освобождает ресурсы источника.
+        """
+
+
+class LocalLookupBackend(LookupBackend):
+    """
+    Источник поверх локального файла. Поиск выполняется прямо в файле,
+    поэтому источник сам является снимком данных.
+    """
+
+    @abstractmethod
+    def _fetch(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Ищет строку по нормализованному номеру.
+        """
+
+    def get(self, serial_number: str) -> Optional[Dict[str, str]]:
+        """
+        Возвращает данные по серийному номеру или None, если номер не найден.
+        """
+        return self._fetch(normalize_serial(serial_number))
+
+    def get_rendered(self, serial_number: str,
+                     render: Callable[[str, Dict[str, str]], str]) -> Optional[str]:
+        """
+        Возвращает готовый ответ по серийному номеру или None, если номер не найден.
+        """
+        data = self.get(serial_number)
+        return render(serial_number, data) if data is not None else None
+
+    def find_existing(self, keys: Iterable[str]) -> List[str]:
+        """
+        Возвращает те из нормализованных номеров keys, которые есть в источнике (в порядке keys).
+        """
+        return [key for key in keys if self._fetch(key) is not None]
+
+    @abstractmethod
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """
+        Возвращает до limit нормализованных номеров, начинающихся с цифр prefix.
+        """
+
+    async def get_index(self) -> "LocalLookupBackend":
+        return self
+
+
+def create_backend(name: str = LOOKUP_BACKEND, path: str = LOOKUP_DATA_PATH) -> LookupBackend:
+    """
+    Создает источник данных по имени.
+    Модули источников импортируются только при выборе соответствующего источника.
+    """
+    if name == "sheets":
+        from google_sheets import SheetsBackend
+        return SheetsBackend()
+
+    if name == "shared":
+        from shared_index import SharedIndexBackend
+        return SharedIndexBackend(path or _settings.shared_index_path)
+
+    if name == "sqlite":
+        from sqlite_backend import SqliteBackend
+        if not path or path == _settings.snapshot_path:
+            # Снимок таблицы, который ведет другой экземпляр бота: он может устареть
+            return SqliteBackend(_settings.snapshot_path, max_staleness=_settings.snapshot_max_staleness)
+        return SqliteBackend(path)
+
+    if name == "csv":
+        from csv_backend import CsvBackend
+        if not path:
+            raise ValueError("LOOKUP_DATA_PATH не установлен в переменных окружения!")
+        # Разметка CSV файла задается теми же настройками, что и для таблицы
+        return CsvBackend(path, _settings.serial_number_column, _settings.ignored_columns)
+
+    raise ValueError(f"Неизвестный источник данных LOOKUP_BACKEND: {name}")
@@ -1,21 +1,53 @@
 """
 Модуль для алгоритма Луна проверки контрольной суммы.
 """
+from typing import Dict, Iterable, List
+
+# NumPy не обязателен: пакетные функции работают и без него. Импорт занимает около 0.1 с,
+# поэтому он выполняется при первом пакетном вызове, а не при импорте модуля
+_NOT_LOADED = object()
+np = _NOT_LOADED
+
+
+def _numpy():
+    """
+    Возвращает модуль numpy или None, если он не установлен.
+    """
+    global np
+    if np is _NOT_LOADED:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+# Таблицы для bytes.translate: код ASCII цифры -> значение цифры (как есть и после удвоения)
+_DIGITS = b"0123456789"
+_PLAIN_TABLE = bytes.maketrans(_DIGITS, bytes(range(10)))
+_DOUBLED_TABLE = bytes.maketrans(_DIGITS, bytes((0, 2, 4, 6, 8, 1, 3, 5, 7, 9)))
+
+
+def _to_ascii_digits(number: str) -> bytes:
+    """
+    Переводит строку цифр в ASCII байты.
+    Для нецифровых символов выбрасывает ValueError, как и int().
+    """
+    if not number.isascii():
+        # Цифры других алфавитов (например, арабские) приводим к ASCII
+        number = ''.join(str(int(char)) for char in number)
+    if number and not number.isdigit():
+        raise ValueError(f"Недопустимый символ в номере: {number!r}")
+    return number.encode("ascii")
+
 
 def calculate_luhn_checksum(number: str) -> int:
     """
     Рассчитывает контрольную сумму по алгоритму Луна.
+    Цифры переводятся в значения табличной подстановкой (bytes.translate), без цикла по цифрам.
     """
-    checksum = 0
-    for i, digit in enumerate(reversed(number)):
-        digit = int(digit)
-        if i % 2 == 1:
-            digit *= 2
-            if digit > 9:
-                digit -= 9
-        print(digit)
-        checksum += digit
-    return checksum % 10
+    data = _to_ascii_digits(number)[::-1]
+    return (sum(data[0::2].translate(_PLAIN_TABLE)) + sum(data[1::2].translate(_DOUBLED_TABLE))) % 10
 
 def validate_luhn_checksum(number: str) -> bool:
     """
@@ -30,3 +62,69 @@ def add_valid_luhn_checksum(number: str) -> str:
     """
     checksum = calculate_luhn_checksum(number + "0")
     return number + str((10 - checksum ) % 10)
+
+
+def _group_by_length(numbers: List[str]) -> Dict[int, List[int]]:
+    """
+    Группирует индексы номеров по длине: номера одной длины обрабатываются одной матрицей.
+    """
+    groups: Dict[int, List[int]] = {}
+    for position, number in enumerate(numbers):
+        groups.setdefault(len(number), []).append(position)
+    return groups
+
+
+def _calculate_luhn_checksums_numpy(numbers: List[str]) -> List[int]:
+    """
+    Пакетный расчет контрольных сумм на NumPy. Все номера должны состоять из ASCII цифр.
+    """
+    doubled = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9], dtype=np.uint8)
+    checksums = [0] * len(numbers)
+    for length, positions in _group_by_length(numbers).items():
+        if length == 0:
+            continue
+        joined = ''.join(numbers[position] for position in positions).encode("ascii")
+        digits = (np.frombuffer(joined, dtype=np.uint8).reshape(len(positions), length) - 48)[:, ::-1]
+        sums = digits[:, 0::2].sum(axis=1, dtype=np.int64) + doubled[digits[:, 1::2]].sum(axis=1, dtype=np.int64)
+        for position, checksum in zip(positions, (sums % 10).tolist()):
+            checksums[position] = checksum
+    return checksums
+
+
+def calculate_luhn_checksums(numbers: Iterable[str]) -> List[int]:
+    """
+    Рассчитывает контрольные суммы по алгоритму Луна для массива номеров.
+    Если установлен NumPy, номера одной длины обрабатываются векторно.
+    Для нецифровых символов выбрасывает ValueError.
+    """
+    numbers = [number if number.isascii() else _to_ascii_digits(number).decode("ascii") for number in numbers]
+    for number in numbers:
+        if number and not number.isdigit():
+            raise ValueError(f"Недопустимый символ в номере: {number!r}")
+    if len(numbers) > 1 and _numpy() is not None:
+        return _calculate_luhn_checksums_numpy(numbers)
+    return [calculate_luhn_checksum(number) for number in numbers]
+
+
+def validate_luhn_checksums(numbers: Iterable[str]) -> List[bool]:
+    """
+    Проверяет контрольные суммы массива номеров.
+    Номера с нецифровыми символами считаются невалидными.
+    """
+    numbers = list(numbers)
+    result = [False] * len(numbers)
+    positions = [position for position, number in enumerate(numbers)
+                 if not number or number.isdigit()]
+    checksums = calculate_luhn_checksums([numbers[position] for position in positions])
+    for position, checksum in zip(positions, checksums):
+        result[position] = checksum == 0
+    return result
+
+
+def add_valid_luhn_checksums(numbers: Iterable[str]) -> List[str]:
+    """
+    Добавляет контрольную цифру к каждому номеру массива (пакетный вариант add_valid_luhn_checksum).
+    """
+    numbers = list(numbers)
+    checksums = calculate_luhn_checksums([number + "0" for number in numbers])
+    return [number + str((10 - checksum) % 10) for number, checksum in zip(numbers, checksums)]
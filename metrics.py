@@ -0,0 +1,234 @@
+"""
+Модуль с метриками бота в формате Prometheus:
+- счетчики, гистограммы задержек и показатели (gauge)
+- HTTP обработчик /metrics для aiohttp
+Метрики рассчитаны на горячий путь: таймеры на time.perf_counter, без выделения памяти на наблюдение.
+"""
+import bisect
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+# aiohttp нужен только HTTP серверу /metrics и импортируется при его запуске
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Границы корзин гистограмм задержек (в секундах)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Монотонно растущий счетчик с необязательной меткой.
+    """
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._lock = threading.Lock()
+        self._values: Dict[Optional[str], float] = {}
+
+    def inc(self, label_value: Optional[str] = None, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: Optional[str] = None) -> float:
+        return self._values.get(label_value, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+            labels = {self.label: label_value} if self.label and label_value is not None else {}
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма значений (обычно задержек в секундах).
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> "_Timer":
+        """
+        Контекстный менеджер, измеряющий длительность блока.
+        """
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self._sum)}")
+        lines.append(f"{self.name}_count {self._count}")
+        return lines
+
+
+class _Timer:
+    """
+    Легковесный таймер для Histogram.time() (без генераторов contextlib).
+    """
+
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._started)
+
+
+class Gauge:
+    """
+    Показатель, значение которого вычисляется функцией в момент сбора метрик.
+    Функция может вернуть число или словарь метка -> число.
+    """
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], object],
+                 label: Optional[str] = None, metric_type: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.label = label
+        self.metric_type = metric_type
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.metric_type}"]
+        if isinstance(value, dict):
+            for label_value, item in value.items():
+                if isinstance(item, (int, float)):
+                    labels = {self.label or "name": label_value}
+                    lines.append(f"{self.name}{_format_labels(labels)} {_format_value(item)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик, который отдается по /metrics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        """
+        Регистрирует метрику. Повторная регистрация с тем же именем заменяет старую.
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # Ошибка в одной метрике не должна ломать весь ответ
+                continue
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, label: Optional[str] = None) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, label))
+
+
+def histogram(name: str, help_text: str, buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, tuple(buckets)))
+
+
+def gauge(name: str, help_text: str, callback: Callable[[], object], label: Optional[str] = None,
+          metric_type: str = "gauge") -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, callback, label, metric_type))
+
+
+async def handle_metrics(request: "web.Request") -> "web.Response":
+    """
+    HTTP обработчик /metrics.
+    """
+    from aiohttp import web
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+
+def add_metrics_route(app: "web.Application", path: str = "/metrics") -> None:
+    """
+    Добавляет /metrics в aiohttp приложение.
+    """
+    app.router.add_get(path, handle_metrics)
+
+
+async def start_metrics_server(host: str, port: int,
+                               setup_web_app: Optional[Callable[["web.Application"], None]] = None) -> "web.AppRunner":
+    """
+    Запускает отдельный HTTP сервер с /metrics (для режима polling).
+    setup_web_app позволяет добавить в сервер другие маршруты вместо одного /metrics.
+    """
+    from aiohttp import web
+    app = web.Application()
+    (setup_web_app or add_metrics_route)(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# Метрики горячего пути
+PARSE_SECONDS = histogram("bot_parse_seconds", "Время разбора и проверки серийного номера")
+SHEET_FETCH_SECONDS = histogram("bot_sheet_fetch_seconds", "Время синхронизации снимка с Google Sheets")
+INDEX_LOOKUP_SECONDS = histogram("bot_index_lookup_seconds", "Время поиска ответа в снимке (включая форматирование при промахе кэша ответов)")
+FORMAT_SECONDS = histogram("bot_format_seconds", "Время форматирования ответа")
+TELEGRAM_SEND_SECONDS = histogram("bot_telegram_send_seconds", "Время отправки ответа в Telegram")
+LOOKUPS = counter("bot_lookups_total", "Запросы по серийным номерам по результату", label="result")
+SUGGEST_SECONDS = histogram("bot_suggest_seconds", "Время поиска подсказок для номера с опечаткой")
+INLINE_SECONDS = histogram("bot_inline_seconds", "Время построения результатов inline запроса")
+INLINE_QUERIES = counter("bot_inline_queries_total", "Inline запросы по результату", label="result")
+SUGGESTIONS = counter("bot_suggestions_total", "Подсказки: ответы с подсказками и нажатия на них", label="result")
@@ -0,0 +1,192 @@
+"""
+Модуль для защиты бота от перегрузки:
+- ограничение частоты запросов каждого пользователя (token bucket)
+- общее ограничение числа одновременно обрабатываемых запросов
+- справедливая очередь: свободные слоты раздаются пользователям по кругу
+"""
+import asyncio
+import functools
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+# Ответ пользователю, превысившему лимит (строка создается один раз)
+THROTTLED_REPLY = "⏳ Слишком много запросов. Подождите немного и попробуйте снова."
+
+
+class TokenBucket:
+    """
+    Ведро токенов: пополняется со скоростью rate токенов в секунду, вмещает не более burst токенов.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        """
+        Забирает один токен. Возвращает False, если токенов нет.
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """
+    Ограничивает частоту запросов каждого пользователя.
+    Хранит ведра не более чем max_users пользователей (давно не писавшие вытесняются).
+    """
+
+    def __init__(self, rate: float, burst: float, max_users: int = 10000, notice_interval: float = 10.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.notice_interval = notice_interval
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._notified_at: Dict[Hashable, float] = {}
+        self.stats: Dict[str, int] = {"allowed": 0, "throttled": 0}
+
+    def allow(self, user_id: Hashable) -> bool:
+        """
+        Проверяет, можно ли обработать запрос пользователя.
+        """
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_users:
+                evicted, _ = self._buckets.popitem(last=False)
+                self._notified_at.pop(evicted, None)
+        else:
+            self._buckets.move_to_end(user_id)
+
+        if bucket.try_acquire():
+            self.stats["allowed"] += 1
+            return True
+        self.stats["throttled"] += 1
+        return False
+
+    def should_notify(self, user_id: Hashable) -> bool:
+        """
+        Сообщать ли пользователю об ограничении. Сообщение отправляется не чаще раза
+        в notice_interval секунд, чтобы не тратить запросы к Telegram на каждое сообщение.
+        """
+        now = time.monotonic()
+        if now - self._notified_at.get(user_id, float("-inf")) < self.notice_interval:
+            return False
+        self._notified_at[user_id] = now
+        return True
+
+
+class FairScheduler:
+    """
+    Ограничивает число одновременно обрабатываемых запросов.
+    Ожидающие запросы хранятся в очередях по пользователям, и освободившийся слот
+    отдается следующему пользователю по кругу, поэтому один активный пользователь
+    не может занять все слоты.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._active = 0
+        self._queues: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        """Число запросов в очереди."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def active(self) -> int:
+        """Число запросов, которые обрабатываются сейчас."""
+        return self._active
+
+    async def acquire(self, user_id: Hashable) -> None:
+        """
+        Ждет свободный слот для пользователя.
+        """
+        if self._active < self.concurrency and not self._queues:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже передан этому запросу: отдаем его следующему
+                self.release()
+            else:
+                queue = self._queues.get(user_id)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._queues[user_id]
+            raise
+
+    def release(self) -> None:
+        """
+        Освобождает слот: передает его первому пользователю в круговой очереди.
+        """
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                # У пользователя есть еще запросы: он встает в конец круга
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable):
+        """
+        Контекстный менеджер: занимает слот на время обработки запроса.
+        """
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def rate_limited(limiter: RateLimiter, scheduler: FairScheduler) -> Callable:
+    """
+    Декоратор для обработчиков бота: проверяет лимит пользователя и выполняет
+    обработчик в слоте справедливой очереди. Пользователь, превысивший лимит,
+    получает короткий готовый ответ вместо поиска. На нажатие кнопки ответ приходит
+    уведомлением к кнопке, а не новым сообщением.
+    """
+    def decorator(callback: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+        @functools.wraps(callback)
+        async def wrapper(update, context) -> None:
+            user = update.effective_user or update.effective_chat
+            user_id = user.id if user is not None else None
+
+            if not limiter.allow(user_id):
+                notify = limiter.should_notify(user_id)
+                query = update.callback_query
+                if query is not None:
+                    # Без ответа на нажатие Telegram показывает индикатор загрузки на кнопке
+                    await query.answer(THROTTLED_REPLY if notify else None)
+                elif notify:
+                    await update.effective_message.reply_text(THROTTLED_REPLY)
+                return
+
+            async with scheduler.slot(user_id):
+                await callback(update, context)
+        return wrapper
+    return decorator
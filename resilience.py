@@ -0,0 +1,175 @@
+"""
+Модуль для устойчивой работы с внешним API:
+- повтор запросов с экспоненциальной задержкой и случайным разбросом (jitter) при 429 и 5xx
+- автоматический выключатель (circuit breaker): после серии сбоев запросы временно не выполняются
+"""
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+import gspread
+import requests
+
+T = TypeVar("T")
+
+# Коды ответов, после которых запрос имеет смысл повторить: превышение квоты и ошибки сервера
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Проверяет, что ошибка временная: квота, ошибка сервера, таймаут или обрыв соединения.
+    """
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """
+    Возвращает задержку из заголовка Retry-After ответа, если она указана в секундах.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Задержка перед повтором номер attempt (с нуля): случайная величина от 0 до
+    base_delay * 2 ** attempt, но не больше max_delay ("full jitter"). Разброс не дает
+    нескольким процессам повторять запросы одновременно.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def retry_call(func: Callable[[], T], retries: int, base_delay: float, max_delay: float,
+               should_retry: Callable[[BaseException], bool] = is_retryable_error,
+               sleep: Callable[[float], None] = time.sleep,
+               on_retry: Optional[Callable[[BaseException, float], None]] = None) -> T:
+    """
+    Выполняет func(). При временной ошибке повторяет вызов до retries раз
+    с задержкой backoff_delay (или Retry-After из ответа, если он больше).
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not should_retry(e):
+                raise
+            delay = min(max(backoff_delay(attempt, base_delay, max_delay), _retry_after(e) or 0), max_delay)
+            if on_retry is not None:
+                on_retry(e, delay)
+            sleep(delay)
+            attempt += 1
+
+
+class CircuitOpenError(Exception):
+    """
+    Выключатель разомкнут: запрос не выполнялся.
+    """
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Google API временно недоступен, следующая попытка через {retry_in:.0f} с")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для запросов к внешнему API.
+
+    - closed: запросы выполняются; после failure_threshold сбоев подряд выключатель размыкается
+    - open: запросы сразу завершаются CircuitOpenError, пока не пройдет reset_timeout секунд
+    - half_open: выполняется один пробный запрос; успех замыкает выключатель, сбой снова размыкает
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # Числовое значение состояния для метрик
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats: Dict[str, int] = {
+            "opened": 0,      # размыканий
+            "rejected": 0,    # запросов, не выполненных из-за разомкнутого выключателя
+            "failures": 0,    # сбоев запросов
+        }
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Проверяет, можно ли выполнить запрос. Если нельзя, выбрасывает CircuitOpenError.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - self._clock()
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(remaining)
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                # Пробный запрос уже выполняется, остальные ждут его результата
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        """
+        Запрос выполнен (сервис отвечает): выключатель замыкается.
+        """
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """
+        Запрос завершился сбоем сервиса.
+        """
+        with self._lock:
+            self._failures += 1
+            self.stats["failures"] += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.stats["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+    def call(self, func: Callable[[], T], is_failure: Callable[[BaseException], bool] = is_retryable_error) -> T:
+        """
+        Выполняет func() через выключатель. Сбоем считаются только ошибки, для которых
+        is_failure() истинно (сервис недоступен); остальные ошибки означают, что сервис отвечает.
+        """
+        self.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return result
@@ -0,0 +1,380 @@
+"""
+Модуль с компактным хранилищем строк снимка:
+- значения хранятся по столбцам, каждое различное значение столбца - один раз (словарное кодирование)
+- 12-значные серийные номера упакованы в 64-битные целые в отсортированном массиве (двоичный поиск)
+- словарь с данными строки создается только при найденном номере
+- хранилище выгружается в набор плоских массивов и восстанавливается поверх них без копирования
+  (например, из файла, отображенного в память несколькими процессами)
+"""
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# Длина серийного номера, который упаковывается в целое число
+PACKED_SERIAL_LENGTH = 12
+
+
+def _typecode(size: int) -> str:
+    """
+    Возвращает тип элементов массива, в который помещаются коды 0..size-1.
+    """
+    if size <= 0xFF:
+        return "B"
+    if size <= 0xFFFF:
+        return "H"
+    return "I"
+
+
+def _element_type(values) -> str:
+    """
+    Возвращает тип элементов массива: array или memoryview из восстановленного хранилища.
+    """
+    return values.typecode if isinstance(values, array) else values.format
+
+
+def _is_packable(key: str) -> bool:
+    """
+    Проверяет, что номер можно хранить как целое число без потери ведущих нулей.
+    """
+    return len(key) == PACKED_SERIAL_LENGTH and key.isascii() and key.isdigit()
+
+
+class EncodedStrings(Sequence):
+    """
+    Последовательность строк поверх двух буферов: UTF-8 данные всех строк подряд
+    и смещения (строка i - data[offsets[i]:offsets[i + 1]]). Строка декодируется при обращении.
+    """
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    @staticmethod
+    def encode(values: Sequence[str]) -> Tuple[bytes, array]:
+        """
+        Кодирует строки в буферы данных и смещений.
+        """
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("Q", [0])
+        position = 0
+        for value in encoded:
+            position += len(value)
+            offsets.append(position)
+        return b"".join(encoded), offsets
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self._offsets) - 1:
+            raise IndexError(index)
+        return str(self._data[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self.__getitem__, range(len(self)))
+
+
+class ColumnarRows:
+    """
+    Неизменяемое отображение нормализованный серийный номер -> данные строки
+    в столбцовом представлении. Создается через ColumnarRowsBuilder.
+    """
+
+    def __init__(self, headers: List[str], values: List[List[str]], codes: List[array],
+                 schemas: List[Tuple[int, ...]], row_schemas: array, serials: array,
+                 other_keys: Dict[str, int]):
+        self._headers = headers
+        self._values = values
+        self._codes = codes
+        self._schemas = schemas
+        self._row_schemas = row_schemas
+        # Отсортированные 12-значные номера; позиция номера - номер строки в столбцах
+        self._serials = serials
+        # Номера другой длины (редкость): номер -> позиция строки после упакованных
+        self._other_keys = other_keys
+        self._memory_stats: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_dict(cls, rows: Dict[str, Dict[str, str]]) -> "ColumnarRows":
+        builder = ColumnarRowsBuilder()
+        for key, data in rows.items():
+            builder.add_dict(key, data)
+        return builder.build()
+
+    def export(self) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, bytes]]]:
+        """
+        Выгружает хранилище для from_export(): описание (заголовки, схемы, номера другой длины)
+        и плоские массивы - имя массива -> (тип элементов, байты).
+        """
+        meta = {
+            "headers": self._headers,
+            "schemas": [list(columns) for columns in self._schemas],
+            "other_keys": self._other_keys,
+        }
+        arrays = {
+            "serials": ("q", bytes(self._serials)),
+            "row_schemas": (_element_type(self._row_schemas), bytes(self._row_schemas)),
+        }
+        for column, (values, codes) in enumerate(zip(self._values, self._codes)):
+            data, offsets = EncodedStrings.encode(values)
+            arrays[f"values.{column}.data"] = ("B", data)
+            arrays[f"values.{column}.offsets"] = ("Q", bytes(offsets))
+            arrays[f"codes.{column}"] = (_element_type(codes), bytes(codes))
+        return meta, arrays
+
+    @classmethod
+    def from_export(cls, meta: Mapping[str, Any], buffers: Mapping[str, Any]) -> "ColumnarRows":
+        """
+        Восстанавливает хранилище из описания и массивов, выгруженных export().
+        buffers - имя массива -> последовательность элементов (array или memoryview нужного типа);
+        массивы не копируются, поэтому хранилище поверх memoryview файла почти не занимает своей памяти.
+        """
+        columns = range(len(meta["headers"]))
+        return cls(
+            list(meta["headers"]),
+            [EncodedStrings(buffers[f"values.{column}.data"], buffers[f"values.{column}.offsets"]) for column in columns],
+            [buffers[f"codes.{column}"] for column in columns],
+            [tuple(schema) for schema in meta["schemas"]],
+            buffers["row_schemas"],
+            buffers["serials"],
+            dict(meta["other_keys"]),
+        )
+
+    def _position(self, key: str) -> int:
+        if _is_packable(key):
+            serials = self._serials
+            value = int(key)
+            position = bisect_left(serials, value)
+            if position < len(serials) and serials[position] == value:
+                return position
+            return -1
+        return self._other_keys.get(key, -1)
+
+    def _row(self, position: int) -> Dict[str, str]:
+        headers, values, codes = self._headers, self._values, self._codes
+        return {
+            headers[column]: values[column][codes[column][position]]
+            for column in self._schemas[self._row_schemas[position]]
+        }
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Возвращает данные строки (новый словарь) или None, если номера нет.
+        """
+        position = self._position(key)
+        return self._row(position) if position >= 0 else None
+
+    def __contains__(self, key: str) -> bool:
+        return self._position(key) >= 0
+
+    def __len__(self) -> int:
+        return len(self._serials) + len(self._other_keys)
+
+    def keys(self) -> Iterator[str]:
+        for value in self._serials:
+            yield f"{value:0{PACKED_SERIAL_LENGTH}d}"
+        yield from self._other_keys
+
+    def keys_with_prefix(self, prefix: str, limit: int) -> List[str]:
+        """
+        Возвращает до limit номеров, начинающихся с prefix, в порядке возрастания.
+        Упакованные номера с общим префиксом занимают непрерывный диапазон
+        отсортированного массива, поэтому поиск - два двоичных поиска.
+        """
+        keys: List[str] = []
+        if len(prefix) <= PACKED_SERIAL_LENGTH and prefix.isascii() and (prefix.isdigit() or not prefix):
+            scale = 10 ** (PACKED_SERIAL_LENGTH - len(prefix))
+            low = int(prefix or 0) * scale
+            serials = self._serials
+            start = bisect_left(serials, low)
+            stop = min(bisect_left(serials, low + scale, start), start + limit)
+            keys = [f"{value:0{PACKED_SERIAL_LENGTH}d}" for value in serials[start:stop]]
+        if len(keys) < limit and self._other_keys:
+            # Номеров другой длины мало, их достаточно просмотреть
+            keys.extend(islice((key for key in self._other_keys if key.startswith(prefix)), limit - len(keys)))
+        return keys
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, str]]]:
+        for position, key in enumerate(self.keys()):
+            yield key, self._row(position)
+
+    def memory_stats(self) -> Dict[str, int]:
+        """
+        Оценивает память хранилища и память, которую заняли бы те же данные
+        в виде словаря номер -> словарь строки (как до перехода на столбцовое хранение).
+        Хранилище неизменяемо, поэтому оценка считается один раз.
+        """
+        if self._memory_stats is None:
+            self._memory_stats = self._estimate_memory()
+        return dict(self._memory_stats)
+
+    def _estimate_memory(self) -> Dict[str, int]:
+        rows = len(self)
+        compact = (
+            sum(sys.getsizeof(part) for part in (self._serials, self._row_schemas, self._other_keys))
+            + sum(sys.getsizeof(key) for key in self._other_keys)
+            + sum(sys.getsizeof(column) for column in self._codes)
+            + sum(sys.getsizeof(column) + sum(sys.getsizeof(value) for value in column) for column in self._values)
+        )
+
+        # Словарь на каждую строку: размер зависит только от числа столбцов схемы
+        schema_rows = Counter(self._row_schemas)
+        row_dicts = sum(
+            count * sys.getsizeof(dict.fromkeys(self._schemas[schema]))
+            for schema, count in schema_rows.items()
+        )
+        # Каждое значение ячейки - отдельная строка (кроме кэшируемых интерпретатором пустых и однобуквенных)
+        cells = 0
+        for column, codes in zip(self._values, self._codes):
+            used = Counter(codes)
+            for code, count in used.items():
+                value = column[code]
+                cells += sys.getsizeof(value) * (1 if len(value) <= 1 else count)
+        # Внешний словарь (около 36 байт на запись) и строки-ключи
+        key_size = sys.getsizeof("0" * PACKED_SERIAL_LENGTH)
+        dict_estimate = sys.getsizeof({}) + rows * (36 + key_size) + row_dicts + cells
+
+        return {
+            "rows": rows,
+            "compact_bytes": compact,
+            "dict_estimate_bytes": dict_estimate,
+            "saved_bytes": dict_estimate - compact,
+        }
+
+
+class ColumnarRowsBuilder:
+    """
+    Построитель ColumnarRows. Строки добавляются по одной; при дубликатах
+    сохраняется первая добавленная строка.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, int] = {}
+        self._values: List[Dict[str, int]] = []
+        self._codes: List[List[int]] = []
+        # Заголовки схемы -> (номер схемы, номера столбцов)
+        self._schemas: Dict[Tuple[str, ...], Tuple[int, Tuple[int, ...]]] = {}
+        self._row_schemas: List[int] = []
+        self._keys: List[str] = []
+        self._seen = set()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _column(self, header: str) -> int:
+        column = self._columns.get(header)
+        if column is None:
+            column = self._columns[sys.intern(header)] = len(self._values)
+            self._values.append({"": 0})
+            # Строки, добавленные до появления столбца, в нем не участвуют
+            self._codes.append([0] * len(self._keys))
+        return column
+
+    def _schema(self, headers: Sequence[str]) -> Tuple[int, Tuple[int, ...]]:
+        key = tuple(headers)
+        entry = self._schemas.get(key)
+        if entry is None:
+            entry = self._schemas[key] = (len(self._schemas), tuple(self._column(header) for header in headers))
+        return entry
+
+    def add(self, key: str, headers: Sequence[str], values: Sequence[str]) -> bool:
+        """
+        Добавляет строку. headers и values - заголовки и значения видимых столбцов
+        (заголовки без повторов). Возвращает False, если номер уже был добавлен.
+        """
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        schema, columns = self._schema(headers)
+        self._append(key, schema, columns, values)
+        return True
+
+    def _append(self, key: str, schema: int, columns: Tuple[int, ...], values: Sequence[str]) -> None:
+        self._keys.append(key)
+        self._row_schemas.append(schema)
+        for column, value in zip(columns, values):
+            table = self._values[column]
+            code = table.get(value)
+            if code is None:
+                code = table[value] = len(table)
+            self._codes[column].append(code)
+        # Столбцы других схем в этой строке пустые
+        if len(columns) != len(self._codes):
+            present = set(columns)
+            for column, codes in enumerate(self._codes):
+                if column not in present:
+                    codes.append(0)
+
+    def add_dict(self, key: str, data: Dict[str, str]) -> bool:
+        """
+        Добавляет строку в виде словаря заголовок -> значение.
+        """
+        return self.add(key, list(data), list(data.values()))
+
+    def add_rows(self, projection, rows: Iterable[List[str]]) -> None:
+        """
+        Добавляет строки листа через проекцию на видимые столбцы (ColumnProjection).
+        Значения кодируются по столбцам, а не по строкам: так меньше обращений к словарям.
+        """
+        seen = self._seen
+        serial_key = projection.serial_key
+        accepted = []
+        keys = []
+        for row in rows:
+            key = serial_key(row)
+            if key and key not in seen:
+                seen.add(key)
+                accepted.append(row)
+                keys.append(key)
+        if not accepted:
+            return
+
+        headers = [header for _, header in projection.visible]
+        schema, columns = self._schema(headers)
+        self._keys.extend(keys)
+        self._row_schemas.extend([schema] * len(accepted))
+        for column, (index, _) in zip(columns, projection.visible):
+            table = self._values[column]
+            values = list(map(str.strip, [row[index] if index < len(row) else "" for row in accepted]))
+            for value in dict.fromkeys(values):
+                if value not in table:
+                    table[value] = len(table)
+            self._codes[column].extend(map(table.__getitem__, values))
+        # Столбцы других схем в этих строках пустые
+        if len(columns) != len(self._codes):
+            present = set(columns)
+            for column, codes in enumerate(self._codes):
+                if column not in present:
+                    codes.extend([0] * len(accepted))
+
+    def build(self) -> ColumnarRows:
+        """
+        Собирает хранилище: упакованные номера сортируются, столбцы переставляются в том же порядке.
+        """
+        keys = self._keys
+        packable = [len(key) == PACKED_SERIAL_LENGTH and key.isascii() and key.isdigit() for key in keys]
+        packed = [position for position, flag in enumerate(packable) if flag]
+        numbers = [int(keys[position]) for position in packed]
+        sort_order = sorted(range(len(packed)), key=numbers.__getitem__)
+        packed = [packed[number] for number in sort_order]
+        others = [position for position, flag in enumerate(packable) if not flag]
+        order = packed + others
+
+        headers = [None] * len(self._columns)
+        for header, column in self._columns.items():
+            headers[column] = header
+        values = [list(table) for table in self._values]
+        codes = [
+            array(_typecode(len(table)), map(column_codes.__getitem__, order))
+            for table, column_codes in zip(self._values, self._codes)
+        ]
+        schemas = [None] * len(self._schemas)
+        for schema, columns in self._schemas.values():
+            schemas[schema] = columns
+        row_schemas = array(_typecode(len(schemas)), map(self._row_schemas.__getitem__, order))
+        serials = array("q", map(numbers.__getitem__, sort_order))
+        other_keys = {keys[position]: len(packed) + number for number, position in enumerate(others)}
+        return ColumnarRows(headers, values, codes, schemas, row_schemas, serials, other_keys)
@@ -0,0 +1,241 @@
+"""
+Модуль для работы с индексом серийных номеров:
+- построение снимка таблицы (серийный номер -> данные строки)
+- поиск по снимку без обращения к сети
+"""
+import time
+from itertools import islice
+from typing import Any, Callable, Optional, Dict, List, Iterable, Mapping, Tuple, Union
+from bloom import BloomFilter
+from lru import LRUCache
+from row_store import ColumnarRows, ColumnarRowsBuilder
+from settings import get_settings
+
+_settings = get_settings()
+
+# Сколько готовых ответов хранить для каждого снимка
+REPLY_CACHE_SIZE = _settings.reply_cache_size
+# Кэш отсутствующих серийных номеров: размер и время жизни записи в секундах
+NEGATIVE_CACHE_SIZE = _settings.negative_cache_size
+NEGATIVE_CACHE_TTL = _settings.negative_cache_ttl
+# Допустимая доля ложных срабатываний фильтра Блума
+BLOOM_ERROR_RATE = _settings.bloom_error_rate
+
+
+def normalize_serial(value: str) -> str:
+    """
+    Приводит серийный номер к виду для поиска: оставляет только цифры.
+    """
+    return ''.join(filter(str.isdigit, str(value)))
+
+
+class ColumnProjection:
+    """
+    Проекция строки таблицы на видимые пользователю столбцы.
+    Вычисляется один раз по заголовкам и применяется ко всем строкам.
+    """
+
+    def __init__(self, headers: List[str], serial_column: int, ignore_columns: Iterable[int] = ()):
+        self.headers = list(headers)
+
+        # Определяем индекс столбца с серийными номерами (переводим из 1-based в 0-based)
+        self.serial_col_index = serial_column - 1
+
+        if self.serial_col_index < 0 or self.serial_col_index >= len(headers):
+            raise ValueError(f"Столбец {serial_column} выходит за пределы таблицы")
+
+        ignore_set = set(ignore_columns)
+        # Видимые столбцы: пропускаем игнорируемые, столбцы с названиями на _ и столбец с серийным номером.
+        # Если заголовки повторяются, остается место первого столбца и значение последнего
+        visible: Dict[str, int] = {}
+        for col_index, header in enumerate(headers):
+            if (col_index + 1 not in ignore_set
+                    and col_index != self.serial_col_index
+                    and not (header and header.startswith('_'))):
+                visible[header] = col_index
+        self.visible = [(col_index, header) for header, col_index in visible.items()]
+
+    def serial_key(self, row: List[str]) -> str:
+        """
+        Возвращает нормализованный серийный номер строки (пустая строка, если его нет).
+        """
+        if len(row) <= self.serial_col_index:
+            return ""
+        value = str(row[self.serial_col_index]).strip()
+        # Обычно номер уже состоит только из цифр
+        return value if value.isdigit() else normalize_serial(value)
+
+    def project_row(self, row: List[str]) -> Dict[str, str]:
+        """
+        Возвращает видимые пользователю столбцы строки.
+        """
+        data = {}
+        for col_index, header in self.visible:
+            value = row[col_index] if col_index < len(row) else ""
+            data[header] = value.strip() if value else ""
+        return data
+
+
+class SerialIndex:
+    """
+    Неизменяемый снимок таблицы: нормализованный серийный номер -> данные строки.
+    Строки хранятся в компактном столбцовом виде (ColumnarRows), словарь с данными
+    создается только для найденного номера.
+    Новый снимок строится целиком и подменяется одной операцией присваивания,
+    поэтому читатели никогда не видят частично построенный индекс.
+    """
+
+    def __init__(self, rows: Union[ColumnarRows, Dict[str, Dict[str, str]]], built_at: Optional[float] = None,
+                 revision: Optional[str] = None, bloom: Optional[BloomFilter] = None):
+        if isinstance(rows, dict):
+            rows = ColumnarRows.from_dict(rows)
+        self._rows = rows
+        self.built_at = built_at if built_at is not None else time.time()
+        # Время последней проверки, что снимок совпадает с таблицей
+        self.checked_at = self.built_at
+        # Ревизия таблицы (modifiedTime), по которой построен снимок
+        self.revision = revision
+        # Готовые ответы пользователю. Кэш принадлежит снимку, поэтому при замене
+        # снимка старые ответы становятся недоступны вместе с ним
+        self.replies = LRUCache(REPLY_CACHE_SIZE)
+        # Отсутствующие номера отсекаются фильтром Блума и кэшем промахов до обращения к строкам
+        if bloom is None:
+            bloom = BloomFilter.from_keys(rows.keys(), capacity=len(rows), error_rate=BLOOM_ERROR_RATE)
+        self.bloom = bloom
+        self.misses = LRUCache(NEGATIVE_CACHE_SIZE, ttl=NEGATIVE_CACHE_TTL)
+
+    @classmethod
+    def from_values(cls, all_values: List[List[str]], serial_column: int,
+                    ignore_columns: Iterable[int] = ()) -> "SerialIndex":
+        """
+        Строит индекс из значений листа (первая строка - заголовки).
+
+        Args:
+            all_values: Значения листа, как их возвращает worksheet.get_all_values()
+            serial_column: Номер столбца с серийными номерами (1-based)
+            ignore_columns: Номера столбцов, которые не выводятся пользователю (1-based)
+
+        Returns:
+            Построенный индекс. При дубликатах используется первая строка.
+        """
+        if not all_values:
+            return cls({})
+
+        # Первая строка - заголовки
+        projection = ColumnProjection(all_values[0], serial_column, ignore_columns)
+        builder = ColumnarRowsBuilder()
+        builder.add_rows(projection, islice(all_values, 1, None))
+        return cls(builder.build())
+
+    def export(self) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, bytes]]]:
+        """
+        Выгружает снимок для from_export(): описание и плоские массивы строк и фильтра Блума
+        (имя массива -> (тип элементов, байты)).
+        """
+        meta, arrays = self._rows.export()
+        bloom_meta, bloom_bits = self.bloom.export()
+        arrays["bloom"] = ("B", bloom_bits)
+        return {
+            "built_at": self.built_at,
+            "revision": self.revision,
+            "rows": meta,
+            "bloom": bloom_meta,
+        }, arrays
+
+    @classmethod
+    def from_export(cls, meta: Mapping[str, Any], buffers: Mapping[str, Any]) -> "SerialIndex":
+        """
+        Восстанавливает снимок из выгрузки export() без копирования массивов.
+        Кэши ответов и промахов у восстановленного снимка свои.
+        """
+        rows = ColumnarRows.from_export(meta["rows"], buffers)
+        bloom = BloomFilter.from_buffer(buffers["bloom"], **meta["bloom"])
+        return cls(rows, built_at=meta["built_at"], revision=meta["revision"], bloom=bloom)
+
+    def get(self, serial_number: str) -> Optional[Dict[str, str]]:
+        """
+        Возвращает данные по серийному номеру или None, если номер не найден.
+        """
+        return self._lookup(normalize_serial(serial_number))
+
+    def _lookup(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Ищет строку по нормализованному номеру.
+        Сначала проверяются фильтр Блума и кэш промахов, затем хранилище строк.
+        """
+        if key not in self.bloom:
+            return None
+        if self.misses.get(key) is not None:
+            return None
+        data = self._rows.get(key)
+        if data is None:
+            # Ложное срабатывание фильтра Блума: запоминаем промах
+            self.misses.put(key, True)
+        return data
+
+    def find_existing(self, keys: Iterable[str]) -> List[str]:
+        """
+        Возвращает те из нормализованных номеров keys, которые есть в снимке (в порядке keys).
+        Большинство отсутствующих номеров отсекается фильтром Блума без обращения к строкам.
+        """
+        bloom, rows = self.bloom, self._rows
+        return [key for key in keys if key in bloom and key in rows]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """
+        Возвращает до limit нормализованных номеров снимка, начинающихся с цифр prefix.
+        """
+        return self._rows.keys_with_prefix(normalize_serial(prefix), limit)
+
+    def membership_stats(self) -> Dict[str, float]:
+        """
+        Возвращает метрики фильтра Блума и кэша промахов.
+        """
+        stats = {f"bloom_{name}": value for name, value in self.bloom.stats().items()}
+        stats.update({f"negative_cache_{name}": value for name, value in self.misses.stats.items()})
+        stats["negative_cache_size"] = len(self.misses)
+        return stats
+
+    def get_rendered(self, serial_number: str,
+                     render: Callable[[str, Dict[str, str]], str]) -> Optional[str]:
+        """
+        Возвращает готовый ответ по серийному номеру или None, если номер не найден.
+        Ответ строится функцией render(serial_number, data) один раз и кэшируется.
+        """
+        key = normalize_serial(serial_number)
+        reply = self.replies.get(key)
+        if reply is not None:
+            return reply
+        data = self._lookup(key)
+        if data is None:
+            return None
+        reply = render(serial_number, data)
+        self.replies.put(key, reply)
+        return reply
+
+    def items(self) -> Iterable[Tuple[str, Dict[str, str]]]:
+        """
+        Возвращает пары (нормализованный серийный номер, данные строки).
+        """
+        return self._rows.items()
+
+    def memory_stats(self) -> Dict[str, int]:
+        """
+        Возвращает оценку памяти под строки снимка и экономию по сравнению со словарем словарей.
+        """
+        return self._rows.memory_stats()
+
+    def __contains__(self, serial_number: str) -> bool:
+        return normalize_serial(serial_number) in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def mark_checked(self) -> None:
+        """Отмечает, что таблица не менялась с момента построения снимка."""
+        self.checked_at = time.time()
+
+    @property
+    def age(self) -> float:
+        """Сколько секунд назад снимок последний раз сверялся с таблицей."""
+        return time.time() - self.checked_at
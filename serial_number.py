@@ -5,8 +5,15 @@
 - приведение к нормальному виду
 """
 
-from luhn_algorithm import validate_luhn_checksum
-from typing import Tuple
+import re
+from luhn_algorithm import validate_luhn_checksum, validate_luhn_checksums
+from typing import Iterable, List, Tuple
+
+# Разделители серийных номеров в сообщении со списком номеров
+_SERIAL_SEPARATORS = re.compile(r"[\r\n,;\t]+")
+
+INVALID_LENGTH_MESSAGE = "Серийный номер должен содержать ровно 12 цифр"
+INVALID_CHECKSUM_MESSAGE = "Проверьте корректность введенного серийного номера, возможна опечатка"
 
 def parse_serial_number(user_input: str) -> Tuple[bool, str]:
     """
@@ -19,8 +26,56 @@ def parse_serial_number(user_input: str) -> Tuple[bool, str]:
     serial = ''.join(filter(str.isdigit, user_input))
 
     if len(serial) != 12:
-        return False, "Серийный номер должен содержать ровно 12 цифр"
+        return False, INVALID_LENGTH_MESSAGE
     if not validate_luhn_checksum(serial):
-        return False, "Проверьте корректность введенного серийного номера, возможна опечатка"
+        return False, INVALID_CHECKSUM_MESSAGE
+    
+    return True, format_serial_number(serial)
+
+
+def format_serial_number(serial: str) -> str:
+    """
+    Форматирует нормализованный серийный номер (12 цифр) в формат XXXX-XXXX-XXXX.
+    """
+    return f"{serial[0:4]}-{serial[4:8]}-{serial[8:12]}"
+
+
+def split_serial_candidates(text: str) -> List[str]:
+    """
+    Разбивает сообщение со списком серийных номеров на отдельные номера.
+    Номера разделяются переводами строк, запятыми, точками с запятой или табуляцией.
+    Номера, записанные через пробел, тоже разделяются, если каждая часть содержит ровно 12 цифр
+    (при этом номер вида "0123 4567 8912" остается одним номером).
+    Части без цифр (приветствие, подпись, "Серийник:") пропускаются.
+    """
+    candidates = []
+    for piece in _SERIAL_SEPARATORS.split(text):
+        piece = piece.strip()
+        if not any(char.isdigit() for char in piece):
+            continue
+        parts = piece.split()
+        if len(parts) > 1 and all(sum(char.isdigit() for char in part) == 12 for part in parts):
+            candidates.extend(parts)
+        else:
+            candidates.append(piece)
+    return candidates
+
+
+def parse_serial_numbers(user_inputs: Iterable[str]) -> List[Tuple[bool, str]]:
+    """
+    Пакетный вариант parse_serial_number: разбирает и проверяет сразу много номеров.
+    Контрольные суммы проверяются одним пакетным вызовом.
+    Возвращает список кортежей (результат валидации, номер или сообщение об ошибке) в порядке ввода.
+    """
+    serials = [''.join(filter(str.isdigit, user_input)) for user_input in user_inputs]
+    results: List[Tuple[bool, str]] = [(False, INVALID_LENGTH_MESSAGE)] * len(serials)
     
-    return True, f"{serial[0:4]}-{serial[4:8]}-{serial[8:12]}"
\ No newline at end of file
+    positions = [position for position, serial in enumerate(serials) if len(serial) == 12]
+    checks = validate_luhn_checksums([serials[position] for position in positions])
+    for position, is_valid in zip(positions, checks):
+        serial = serials[position]
+        if is_valid:
+            results[position] = (True, format_serial_number(serial))
+        else:
+            results[position] = (False, INVALID_CHECKSUM_MESSAGE)
+    return results
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Модуль с настройками бота:
+- переменные окружения (и файл .env) читаются один раз при первом обращении
+- значения приводятся к типам полей Settings, ошибка называет переменную
+Модуль не импортирует ничего тяжелого, поэтому им пользуются и бот, и cli.py.
+"""
+import os
+from functools import lru_cache
+from typing import FrozenSet, Mapping, NamedTuple, Optional
+
+
+class Settings(NamedTuple):
+    """
+    Настройки бота. Имя переменной окружения - имя поля в верхнем регистре.
+    """
+
+    # Telegram
+    bot_token: Optional[str] = None
+    bot_mode: str = "polling"  # Режим получения обновлений: polling или webhook
+    webhook_url: str = ""  # Публичный адрес бота, например https://bot.example.com
+    webhook_path: str = "/telegram"
+    webhook_listen: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: Optional[str] = None
+    webhook_workers: int = 1
+    rate_limit_rate: float = 1.0  # Токенов в секунду на пользователя
+    rate_limit_burst: float = 10.0  # Размер "ведра" на пользователя
+    max_concurrent_requests: int = 16  # Остальные запросы ждут в справедливой очереди
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 9100  # Порт /metrics в режиме polling и первого из нескольких воркеров webhook (0 - не запускать)
+    admin_user_ids: str = ""  # ID пользователей Telegram через запятую, которым доступна команда /reload
+
+    # Google Sheets
+    sheet_id: Optional[str] = None
+    sheet_name: str = "Sheet1"
+    sheet_pat: Optional[str] = None  # Путь к JSON файлу service account или сам JSON
+    google_application_credentials: Optional[str] = None  # Альтернативный способ
+    serial_number_column: int = 1  # Номер столбца с серийными номерами (1-based)
+    ignore_columns: str = ""  # Номера столбцов через запятую, которые нужно игнорировать
+    sheet_sources: str = ""  # JSON список нескольких таблиц/листов (вместо SHEET_ID и SHEET_NAME)
+    index_refresh_interval: float = 300.0  # Период обновления индекса в секундах
+    snapshot_path: str = "data/sheet_snapshot.sqlite3"  # Файл со снимком таблицы (пусто - не сохранять)
+    snapshot_max_staleness: float = 3600.0  # Возраст снимка в секундах, после которого он считается устаревшим
+    sheet_chunk_rows: int = 5000  # Сколько строк листа скачивается одним запросом
+    sheet_fetch_parallelism: int = 4  # Сколько диапазонов строк скачивается одновременно
+    sheets_timeout: float = 10.0  # Таймаут одного запроса к Google API в секундах
+    sheets_retries: int = 3  # Повторы запроса при 429, 5xx и таймаутах
+    sheets_breaker_threshold: int = 5  # Сбоев подряд, после которых запросы к Google приостанавливаются
+    sheets_breaker_reset: float = 60.0  # Через сколько секунд после приостановки пробовать снова
+
+    # Источник данных
+    lookup_backend: str = "sheets"  # sheets, shared, sqlite или csv
+    lookup_data_path: str = ""  # Файл с данными для sqlite и csv (для sqlite по умолчанию SNAPSHOT_PATH)
+    lookup_data_poll: float = 5.0  # Как часто sqlite проверяет, что файл базы заменен (в секундах, 0 - не проверять)
+    shared_index_path: str = "data/shared_index.bin"  # Файл общего снимка для LOOKUP_BACKEND=shared
+    shared_index_poll: float = 5.0  # Как часто воркеры проверяют, что загрузчик опубликовал новый снимок (в секундах)
+
+    # Обновление данных по запросу
+    refresh_hook_token: Optional[str] = None  # Секрет HTTP хука обновления данных (не задан - хук выключен)
+    refresh_hook_path: str = "/refresh"  # Путь HTTP хука обновления данных
+    refresh_hook_delay: float = 5.0  # Через сколько секунд после вызова хука обновлять данные (правки объединяются)
+
+    # Снимок в памяти
+    reply_cache_size: int = 1024  # Сколько готовых ответов хранить для каждого снимка
+    negative_cache_size: int = 4096  # Размер кэша отсутствующих номеров
+    negative_cache_ttl: float = 300.0  # Время жизни записи кэша отсутствующих номеров в секундах
+    bloom_error_rate: float = 0.01  # Доля ложных срабатываний фильтра Блума
+
+    # Подсказки, inline режим и пакетный поиск
+    max_suggestions: int = 3  # Сколько подсказок показывать пользователю (0 - не показывать)
+    inline_min_digits: int = 4  # Сколько цифр нужно ввести, чтобы начать поиск
+    inline_results_limit: int = 10  # Сколько номеров показывать (Telegram - не больше 50)
+    inline_cache_time: int = 60  # Сколько секунд Telegram кэширует ответ на одинаковый запрос
+    inline_debounce: float = 0.3  # Пауза в вводе (в секундах), после которой запрос обрабатывается
+    bulk_max_serials: int = 10000  # Максимум номеров за один пакетный запрос
+    bulk_max_file_size: int = 2 * 1024 * 1024  # Максимальный размер файла с номерами в байтах
+
+    @property
+    def ignored_columns(self) -> FrozenSet[int]:
+        """
+        Номера игнорируемых столбцов из IGNORE_COLUMNS.
+        """
+        return _parse_ids(self.ignore_columns)
+
+    @property
+    def admin_ids(self) -> FrozenSet[int]:
+        """
+        ID администраторов бота из ADMIN_USER_IDS.
+        """
+        return _parse_ids(self.admin_user_ids)
+
+
+def _parse_ids(raw: str) -> FrozenSet[int]:
+    """
+    Разбирает список целых чисел через запятую.
+    """
+    return frozenset(int(item.strip()) for item in raw.split(",") if item.strip())
+
+
+# Поля, значения которых не зависят от регистра
+_LOWERCASE_FIELDS = ("bot_mode", "lookup_backend")
+# Поля со списком чисел через запятую
+_ID_LIST_FIELDS = ("ignore_columns", "admin_user_ids")
+# Числовые поля, которые должны быть больше нуля (например, с нулевым периодом обновления
+# загрузчик общего снимка сверял бы таблицу непрерывно)
+_POSITIVE_FIELDS = ("index_refresh_interval",)
+
+
+def _convert(name: str, kind, raw: str):
+    """
+    Приводит значение переменной окружения к типу поля.
+    Пустое значение числовой переменной означает значение по умолчанию, необязательной строки - None.
+    """
+    if kind is str:
+        return raw
+    if kind is int or kind is float:
+        if not raw.strip():
+            return Settings._field_defaults[name]
+        try:
+            return kind(raw)
+        except ValueError:
+            type_name = "целым числом" if kind is int else "числом"
+            raise ValueError(f"{name.upper()} должно быть {type_name}, получено {raw!r}") from None
+    # Optional[str]
+    return raw or None
+
+
+def load_settings(environ: Mapping[str, str] = os.environ) -> Settings:
+    """
+    Разбирает настройки из переменных окружения.
+    Для некорректного значения выбрасывает ValueError с именем переменной.
+    """
+    values = {}
+    for name, kind in Settings.__annotations__.items():
+        raw = environ.get(name.upper())
+        if raw is not None:
+            values[name] = _convert(name, kind, raw)
+    for name in _LOWERCASE_FIELDS:
+        if name in values:
+            values[name] = values[name].lower()
+    for name in _ID_LIST_FIELDS:
+        if name in values:
+            try:
+                _parse_ids(values[name])
+            except ValueError:
+                raise ValueError(f"{name.upper()} должно быть списком чисел через запятую, получено {values[name]!r}") from None
+    for name in _POSITIVE_FIELDS:
+        if name in values and values[name] <= 0:
+            raise ValueError(f"{name.upper()} должно быть больше 0, получено {values[name]!r}")
+    return Settings(**values)
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Возвращает настройки процесса: при первом вызове загружает файл .env
+    (уже заданные переменные окружения не переопределяются) и разбирает переменные.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    return load_settings()
@@ -0,0 +1,312 @@
+"""
+Модуль с общим снимком таблицы для нескольких процессов бота (LOOKUP_BACKEND=shared):
+- один процесс-загрузчик синхронизирует снимок с Google Sheets и публикует его в файл
+- воркеры отображают файл в память только для чтения: страницы снимка общие для всех процессов,
+  и ни один воркер не хранит и не обновляет свою копию таблицы
+
+Формат файла (все числа little-endian):
+- 8 байт: сигнатура SNAPIDX1
+- 8 байт: время последней сверки с таблицей (double), загрузчик обновляет его на месте
+- 8 байт: длина заголовка
+- заголовок JSON: описание снимка и расположение массивов (смещение, длина, тип элементов)
+- массивы снимка, каждый выровнен на 8 байт
+Новый снимок записывается во временный файл, который атомарно подменяет старый. Воркеры
+замечают подмену по номеру inode и отображают новый файл; старый остается в памяти,
+пока его используют запросы, начатые до подмены.
+
+Обновление по запросу (/reload, HTTP хук) воркер передает загрузчику файлом запроса <path>.refresh:
+загрузчик проверяет его раз в SHARED_INDEX_POLL секунд и сразу сверяет снимок с таблицей.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Optional, Tuple
+from lookup_backend import BackendUnavailableError, LookupBackend
+from metrics import gauge
+from serial_index import SerialIndex
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+_settings = get_settings()
+SHARED_INDEX_PATH = _settings.shared_index_path  # Файл общего снимка
+SHARED_INDEX_POLL = _settings.shared_index_poll  # Как часто воркеры проверяют, что снимок обновился (в секундах)
+SNAPSHOT_MAX_STALENESS = _settings.snapshot_max_staleness
+
+MAGIC = b"SNAPIDX1"
+# Смещение времени сверки с таблицей и размер заголовка файла до JSON
+_CHECKED_AT = struct.Struct("<d")
+_CHECKED_AT_OFFSET = len(MAGIC)
+_HEADER_LENGTH = struct.Struct("<Q")
+_PREFIX_SIZE = len(MAGIC) + _CHECKED_AT.size + _HEADER_LENGTH.size
+_ALIGNMENT = 8
+
+# Сколько воркер ждет, пока загрузчик выполнит запрос на обновление, и как часто проверяет файл (в секундах)
+LOADER_REQUEST_TIMEOUT = 120.0
+_REQUEST_CHECK_INTERVAL = 0.2
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % _ALIGNMENT)
+
+
+def save_shared_index(index: SerialIndex, path: str) -> None:
+    """
+    Сохраняет снимок в файл общего снимка.
+    Запись идет во временный файл, который затем атомарно подменяет старый.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    meta, arrays = index.export()
+    sections = {}
+    offset = 0
+    for name, (element_type, data) in arrays.items():
+        sections[name] = [offset, len(data), element_type]
+        offset += len(data) + len(_padding(len(data)))
+    meta["sections"] = sections
+    header = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(_CHECKED_AT.pack(index.checked_at))
+        file.write(_HEADER_LENGTH.pack(len(header)))
+        file.write(header)
+        file.write(_padding(_PREFIX_SIZE + len(header)))
+        for _, data in arrays.values():
+            file.write(data)
+            file.write(_padding(len(data)))
+    os.replace(tmp_path, path)
+
+
+def touch_shared_index(index: SerialIndex, path: str) -> None:
+    """
+    Обновляет в файле общего снимка время последней сверки с таблицей.
+    Используется, когда данные таблицы не менялись; воркеры видят новое время без перечитывания файла.
+    """
+    if not os.path.exists(path):
+        save_shared_index(index, path)
+        return
+    with open(path, "r+b") as file:
+        file.seek(_CHECKED_AT_OFFSET)
+        file.write(_CHECKED_AT.pack(index.checked_at))
+
+
+def refresh_request_path(path: str) -> str:
+    """
+    Путь к файлу запроса на обновление для файла общего снимка path.
+    """
+    return f"{path}.refresh"
+
+
+def request_loader_refresh(path: str) -> None:
+    """
+    Просит загрузчик сверить снимок с таблицей, не дожидаясь расписания.
+    Запросы нескольких воркеров до ближайшей проверки объединяются в одно обновление.
+    """
+    with open(refresh_request_path(path), "w"):
+        pass
+
+
+def take_refresh_request(path: str) -> bool:
+    """
+    Забирает запрос на обновление, если он есть (вызывается загрузчиком).
+    Запрос удаляется до обновления: запросы, пришедшие во время обновления, вызовут следующее.
+    """
+    try:
+        os.remove(refresh_request_path(path))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class SharedIndexFile:
+    """
+    Файл общего снимка, отображенный в память только для чтения.
+    Массивы снимка не копируются: строки и фильтр Блума читаются прямо из отображения.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            if stat.st_size < _PREFIX_SIZE:
+                raise ValueError(f"Файл {path} не является общим снимком")
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Устройство и inode файла: по ним видно, что загрузчик опубликовал новый снимок
+        self.identity: Tuple[int, int] = (stat.st_dev, stat.st_ino)
+        self.size = stat.st_size
+
+        buffer = self._buffer
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Файл {path} не является общим снимком")
+        (header_length,) = _HEADER_LENGTH.unpack_from(buffer, _CHECKED_AT_OFFSET + _CHECKED_AT.size)
+        meta = json.loads(buffer[_PREFIX_SIZE:_PREFIX_SIZE + header_length].decode("utf-8"))
+        data_start = _PREFIX_SIZE + header_length + len(_padding(_PREFIX_SIZE + header_length))
+
+        view = memoryview(buffer)
+        buffers = {
+            name: view[data_start + offset:data_start + offset + length].cast(element_type)
+            for name, (offset, length, element_type) in meta["sections"].items()
+        }
+        self.index = SerialIndex.from_export(meta, buffers)
+        self.index.checked_at = self.checked_at()
+
+    def checked_at(self) -> float:
+        """
+        Время последней сверки снимка с таблицей (загрузчик обновляет его на месте).
+        """
+        return _CHECKED_AT.unpack_from(self._buffer, _CHECKED_AT_OFFSET)[0]
+
+
+class SharedIndexBackend(LookupBackend):
+    """
+    Источник данных для воркеров: снимок таблицы, который публикует процесс-загрузчик (run_loader).
+    Раз в refresh_interval секунд воркер проверяет, не опубликован ли новый снимок.
+    """
+
+    name = "shared"
+
+    def __init__(self, path: str = SHARED_INDEX_PATH, poll: float = SHARED_INDEX_POLL,
+                 request_timeout: float = LOADER_REQUEST_TIMEOUT):
+        self.path = path
+        self._poll = poll
+        self._request_timeout = request_timeout
+        self._file: Optional[SharedIndexFile] = None
+
+    @property
+    def refresh_interval(self) -> Optional[float]:
+        return self._poll
+
+    def start(self) -> None:
+        # Показатели снимка те же, что у источника sheets
+        gauge("bot_snapshot_age_seconds", "Сколько секунд назад снимок сверялся с таблицей", self.snapshot_age)
+        gauge("bot_snapshot_rows", "Число серийных номеров в снимке",
+              lambda: len(self._file.index) if self._file is not None else None)
+        try:
+            self.reload()
+        except BackendUnavailableError as e:
+            # Загрузчик еще не успел опубликовать снимок: воркер подхватит его позже
+            logger.warning("%s", e)
+
+    async def get_index(self) -> SerialIndex:
+        file = self._file
+        if file is None:
+            # Снимок мог появиться после запуска воркера; проверка файла дешевая
+            self.reload()
+            file = self._file
+        return file.index
+
+    def reload(self) -> None:
+        """
+        Отображает в память новый снимок, если загрузчик его опубликовал.
+        Если файла нет или он поврежден, воркер продолжает работать с текущим снимком.
+        """
+        current = self._file
+        try:
+            stat = os.stat(self.path)
+            if current is not None and current.identity == (stat.st_dev, stat.st_ino):
+                current.index.checked_at = current.checked_at()
+                return
+            mapped = SharedIndexFile(self.path)
+        except FileNotFoundError:
+            raise BackendUnavailableError(f"Общий снимок {self.path} еще не создан загрузчиком") from None
+        except (OSError, ValueError) as e:
+            raise BackendUnavailableError(f"Не удалось открыть общий снимок {self.path}: {e}") from e
+        self._file = mapped
+        logger.info("Отображен общий снимок %s: %d строк, возраст %.0f с",
+                    self.path, len(mapped.index), mapped.index.age)
+
+    def reload_from_source(self) -> None:
+        """
+        Просит загрузчик сверить снимок с таблицей и ждет, пока он опубликует результат.
+        Если загрузчик не справился за request_timeout секунд (таблица недоступна или загрузчик
+        не запущен), выбрасывает BackendUnavailableError; воркер продолжает работать с текущим снимком.
+        """
+        requested_at = time.time()
+        try:
+            request_loader_refresh(self.path)
+        except OSError as e:
+            raise BackendUnavailableError(f"Не удалось передать запрос загрузчику общего снимка: {e}") from e
+        deadline = time.monotonic() + self._request_timeout
+        while True:
+            try:
+                self.reload()
+            except BackendUnavailableError:
+                if time.monotonic() >= deadline:
+                    raise
+            else:
+                if self._file.checked_at() >= requested_at:
+                    return
+            if time.monotonic() >= deadline:
+                raise BackendUnavailableError(
+                    f"Загрузчик не сверил общий снимок с таблицей за {self._request_timeout:.0f} с")
+            time.sleep(_REQUEST_CHECK_INTERVAL)
+
+    def snapshot_age(self) -> Optional[float]:
+        file = self._file
+        return time.time() - file.checked_at() if file is not None else None
+
+    def is_stale(self) -> bool:
+        age = self.snapshot_age()
+        return age is not None and age > SNAPSHOT_MAX_STALENESS
+
+    def __len__(self) -> int:
+        file = self._file
+        return len(file.index) if file is not None else 0
+
+
+def publish_index(index: SerialIndex, path: str, changed: bool) -> None:
+    """
+    Публикует снимок для воркеров: новый снимок записывается целиком,
+    для неизменившегося обновляется только время сверки. Ошибки записи пишутся в лог.
+    """
+    try:
+        if changed:
+            save_shared_index(index, path)
+        else:
+            touch_shared_index(index, path)
+    except OSError:
+        logger.exception("Не удалось опубликовать общий снимок в %s", path)
+
+
+def run_loader(path: str = SHARED_INDEX_PATH, interval: Optional[float] = None,
+               stop: Optional[threading.Event] = None, poll: float = SHARED_INDEX_POLL) -> None:
+    """
+    Процесс-загрузчик: синхронизирует снимок с Google Sheets каждые interval секунд
+    (по умолчанию INDEX_REFRESH_INTERVAL) и публикует его в файл path.
+    Раз в poll секунд проверяет запросы воркеров (/reload, HTTP хук) и выполняет их сразу.
+    При запуске сразу публикует снимок, сохраненный на диске (SNAPSHOT_PATH), чтобы воркеры
+    начали отвечать до первого обращения к Google. Работает до установки stop или до SIGTERM.
+    """
+    import google_sheets
+    if interval is None:
+        interval = google_sheets.INDEX_REFRESH_INTERVAL
+    if stop is None:
+        stop = threading.Event()
+
+    published = None
+    if google_sheets.load_saved_snapshot():
+        published = google_sheets.get_index()
+        publish_index(published, path, changed=True)
+
+    # Свежий сохраненный снимок сверяется с таблицей только по расписанию
+    age = google_sheets.get_snapshot_age()
+    wait = 0.0 if age is None or age >= interval else interval - age
+    next_refresh = time.monotonic() + wait
+    while not stop.wait(max(0.0, min(next_refresh - time.monotonic(), poll))):
+        if not take_refresh_request(path) and time.monotonic() < next_refresh:
+            continue
+        next_refresh = time.monotonic() + interval
+        try:
+            index = google_sheets.refresh_index()
+        except Exception as e:
+            logger.warning("Не удалось обновить снимок таблицы, воркеры отвечают по старому: %s", e)
+            continue
+        publish_index(index, path, changed=index is not published)
+        published = index
@@ -0,0 +1,133 @@
+"""
+Модуль для работы с несколькими таблицами (листами) как с одной:
+- разбор списка источников из переменной окружения SHEET_SOURCES
+- параллельная синхронизация всех источников
+- объединение в единый индекс серийных номеров
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from row_store import ColumnarRows, ColumnarRowsBuilder
+from serial_index import SerialIndex
+from sheet_sync import SheetSync
+
+# Разделитель ревизий источников в ревизии объединенного снимка
+REVISION_SEPARATOR = "|"
+
+
+class SheetSourceConfig(NamedTuple):
+    """
+    Настройки одного источника данных (лист Google таблицы).
+    """
+    sheet_id: str
+    sheet_name: str = "Sheet1"
+    serial_column: int = 1
+    ignore_columns: frozenset = frozenset()
+
+
+def _parse_ignore_columns(value) -> frozenset:
+    if isinstance(value, str):
+        return frozenset(int(col.strip()) for col in value.split(",") if col.strip())
+    return frozenset(int(col) for col in value or ())
+
+
+def parse_sheet_sources(raw: Optional[str], default: Optional[SheetSourceConfig] = None) -> List[SheetSourceConfig]:
+    """
+    Разбирает список источников из JSON вида
+    [{"sheet_id": "...", "sheet_name": "2025", "serial_column": 1, "ignore_columns": "3,4"}, ...].
+    Порядок источников задает приоритет: при дубликатах используется строка из первого источника.
+    Если список не задан, возвращает единственный источник default (если он есть).
+    """
+    if not raw or not raw.strip():
+        return [default] if default is not None and default.sheet_id else []
+
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("SHEET_SOURCES должен быть JSON списком источников")
+    if not isinstance(items, list):
+        raise ValueError("SHEET_SOURCES должен быть JSON списком источников")
+
+    sources = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("sheet_id"):
+            raise ValueError(f"В SHEET_SOURCES у каждого источника должен быть sheet_id: {item!r}")
+        sources.append(SheetSourceConfig(
+            sheet_id=item["sheet_id"],
+            sheet_name=item.get("sheet_name", "Sheet1"),
+            serial_column=int(item.get("serial_column", 1)),
+            ignore_columns=_parse_ignore_columns(item.get("ignore_columns")),
+        ))
+    return sources
+
+
+def merge_indexes(indexes: Iterable[SerialIndex]) -> ColumnarRows:
+    """
+    Объединяет индексы источников. При дубликатах остается строка из первого по порядку источника.
+    """
+    builder = ColumnarRowsBuilder()
+    for index in indexes:
+        for key, data in index.items():
+            builder.add_dict(key, data)
+    return builder.build()
+
+
+class FederatedSync:
+    """
+    Синхронизирует несколько источников параллельно и собирает из них один снимок.
+    Поиск по объединенному снимку остается одним обращением к словарю
+    независимо от числа источников.
+    """
+
+    def __init__(self, syncs: List[SheetSync]):
+        self._syncs = syncs
+        self._indexes: List[SerialIndex] = []
+        self._executor = ThreadPoolExecutor(max_workers=max(len(syncs), 1), thread_name_prefix="sheet-source")
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Счетчики синхронизации, просуммированные по источникам."""
+        total: Dict[str, int] = {}
+        for sync in self._syncs:
+            for name, value in sync.stats.items():
+                total[name] = total.get(name, 0) + value
+        return total
+
+    def _unchanged_since(self, current: Optional[SerialIndex]) -> bool:
+        """
+        Проверяет по ревизиям, что ни один источник не менялся с момента построения current
+        (используется после перезапуска, когда снимки отдельных источников еще не загружены).
+        """
+        if current is None or not current.revision:
+            return False
+        stored = current.revision.split(REVISION_SEPARATOR)
+        if len(stored) != len(self._syncs):
+            return False
+        revisions = list(self._executor.map(lambda sync: sync.current_revision(), self._syncs))
+        return None not in revisions and revisions == stored
+
+    def sync(self, current: Optional[SerialIndex]) -> SerialIndex:
+        """
+        Возвращает актуальный объединенный снимок: current, если ни один источник не менялся.
+        """
+        if len(self._syncs) == 1:
+            # Один источник: его снимок и есть объединенный, копировать строки не нужно
+            return self._syncs[0].sync(current)
+
+        if not self._indexes and self._unchanged_since(current):
+            current.mark_checked()
+            return current
+
+        previous = self._indexes or [None] * len(self._syncs)
+        indexes = list(self._executor.map(lambda pair: pair[0].sync(pair[1]), zip(self._syncs, previous)))
+
+        revision = REVISION_SEPARATOR.join(index.revision or "" for index in indexes)
+        if current is not None and self._indexes and all(new is old for new, old in zip(indexes, self._indexes)):
+            # Данные не менялись, но ревизия источника могла измениться
+            self._indexes = indexes
+            current.revision = revision
+            current.mark_checked()
+            return current
+
+        self._indexes = indexes
+        return SerialIndex(merge_indexes(indexes), revision=revision)
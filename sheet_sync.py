@@ -0,0 +1,212 @@
+"""
+Модуль для синхронизации снимка таблицы:
+- проверка, менялась ли таблица (по modifiedTime из Drive API), до скачивания данных
+- постраничное скачивание листа диапазонами строк с ограниченным числом параллельных запросов
+- сравнение контрольных сумм блоков строк, чтобы не подменять снимок, если значения не менялись
+Google Sheets не отдает контрольные суммы диапазонов, поэтому после изменения ревизии
+лист скачивается целиком; синхронизация экономит только скачивания неизменившейся таблицы.
+"""
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional
+import gspread
+from resilience import CircuitOpenError
+from row_store import ColumnarRowsBuilder
+from serial_index import ColumnProjection, SerialIndex
+
+logger = logging.getLogger(__name__)
+
+# Размер блока строк, для которого считается контрольная сумма
+SYNC_BLOCK_ROWS = 5000
+# Сколько строк листа скачивается одним запросом
+SHEET_CHUNK_ROWS = 5000
+# Сколько запросов с диапазонами строк выполняется одновременно
+SHEET_FETCH_PARALLELISM = 4
+# Ответы Drive API, после которых ревизию не получить без вмешательства: API не включен, нет доступа к файлу
+REVISION_UNSUPPORTED_STATUS_CODES = frozenset({403, 404})
+
+
+def is_revision_unsupported(error: BaseException) -> bool:
+    """
+    Проверяет, что ревизию таблицы получить нельзя в принципе, а не из-за временного сбоя.
+    """
+    if not isinstance(error, gspread.exceptions.APIError):
+        return False
+    response = error.response
+    # С кодом 403 Drive API отвечает и при превышении квоты, это временная ошибка
+    return response.status_code in REVISION_UNSUPPORTED_STATUS_CODES and "rateLimitExceeded" not in response.text
+
+
+class GspreadSheetSource:
+    """
+    Источник данных для синхронизации поверх SheetClient.
+    Любой объект с методами get_revision() и iter_chunks() может использоваться
+    вместо него (например, фейковый источник в тестах).
+    """
+
+    def __init__(self, client, chunk_rows: int = SHEET_CHUNK_ROWS,
+                 parallelism: int = SHEET_FETCH_PARALLELISM):
+        self._client = client
+        self._chunk_rows = max(1, chunk_rows)
+        self._parallelism = max(1, parallelism)
+
+    def get_revision(self) -> Optional[str]:
+        """
+        Возвращает ревизию таблицы (modifiedTime из Drive API).
+        """
+        return self._client.modified_time()
+
+    def _get_rows(self, first: int, last: int) -> List[List[str]]:
+        """
+        Скачивает строки first..last (1-based) во всех столбцах.
+        """
+        return self._client.call(lambda worksheet: worksheet.get_values(f"{first}:{last}"))
+
+    def iter_chunks(self) -> Iterator[List[List[str]]]:
+        """
+        Скачивает лист диапазонами по chunk_rows строк и отдает их по порядку
+        (первая строка первого диапазона - заголовки). Одновременно в памяти
+        находится не больше parallelism + 1 диапазонов.
+        """
+        rows = self._client.row_count()
+        ranges = ((first, min(first + self._chunk_rows - 1, rows))
+                  for first in range(1, rows + 1, self._chunk_rows))
+        with ThreadPoolExecutor(max_workers=self._parallelism, thread_name_prefix="sheet-chunk") as executor:
+            pending = deque(executor.submit(self._get_rows, *bounds) for bounds in islice(ranges, self._parallelism))
+            try:
+                while pending:
+                    chunk = pending.popleft().result()
+                    bounds = next(ranges, None)
+                    if bounds is not None:
+                        pending.append(executor.submit(self._get_rows, *bounds))
+                    yield chunk
+            finally:
+                # Если чтение прервано (ошибка или закрытие генератора), оставшиеся запросы не нужны
+                for future in pending:
+                    future.cancel()
+
+
+def _block_digest(rows: List[List[str]]) -> bytes:
+    """
+    Считает контрольную сумму блока строк.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update("\x1f".join(row).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.digest()
+
+
+class SheetSync:
+    """
+    Синхронизирует снимок индекса с таблицей.
+    Если ревизия таблицы не изменилась, данные не скачиваются вовсе.
+    Если изменилась, лист скачивается целиком, а контрольные суммы блоков строк
+    сравниваются с предыдущими: когда значения не поменялись (например, изменилось
+    только оформление), остается прежний снимок.
+    """
+
+    def __init__(self, source, serial_column: int, ignore_columns: Iterable[int] = (),
+                 block_rows: int = SYNC_BLOCK_ROWS):
+        self._source = source
+        self._serial_column = serial_column
+        self._ignore_columns = set(ignore_columns)
+        self._block_rows = block_rows
+        self._headers: Optional[List[str]] = None
+        self._digests: List[bytes] = []
+        self._revision_supported = True
+        self.stats: Dict[str, int] = {
+            "checks": 0,            # проверок ревизии
+            "unchanged": 0,         # проверок, после которых скачивание не понадобилось
+            "downloads": 0,         # скачиваний листа
+            "blocks_changed": 0,    # изменившихся блоков
+            "blocks_unchanged": 0,  # неизменившихся блоков
+        }
+
+    def current_revision(self) -> Optional[str]:
+        """
+        Возвращает ревизию таблицы или None, если ее не удалось получить.
+        Если Drive API недоступен в принципе (не включен, нет доступа), проверка отключается;
+        после временного сбоя ревизия снова запрашивается при следующей синхронизации.
+        Пока выключатель Google API разомкнут, CircuitOpenError передается вызывающему:
+        синхронизация пропускается, а не скачивает лист.
+        """
+        if not self._revision_supported:
+            return None
+        try:
+            return self._source.get_revision()
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if is_revision_unsupported(e):
+                # Например, не включен Drive API: дальше скачиваем лист при каждой синхронизации
+                self._revision_supported = False
+                logger.warning("Ревизия таблицы недоступна, проверка изменений отключена: %s", e)
+            else:
+                logger.warning("Не удалось получить ревизию таблицы: %s", e)
+            return None
+
+    def sync(self, current: Optional[SerialIndex]) -> SerialIndex:
+        """
+        Возвращает актуальный снимок: current, если таблица не менялась, иначе новый снимок.
+        """
+        self.stats["checks"] += 1
+        revision = self.current_revision()
+        if current is not None and revision is not None and revision == current.revision:
+            current.mark_checked()
+            self.stats["unchanged"] += 1
+            return current
+
+        self.stats["downloads"] += 1
+        return self.apply(self._source.iter_chunks(), revision, current)
+
+    def apply(self, chunks: Iterable[List[List[str]]], revision: Optional[str] = None,
+              current: Optional[SerialIndex] = None) -> SerialIndex:
+        """
+        Строит снимок по значениям листа, которые приходят частями (первая строка - заголовки).
+        Строки обрабатываются блоками по мере поступления, поэтому весь лист
+        одновременно в памяти не находится. Новый снимок всегда строится из всех строк;
+        если значения совпадают с теми, по которым построен current, возвращает current с новой ревизией.
+        """
+        rows = chain.from_iterable(chunks)
+        headers = next(rows, None)
+        if headers is None:
+            self._headers = None
+            self._digests = []
+            return SerialIndex({}, revision=revision)
+
+        # Если заголовки изменились, меняются все строки снимка
+        previous = self._digests if headers == self._headers else []
+        # При дубликатах остается первая строка
+        projection = ColumnProjection(headers, self._serial_column, self._ignore_columns)
+        builder = ColumnarRowsBuilder()
+
+        digests = []
+        changed = False
+        while True:
+            block = list(islice(rows, self._block_rows))
+            if not block:
+                break
+            digest = _block_digest(block)
+            if len(digests) < len(previous) and previous[len(digests)] == digest:
+                self.stats["blocks_unchanged"] += 1
+            else:
+                self.stats["blocks_changed"] += 1
+                changed = True
+            digests.append(digest)
+            # Что значения не менялись, становится известно только в конце, а скачанные
+            # строки не хранятся, поэтому блок сразу добавляется в новое хранилище
+            builder.add_rows(projection, block)
+        changed = changed or len(digests) != len(previous)
+
+        if current is not None and not changed:
+            current.revision = revision
+            current.mark_checked()
+            return current
+
+        self._headers = list(headers)
+        self._digests = digests
+        return SerialIndex(builder.build(), revision=revision)
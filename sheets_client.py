@@ -0,0 +1,177 @@
+"""
+Модуль с долгоживущим клиентом Google Sheets:
+- одна авторизованная сессия с пулом HTTP соединений
+- кэшированный объект листа
+- повторная авторизация только при истечении токена или ответе 401
+- таймаут каждого запроса, повторы при 429 и 5xx, общий автоматический выключатель
+"""
+import functools
+import logging
+import threading
+from typing import Callable, Dict, Optional, TypeVar
+import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from resilience import CircuitBreaker, retry_call
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Размер пула HTTP соединений к Google API
+HTTP_POOL_SIZE = 10
+# Таймаут одного запроса к Google API в секундах
+HTTP_TIMEOUT = 10.0
+# Повторы запроса при временных ошибках и границы задержки между ними (в секундах)
+HTTP_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10.0
+
+
+class SheetClient:
+    """
+    Клиент Google Sheets, который авторизуется один раз и переиспользует
+    сессию и объект листа между запросами.
+    """
+
+    def __init__(self, credentials_factory: Callable, sheet_id: Optional[str], sheet_name: str,
+                 pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT,
+                 retries: int = HTTP_RETRIES, breaker: Optional[CircuitBreaker] = None):
+        self._credentials_factory = credentials_factory
+        self.sheet_id = sheet_id
+        self.sheet_name = sheet_name
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._retries = retries
+        # Выключатель может быть общим для нескольких клиентов (квота Google API общая)
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._client: Optional[gspread.Client] = None
+        self._spreadsheet: Optional[gspread.Spreadsheet] = None
+        self._worksheet: Optional[gspread.Worksheet] = None
+        # Счетчики: сколько раз реально происходила (повторная) авторизация
+        self.stats: Dict[str, int] = {
+            "authorizations": 0,      # создание сессии с нуля
+            "token_refreshes": 0,     # обновление истекшего токена
+            "reauth_on_401": 0,       # повторная авторизация после ответа 401
+            "worksheet_opens": 0,     # открытие таблицы и листа
+            "retries": 0,             # повторы запросов после 429, 5xx и таймаутов
+        }
+
+    def _authorize(self) -> gspread.Client:
+        """
+        Создает авторизованную сессию с пулом соединений.
+        Файл или JSON с ключом сервисного аккаунта разбирается только здесь.
+        """
+        self._credentials = self._credentials_factory()
+        # Обновление токена внутри сессии (например, после ответа 401) ограничено тем же таймаутом
+        session = AuthorizedSession(self._credentials, refresh_timeout=self._timeout)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+        session.mount("https://", adapter)
+        self.stats["authorizations"] += 1
+        return gspread.Client(auth=self._credentials, session=session)
+
+    def _ensure_token(self) -> None:
+        """
+        Обновляет токен, если он истек. Иначе сессия используется как есть.
+        Запрос токена ограничен таймаутом, как и запросы к таблице.
+        """
+        if not self._credentials.valid:
+            self._credentials.refresh(functools.partial(Request(self._client.session), timeout=self._timeout))
+            self.stats["token_refreshes"] += 1
+
+    def client(self) -> gspread.Client:
+        """
+        Возвращает авторизованный клиент gspread.
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = self._authorize()
+                self._client.set_timeout(self._timeout)
+            self._ensure_token()
+            return self._client
+
+    def spreadsheet(self) -> gspread.Spreadsheet:
+        """
+        Возвращает кэшированный объект таблицы.
+        """
+        client = self.client()
+        with self._lock:
+            if self._spreadsheet is None:
+                if not self.sheet_id:
+                    raise ValueError("SHEET_ID не установлен в переменных окружения!")
+                self._spreadsheet = client.open_by_key(self.sheet_id)
+            return self._spreadsheet
+
+    def worksheet(self) -> gspread.Worksheet:
+        """
+        Возвращает кэшированный объект листа.
+        """
+        spreadsheet = self.spreadsheet()
+        with self._lock:
+            if self._worksheet is None:
+                self._worksheet = spreadsheet.worksheet(self.sheet_name)
+                self.stats["worksheet_opens"] += 1
+            return self._worksheet
+
+    def reset(self) -> None:
+        """
+        Сбрасывает сессию и кэшированные объекты: следующий вызов авторизуется заново.
+        """
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._worksheet = None
+
+    def modified_time(self) -> str:
+        """
+        Возвращает время последнего изменения таблицы (modifiedTime из Drive API).
+        Это дешевый запрос метаданных, по которому можно понять, нужно ли скачивать лист.
+        """
+        if not self.sheet_id:
+            raise ValueError("SHEET_ID не установлен в переменных окружения!")
+        return self._guarded(lambda: self.client().get_file_drive_metadata(self.sheet_id)["modifiedTime"])
+
+    def row_count(self) -> int:
+        """
+        Возвращает текущее число строк листа (размер сетки, включая пустые строки в конце).
+        Метаданные запрашиваются заново: кэшированный объект листа не знает о добавленных строках.
+        """
+        def fetch(worksheet: gspread.Worksheet) -> int:
+            metadata = worksheet.spreadsheet.fetch_sheet_metadata({"includeGridData": "false"})
+            for sheet in metadata["sheets"]:
+                if sheet["properties"]["sheetId"] == worksheet.id:
+                    return sheet["properties"]["gridProperties"]["rowCount"]
+            raise gspread.exceptions.WorksheetNotFound(self.sheet_name)
+
+        return self.call(fetch)
+
+    def call(self, func: Callable[[gspread.Worksheet], T]) -> T:
+        """
+        Выполняет func(worksheet). При ответе 401 авторизуется заново и повторяет вызов один раз.
+        """
+        def attempt() -> T:
+            try:
+                return func(self.worksheet())
+            except gspread.exceptions.APIError as e:
+                if e.response.status_code != 401:
+                    raise
+                self.reset()
+                self.stats["reauth_on_401"] += 1
+                return func(self.worksheet())
+
+        return self._guarded(attempt)
+
+    def _guarded(self, func: Callable[[], T]) -> T:
+        """
+        Выполняет запрос через выключатель, повторяя его при временных ошибках.
+        Пока выключатель разомкнут, запрос не отправляется (CircuitOpenError).
+        """
+        return self.breaker.call(lambda: retry_call(
+            func, self._retries, RETRY_BASE_DELAY, RETRY_MAX_DELAY, on_retry=self._on_retry,
+        ))
+
+    def _on_retry(self, error: BaseException, delay: float) -> None:
+        self.stats["retries"] += 1
+        logger.warning("Временная ошибка Google API, повтор через %.1f с: %s", delay, error)
@@ -0,0 +1,68 @@
+"""
+Модуль для объединения одновременных запросов (single-flight):
+пока запрос с некоторым ключом выполняется, все остальные вызовы с тем же ключом
+ждут его результата вместо того, чтобы выполнять запрос повторно.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, Executor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один.
+    Работает как из потоков, так и из асинхронного кода.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        # Счетчики: сколько запросов выполнено и сколько вызовов присоединились к чужому запросу
+        self.stats: Dict[str, int] = {"originated": 0, "coalesced": 0}
+
+    def _begin(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Возвращает future для ключа и признак того, что вызывающий должен выполнить запрос сам.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.stats["originated"] += 1
+            return future, True
+
+    def _run(self, key: Hashable, future: Future, func: Callable[[], Any]) -> None:
+        """
+        Выполняет запрос и передает результат (или исключение) всем ожидающим.
+        """
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Выполняет func() или ждет результата уже выполняющегося запроса с тем же ключом.
+        """
+        future, leader = self._begin(key)
+        if leader:
+            self._run(key, future, func)
+        return future.result()
+
+    async def do_async(self, key: Hashable, func: Callable[[], Any], executor: Optional[Executor] = None) -> Any:
+        """
+        Асинхронный вариант do(): блокирующая func() выполняется в executor.
+        """
+        future, leader = self._begin(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(executor, self._run, key, future, func)
+        return await asyncio.wrap_future(future)
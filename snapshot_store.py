@@ -0,0 +1,136 @@
+"""
+Модуль для хранения последнего удачного снимка таблицы на диске (SQLite):
+- бот сразу после перезапуска отвечает по сохраненному снимку
+- если Google недоступен, бот продолжает отвечать по последнему снимку
+Рядом с базой (файл <SNAPSHOT_PATH>.idx) снимок сохраняется в столбцовом формате общего
+снимка (shared_index): при запуске он отображается в память, а не строится заново из строк базы.
+База остается для источника sqlite и командной строки.
+"""
+import json
+import logging
+import os
+import sqlite3
+from typing import Optional
+from row_store import ColumnarRowsBuilder
+from serial_index import SerialIndex
+from shared_index import SharedIndexFile, save_shared_index, touch_shared_index
+
+logger = logging.getLogger(__name__)
+
+
+def columns_path(path: str) -> str:
+    """
+    Возвращает путь к столбцовому файлу снимка, который хранится рядом с базой.
+    """
+    return f"{path}.idx"
+
+
+def save_snapshot(index: SerialIndex, path: str, with_columns: bool = True) -> None:
+    """
+    Сохраняет снимок в файл SQLite и, если with_columns, в столбцовый файл рядом с ним.
+    Запись идет во временные файлы, которые затем атомарно подменяют старые.
+    База переводится в режим WAL: обновление времени сверки (touch_snapshot) не блокирует
+    читателей (источник sqlite), и они видят его без переоткрытия базы.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute("CREATE TABLE rows (serial TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID")
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("built_at", repr(index.built_at)),
+            ("checked_at", repr(index.checked_at)),
+            ("revision", index.revision or ""),
+        ])
+        connection.executemany(
+            "INSERT INTO rows VALUES (?, ?)",
+            ((serial, json.dumps(data, ensure_ascii=False)) for serial, data in index.items()),
+        )
+        connection.commit()
+        # Режим WAL включается после записи строк, чтобы они не писались дважды (в журнал и в базу)
+        connection.execute("PRAGMA journal_mode = WAL")
+    finally:
+        connection.close()
+
+    if with_columns:
+        # Столбцовый файл записывается раньше базы: если запись прервется между ними,
+        # при загрузке файлы разойдутся по built_at и снимок будет прочитан из базы
+        save_shared_index(index, columns_path(path))
+    os.replace(tmp_path, path)
+
+
+def touch_snapshot(index: SerialIndex, path: str) -> None:
+    """
+    Обновляет в сохраненном снимке время последней сверки с таблицей и ревизию.
+    Используется, когда данные таблицы не менялись и переписывать их не нужно.
+    """
+    if not os.path.exists(path):
+        save_snapshot(index, path)
+        return
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("UPDATE meta SET value = ? WHERE key = 'checked_at'", (repr(index.checked_at),))
+        connection.execute("UPDATE meta SET value = ? WHERE key = 'revision'", (index.revision or "",))
+        connection.commit()
+    finally:
+        connection.close()
+    # Снимок, сохраненный без столбцового файла (например, прежней версией бота), получает его здесь
+    touch_shared_index(index, columns_path(path))
+
+
+def load_snapshot(path: str) -> Optional[SerialIndex]:
+    """
+    Загружает снимок из файла SQLite.
+    Возвращает None, если файла нет или он поврежден.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+            index = _load_columns(path, float(meta["built_at"]))
+            if index is None:
+                # Строки сразу укладываются в компактное хранилище, без промежуточного словаря
+                builder = ColumnarRowsBuilder()
+                for serial, data in connection.execute("SELECT serial, data FROM rows"):
+                    builder.add_dict(serial, json.loads(data))
+                index = SerialIndex(builder.build(), built_at=float(meta["built_at"]))
+        finally:
+            connection.close()
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        logger.warning("Не удалось загрузить снимок таблицы из %s: %s", path, e)
+        return None
+
+    # Время сверки и ревизия обновляются в базе без перезаписи данных
+    index.revision = meta.get("revision") or None
+    index.checked_at = float(meta["checked_at"])
+    return index
+
+
+def _load_columns(path: str, built_at: float) -> Optional[SerialIndex]:
+    """
+    Отображает в память столбцовый файл снимка. Возвращает None, если файла нет,
+    он поврежден или сохранен для другого снимка, чем база.
+    """
+    columns = columns_path(path)
+    if not os.path.exists(columns):
+        return None
+    try:
+        index = SharedIndexFile(columns).index
+    except (OSError, ValueError) as e:
+        logger.warning("Не удалось отобразить столбцовый файл снимка %s: %s", columns, e)
+        return None
+    if index.built_at != built_at:
+        logger.warning("Столбцовый файл снимка %s не совпадает с базой, снимок загружается из базы", columns)
+        return None
+    return index
@@ -0,0 +1,190 @@
+"""
+Модуль с источником данных SQLite:
+- поиск по первичному ключу (индексированный столбец serial) без загрузки базы в память
+- соединения только для чтения в режиме WAL, по одному на поток
+- формат базы совпадает со снимком таблицы (snapshot_store), поэтому бот может
+  отвечать прямо по файлу SNAPSHOT_PATH, который ведет другой экземпляр бота:
+  замена файла замечается по расписанию, давно не сверявшийся снимок помечается как устаревший
+"""
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from lookup_backend import BackendUnavailableError, LocalLookupBackend
+from serial_index import SerialIndex, normalize_serial
+from settings import get_settings
+from snapshot_store import save_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверяется, что файл базы заменен или изменен (в секундах, 0 - не проверять)
+LOOKUP_DATA_POLL = get_settings().lookup_data_poll
+
+# Запрос одной строки. Текст запроса не меняется, поэтому sqlite3 подготавливает его
+# один раз на соединение и дальше берет из кэша подготовленных выражений
+_SELECT_ROW = "SELECT data FROM rows WHERE serial = ?"
+# Номера с префиксом: диапазон по первичному ключу. Символ U+10FFFF больше любой цифры
+_SELECT_PREFIX = "SELECT serial FROM rows WHERE serial >= ? AND serial < ? ORDER BY serial LIMIT ?"
+
+
+class SqliteBackend(LocalLookupBackend):
+    """
+    Поиск серийных номеров в базе SQLite (таблица rows(serial TEXT PRIMARY KEY, data TEXT)).
+    База открывается только для чтения. Снимок таблицы и база из CSV сохраняются в режиме WAL
+    (snapshot_store.save_snapshot), поэтому обновление времени сверки не блокирует читателей
+    и видно им сразу. Новый снимок записывается в другой файл, который атомарно заменяет
+    старый; открытые соединения читают старый файл, поэтому раз в poll секунд reload()
+    проверяет файл и переоткрывает базу.
+    max_staleness - возраст данных (по meta.checked_at), после которого ответы помечаются
+    как возможно устаревшие; None - данные не устаревают (например, база из CSV файла).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, poll: float = LOOKUP_DATA_POLL, max_staleness: Optional[float] = None):
+        self.path = path
+        self._poll = poll
+        self._max_staleness = max_staleness
+        self._local = threading.local()
+        # Все открытые соединения (по одному на поток), чтобы close() закрыл и соединения пула потоков
+        self._connections: Set[sqlite3.Connection] = set()
+        self._lock = threading.Lock()
+        # Номер поколения соединений: после reload() потоки открывают базу заново
+        self._generation = 0
+        self._rows = 0
+        # Устройство, inode и время изменения открытого файла
+        self._file_id: Optional[Tuple[int, int, int]] = None
+
+    @property
+    def refresh_interval(self) -> Optional[float]:
+        return self._poll or None
+
+    def _stat(self) -> Tuple[int, int, int]:
+        stat = os.stat(self.path)
+        return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only = ON")
+        with self._lock:
+            self._connections.add(connection)
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Возвращает соединение текущего потока.
+        """
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            old = getattr(local, "connection", None)
+            if old is not None:
+                with self._lock:
+                    self._connections.discard(old)
+                old.close()
+            local.connection = self._connect()
+            local.generation = self._generation
+        return local.connection
+
+    def start(self) -> None:
+        if not os.path.exists(self.path):
+            raise ValueError(f"Файл базы SQLite не найден: {self.path}")
+        self._file_id = self._stat()
+        self._rows = self._connection().execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        logger.info("Источник данных SQLite %s: %d строк", self.path, self._rows)
+
+    def reload(self) -> None:
+        """
+        Переоткрывает базу, если файл заменен или изменен (например, снимок таблицы,
+        который сохранил другой экземпляр бота). Если файла нет, работа продолжается со старым.
+        """
+        try:
+            file_id = self._stat()
+        except FileNotFoundError:
+            raise BackendUnavailableError(f"Файл базы SQLite не найден: {self.path}") from None
+        if file_id == self._file_id:
+            return
+        self._generation += 1
+        self.start()
+
+    def _fetch(self, key: str) -> Optional[Dict[str, str]]:
+        row = self._connection().execute(_SELECT_ROW, (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def find_existing(self, keys: Iterable[str]) -> List[str]:
+        """
+        Проверяет номера одним запросом по первичному ключу.
+        """
+        keys = list(keys)
+        if not keys:
+            return []
+        query = f"SELECT serial FROM rows WHERE serial IN ({', '.join('?' * len(keys))})"
+        found = {serial for serial, in self._connection().execute(query, keys)}
+        return [key for key in keys if key in found]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        prefix = normalize_serial(prefix)
+        rows = self._connection().execute(_SELECT_PREFIX, (prefix, prefix + "\U0010ffff", limit))
+        return [serial for serial, in rows]
+
+    def snapshot_age(self) -> Optional[float]:
+        try:
+            meta = dict(self._connection().execute("SELECT key, value FROM meta"))
+        except sqlite3.Error:
+            return None
+        if "checked_at" not in meta:
+            return None
+        return time.time() - float(meta["checked_at"])
+
+    def is_stale(self) -> bool:
+        if self._max_staleness is None:
+            return False
+        age = self.snapshot_age()
+        return age is not None and age > self._max_staleness
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            connection.close()
+        # Потоки, которые снова обратятся к базе, откроют новые соединения
+        self._generation += 1
+
+    def __len__(self) -> int:
+        return self._rows
+
+
+def import_csv(csv_path: str, db_path: str, serial_column: int = 1, ignore_columns: Iterable[int] = ()) -> int:
+    """
+    Строит базу SQLite для SqliteBackend из CSV файла (первая строка - заголовки).
+    Возвращает число записанных серийных номеров.
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        index = SerialIndex.from_values(list(csv.reader(file, dialect)), serial_column, ignore_columns)
+    # Базу читает только источник sqlite, столбцовый файл для загрузки в память не нужен
+    save_snapshot(index, db_path, with_columns=False)
+    return len(index)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Импорт CSV файла в базу SQLite для LOOKUP_BACKEND=sqlite")
+    parser.add_argument("csv_path", help="CSV файл (первая строка - заголовки)")
+    parser.add_argument("db_path", help="Файл базы SQLite")
+    parser.add_argument("--serial-column", type=int, default=1, help="Номер столбца с серийными номерами (1-based)")
+    parser.add_argument("--ignore-columns", default="", help="Номера столбцов через запятую, которые не выводятся")
+    args = parser.parse_args()
+
+    ignored = {int(col.strip()) for col in args.ignore_columns.split(",") if col.strip()}
+    count = import_csv(args.csv_path, args.db_path, args.serial_column, ignored)
+    print(f"Записано серийных номеров: {count}")
@@ -0,0 +1,74 @@
+"""
+Модуль для подсказок "Возможно, вы имели в виду" по номерам с опечаткой:
+- кандидаты - замена одной цифры и перестановка соседних цифр
+- кандидаты с неверной контрольной суммой по алгоритму Луна отбрасываются без перебора
+- наличие кандидатов в снимке проверяется одним пакетом
+"""
+from typing import List
+from settings import get_settings
+
+MAX_SUGGESTIONS = get_settings().max_suggestions  # Сколько подсказок показывать пользователю (0 - не показывать)
+
+# Вклад цифры в сумму Луна: на четных позициях справа (с нуля) цифра как есть, на нечетных - удвоенная
+_CONTRIBUTION = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (0, 2, 4, 6, 8, 1, 3, 5, 7, 9),
+)
+# Обратные таблицы: вклад -> цифра (обе таблицы - перестановки цифр)
+_DIGIT_FOR = tuple(
+    tuple(table.index(contribution) for contribution in range(10))
+    for table in _CONTRIBUTION
+)
+
+
+def luhn_corrections(serial: str) -> List[str]:
+    """
+    Возвращает номера, которые получаются из serial заменой одной цифры или
+    перестановкой двух соседних цифр и проходят проверку по алгоритму Луна.
+    Сначала идут перестановки (самая частая опечатка), затем замены по позициям.
+
+    Для замены на каждой позиции есть ровно одна подходящая цифра, поэтому она
+    вычисляется по обратной таблице, а не подбирается. Если контрольная сумма
+    serial верна, замен нет (алгоритм Луна обнаруживает любую замену одной цифры),
+    остаются только незаметные для него перестановки вроде 09 <-> 90.
+    """
+    digits = [int(char) for char in serial]
+    length = len(digits)
+    parities = [(length - 1 - position) % 2 for position in range(length)]
+    contributions = [_CONTRIBUTION[parity][digit] for parity, digit in zip(parities, digits)]
+    checksum = sum(contributions) % 10
+
+    candidates = []
+    for position in range(length - 1):
+        first, second = digits[position], digits[position + 1]
+        if first == second:
+            continue
+        delta = (
+            _CONTRIBUTION[parities[position]][second] + _CONTRIBUTION[parities[position + 1]][first]
+            - contributions[position] - contributions[position + 1]
+        )
+        if (checksum + delta) % 10 == 0:
+            swapped = digits[:]
+            swapped[position], swapped[position + 1] = second, first
+            candidates.append(''.join(map(str, swapped)))
+
+    if checksum:
+        text = ''.join(map(str, digits))
+        for position in range(length):
+            digit = _DIGIT_FOR[parities[position]][(contributions[position] - checksum) % 10]
+            candidates.append(f"{text[:position]}{digit}{text[position + 1:]}")
+    return candidates
+
+
+def suggest_serials(serial: str, index, limit: int = MAX_SUGGESTIONS) -> List[str]:
+    """
+    Возвращает до limit нормализованных номеров из снимка, похожих на serial.
+
+    Args:
+        serial: Нормализованный номер (только цифры), который не прошел проверку или не найден
+        index: Снимок или локальный источник с методом find_existing(keys)
+        limit: Максимальное число подсказок
+    """
+    if limit <= 0 or not serial.isdigit():
+        return []
+    return index.find_existing(luhn_corrections(serial))[:limit]
@@ -1,9 +1,48 @@
 """
-Тесты для модуля алгоритма Луна и работы с серийными номерами.
+Тесты бота для проверки серийных номеров: алгоритм Луна и разбор номеров, снимок таблицы
+и синхронизация с Google Sheets, источники данных, обработчики бота (подсказки, inline режим,
+пакетный поиск, /reload), ограничение частоты запросов, метрики, webhook и обновление данных.
 """
+import os
+import asyncio
+import csv
+import io
+import sqlite3
+import threading
+import time
 import pytest
-from luhn_algorithm import validate_luhn_checksum, add_valid_luhn_checksum
-from serial_number import parse_serial_number
+import luhn_algorithm
+from luhn_algorithm import validate_luhn_checksum, add_valid_luhn_checksum, validate_luhn_checksums, add_valid_luhn_checksums
+from serial_number import format_serial_number, parse_serial_number, parse_serial_numbers, split_serial_candidates
+from suggestions import luhn_corrections, suggest_serials
+from inline_mode import QueryDebouncer, inline_results
+from serial_index import SerialIndex
+from row_store import ColumnarRows, ColumnarRowsBuilder
+import gspread
+import requests
+import sheets_client
+from sheets_client import SheetClient
+import google_sheets
+from single_flight import SingleFlight
+from resilience import CircuitBreaker, CircuitOpenError, backoff_delay, retry_call
+from sheet_sync import GspreadSheetSource, SheetSync
+from sheet_federation import FederatedSync, SheetSourceConfig, parse_sheet_sources
+from lru import LRUCache
+from bloom import BloomFilter
+from bulk_lookup import bulk_lookup, extract_serials_from_file
+from aiohttp.test_utils import TestClient, TestServer
+from webhook import create_web_app, SECRET_HEADER
+from rate_limit import TokenBucket, RateLimiter, FairScheduler, rate_limited, THROTTLED_REPLY
+import metrics
+from metrics import Registry, Counter, Histogram, Gauge, LOOKUPS
+from snapshot_store import columns_path, load_snapshot, save_snapshot, touch_snapshot
+from lookup_backend import BackendUnavailableError, create_backend
+from sqlite_backend import SqliteBackend, import_csv
+from csv_backend import CsvBackend
+from settings import Settings, load_settings
+from index_refresh import IndexRefresher, add_refresh_route, REFRESH_TOKEN_HEADER
+from shared_index import SharedIndexBackend, SharedIndexFile, refresh_request_path, run_loader, save_shared_index, touch_shared_index
+import cli
 
 
 class TestValidateLuhnChecksum:
@@ -163,6 +202,45 @@ class TestAddValidLuhnChecksum:
             assert validate_luhn_checksum(result) == True
 
 
+class TestLuhnBatch:
+    """Тесты для пакетных функций алгоритма Луна."""
+    
+    NUMBERS = ['4532549385285775', '4532549385285774', '79927398713', '79927398712', '', '12a4', '490154203237518']
+    EXPECTED = [True, False, True, False, True, False, True]
+    
+    @pytest.fixture(params=["numpy", "python"])
+    def backend(self, request, monkeypatch):
+        if request.param == "numpy":
+            pytest.importorskip("numpy")
+        else:
+            monkeypatch.setattr(luhn_algorithm, "np", None)
+        return request.param
+    
+    def test_validate_batch(self, backend):
+        """Тест пакетной проверки номеров разной длины."""
+        assert validate_luhn_checksums(self.NUMBERS) == self.EXPECTED
+    
+    def test_validate_batch_matches_single(self, backend):
+        """Тест что пакетная проверка совпадает с поштучной."""
+        numbers = [add_valid_luhn_checksum(f"{n:011d}") for n in range(0, 10 ** 11, 10 ** 11 // 97)]
+        numbers += [number[:-1] + str((int(number[-1]) + 1) % 10) for number in numbers]
+        assert validate_luhn_checksums(numbers) == [validate_luhn_checksum(number) for number in numbers]
+    
+    def test_add_batch(self, backend):
+        """Тест пакетного добавления контрольной цифры."""
+        partials = ['453254938528577', '7992739871', '3000803640552']
+        assert add_valid_luhn_checksums(partials) == [add_valid_luhn_checksum(p) for p in partials]
+    
+    def test_unicode_digits(self):
+        """Тест цифр других алфавитов."""
+        assert validate_luhn_checksum('٧٩٩٢٧٣٩٨٧١٣') == True
+    
+    def test_non_digit_raises(self):
+        """Тест что нецифровые символы в одиночной проверке вызывают ошибку."""
+        with pytest.raises(ValueError):
+            validate_luhn_checksum('12a4')
+
+
 class TestParseSerialNumber:
     """Тесты для метода parse_serial_number."""
     
@@ -277,3 +355,1979 @@ class TestParseSerialNumber:
         assert len(parts[1]) == 4
         assert len(parts[2]) == 4
         assert result == f"{valid_serial[0:4]}-{valid_serial[4:8]}-{valid_serial[8:12]}"
+
+
+SAMPLE_VALUES = [
+    ['Серийный номер', 'Дата производства', 'Производитель', '_internal_note', 'Модель'],
+    ['012345678912', '2026-01-01', 'Вася Иванов', 'секрет', 'Сатурн'],
+    ['0123-4567-8913', '2026-01-02', ' Петя Петров ', '', 'Юпитер'],
+    ['012345678912', '2026-01-03', 'Дубликат', '', 'Марс'],
+    [],
+]
+
+
+class TestSerialIndex:
+    """Тесты для индекса серийных номеров."""
+    
+    def test_lookup_projects_visible_columns(self):
+        """Тест поиска: столбец с номером и столбцы на _ не выводятся."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        assert index.get('0123-4567-8912') == {
+            'Дата производства': '2026-01-01',
+            'Производитель': 'Вася Иванов',
+            'Модель': 'Сатурн',
+        }
+    
+    def test_lookup_normalizes_cells_and_values(self):
+        """Тест нормализации серийных номеров в таблице и значений ячеек."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        assert index.get('012345678913')['Производитель'] == 'Петя Петров'
+    
+    def test_first_duplicate_wins(self):
+        """Тест что при дубликатах используется первая строка."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        assert index.get('012345678912')['Модель'] == 'Сатурн'
+        assert len(index) == 2
+    
+    def test_ignore_columns(self):
+        """Тест игнорирования столбцов из IGNORE_COLUMNS."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1, ignore_columns={2, 5})
+        assert index.get('012345678912') == {'Производитель': 'Вася Иванов'}
+    
+    def test_not_found(self):
+        """Тест отсутствующего серийного номера."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        assert index.get('999999999999') is None
+        assert '999999999999' not in index
+    
+    def test_empty_sheet(self):
+        """Тест пустой таблицы."""
+        assert len(SerialIndex.from_values([], serial_column=1)) == 0
+    
+    def test_serial_column_out_of_range(self):
+        """Тест столбца с серийными номерами за пределами таблицы."""
+        with pytest.raises(ValueError):
+            SerialIndex.from_values(SAMPLE_VALUES, serial_column=10)
+
+
+class TestRowStore:
+    """Тесты для столбцового хранилища строк."""
+    
+    def test_packed_and_other_keys(self):
+        """Тест поиска 12-значных номеров и номеров другой длины."""
+        builder = ColumnarRowsBuilder()
+        builder.add_dict('000000000002', {'Модель': 'Марс'})
+        builder.add_dict('ABC-1', {'Модель': 'Венера'})
+        builder.add_dict('000000000001', {'Модель': 'Сатурн'})
+        rows = builder.build()
+        assert rows.get('000000000001') == {'Модель': 'Сатурн'}
+        assert rows.get('000000000002') == {'Модель': 'Марс'}
+        assert rows.get('ABC-1') == {'Модель': 'Венера'}
+        assert rows.get('000000000003') is None
+        assert list(rows.keys()) == ['000000000001', '000000000002', 'ABC-1']
+        assert len(rows) == 3
+    
+    def test_first_duplicate_wins(self):
+        """Тест что при дубликатах сохраняется первая строка."""
+        builder = ColumnarRowsBuilder()
+        assert builder.add_dict('000000000001', {'Модель': 'Сатурн'})
+        assert not builder.add_dict('000000000001', {'Модель': 'Марс'})
+        assert builder.build().get('000000000001') == {'Модель': 'Сатурн'}
+    
+    def test_mixed_schemas(self):
+        """Тест строк с разными заголовками (объединение нескольких таблиц)."""
+        source = {
+            '000000000001': {'Модель': 'Сатурн', 'Цвет': ''},
+            '000000000002': {'Производитель': 'Вася Иванов'},
+            '000000000003': {'Цвет': 'Синий', 'Модель': 'Марс'},
+        }
+        rows = ColumnarRows.from_dict(source)
+        assert dict(rows.items()) == source
+        assert list(rows.get('000000000003')) == ['Цвет', 'Модель']
+    
+    def test_keys_with_prefix(self):
+        """Тест поиска номеров по префиксу."""
+        builder = ColumnarRowsBuilder()
+        for key in ['123400000001', '123499999999', '123500000000', '012340000000', '1234-A']:
+            builder.add_dict(key, {'Модель': key})
+        rows = builder.build()
+        assert rows.keys_with_prefix('1234', 10) == ['123400000001', '123499999999', '1234-A']
+        assert rows.keys_with_prefix('1234', 1) == ['123400000001']
+        assert rows.keys_with_prefix('123500000000', 10) == ['123500000000']
+        assert rows.keys_with_prefix('', 2) == ['012340000000', '123400000001']
+        assert rows.keys_with_prefix('9', 10) == []
+    
+    def test_memory_stats(self):
+        """Тест что столбцовое хранение занимает меньше памяти, чем словарь словарей."""
+        index = SerialIndex.from_values(
+            [['Серийный номер', 'Модель', 'Партия']]
+            + [[f"{n:012d}", f"Модель {n % 5}", f"Партия {n // 100}"] for n in range(1000)],
+            serial_column=1,
+        )
+        stats = index.memory_stats()
+        assert stats['rows'] == 1000
+        assert stats['saved_bytes'] == stats['dict_estimate_bytes'] - stats['compact_bytes'] > 0
+
+
+class _FakeCredentials:
+    """Фейковые credentials: токен всегда валиден."""
+    valid = True
+
+
+class _FakeWorksheet:
+    """Фейковый лист, который возвращает SAMPLE_VALUES."""
+    
+    def get_all_values(self):
+        return SAMPLE_VALUES
+
+
+class _FakeSpreadsheet:
+    def worksheet(self, name):
+        return _FakeWorksheet()
+
+
+class _FakeGspreadClient:
+    def __init__(self, auth, session=None):
+        self.session = session
+        self.timeout = None
+    
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+    
+    def open_by_key(self, key):
+        return _FakeSpreadsheet()
+
+
+class _FakeResponse:
+    def __init__(self, status_code=401, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+    
+    def json(self):
+        return {"error": {"code": self.status_code, "message": "Error", "status": "ERROR"}}
+
+
+class TestSheetClient:
+    """Тесты для долгоживущего клиента Google Sheets."""
+    
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(sheets_client.gspread, "Client", _FakeGspreadClient)
+        monkeypatch.setattr(sheets_client, "AuthorizedSession", lambda credentials, **kwargs: sheets_client.requests.Session())
+        return SheetClient(_FakeCredentials, "sheet-id", "Sheet1")
+    
+    def test_authorizes_once(self, client):
+        """Тест что сессия и лист переиспользуются между вызовами."""
+        for _ in range(5):
+            assert client.call(lambda worksheet: worksheet.get_all_values()) == SAMPLE_VALUES
+        assert client.stats["authorizations"] == 1
+        assert client.stats["worksheet_opens"] == 1
+        assert client.stats["token_refreshes"] == 0
+
+    def test_token_refresh_has_timeout(self, monkeypatch):
+        """Тест что запрос нового токена ограничен таймаутом клиента."""
+        requests_made = []
+
+        class _ExpiredCredentials:
+            valid = False
+
+            def refresh(self, request):
+                requests_made.append(request)
+                self.valid = True
+
+        monkeypatch.setattr(sheets_client.gspread, "Client", _FakeGspreadClient)
+        monkeypatch.setattr(sheets_client, "AuthorizedSession",
+                            lambda credentials, **kwargs: requests_made.append(kwargs) or sheets_client.requests.Session())
+        client = SheetClient(_ExpiredCredentials, "sheet-id", "Sheet1", timeout=3)
+        client.client()
+        session_kwargs, refresh_request = requests_made
+        assert session_kwargs == {"refresh_timeout": 3}
+        assert refresh_request.keywords == {"timeout": 3}
+        assert client.stats["token_refreshes"] == 1
+
+    def test_reauthorizes_on_401(self, client):
+        """Тест повторной авторизации после ответа 401."""
+        calls = []
+        
+        def func(worksheet):
+            calls.append(worksheet)
+            if len(calls) == 1:
+                raise gspread.exceptions.APIError(_FakeResponse())
+            return worksheet.get_all_values()
+        
+        assert client.call(func) == SAMPLE_VALUES
+        assert client.stats["reauth_on_401"] == 1
+        assert client.stats["authorizations"] == 2
+
+
+def _api_error(status_code, headers=None):
+    return gspread.exceptions.APIError(_FakeResponse(status_code, headers))
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestResilience:
+    """Тесты для повторов запросов и автоматического выключателя."""
+    
+    def _flaky(self, errors, result="ok"):
+        """Функция, которая сначала выбрасывает ошибки из errors, затем возвращает result."""
+        errors = list(errors)
+        calls = []
+        
+        def func():
+            calls.append(1)
+            if errors:
+                raise errors.pop(0)
+            return result
+        return func, calls
+    
+    def test_retries_quota_and_server_errors(self):
+        """Тест повторов при 429 и 5xx."""
+        func, calls = self._flaky([_api_error(429), _api_error(503)])
+        delays = []
+        assert retry_call(func, retries=3, base_delay=0.5, max_delay=10, sleep=delays.append) == "ok"
+        assert len(calls) == 3
+        assert len(delays) == 2 and all(0 <= delay <= 10 for delay in delays)
+    
+    def test_does_not_retry_client_errors(self):
+        """Тест что ошибки вроде 404 не повторяются."""
+        func, calls = self._flaky([_api_error(404)])
+        with pytest.raises(gspread.exceptions.APIError):
+            retry_call(func, retries=3, base_delay=0.5, max_delay=10, sleep=lambda delay: None)
+        assert len(calls) == 1
+    
+    def test_gives_up_after_retries(self):
+        """Тест что после исчерпания повторов выбрасывается последняя ошибка."""
+        func, calls = self._flaky([_api_error(500)] * 5)
+        with pytest.raises(gspread.exceptions.APIError):
+            retry_call(func, retries=2, base_delay=0.5, max_delay=10, sleep=lambda delay: None)
+        assert len(calls) == 3
+    
+    def test_retry_after_header(self):
+        """Тест что задержка не меньше Retry-After, но не больше max_delay."""
+        delays = []
+        func, _ = self._flaky([_api_error(429, {"Retry-After": "7"}), _api_error(429, {"Retry-After": "100"})])
+        retry_call(func, retries=2, base_delay=0.01, max_delay=30, sleep=delays.append)
+        assert delays == [7, 30]
+    
+    def test_backoff_grows_exponentially(self):
+        """Тест границ задержки: base * 2 ** attempt, но не больше max_delay."""
+        assert all(0 <= backoff_delay(3, 0.5, 100) <= 4 for _ in range(100))
+        assert all(backoff_delay(20, 0.5, 10) <= 10 for _ in range(100))
+    
+    def test_breaker_opens_and_recovers(self):
+        """Тест размыкания после серии сбоев и восстановления после пробного запроса."""
+        clock = _FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        for _ in range(2):
+            with pytest.raises(gspread.exceptions.APIError):
+                breaker.call(self._flaky([_api_error(503)])[0])
+        assert breaker.state == CircuitBreaker.OPEN
+        
+        func, calls = self._flaky([])
+        with pytest.raises(CircuitOpenError):
+            breaker.call(func)
+        assert calls == []
+        assert breaker.stats == {"opened": 1, "rejected": 1, "failures": 2}
+        
+        clock.now = 31
+        assert breaker.call(func) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_failed_probe_reopens(self):
+        """Тест что сбой пробного запроса снова размыкает выключатель."""
+        clock = _FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        with pytest.raises(requests.exceptions.Timeout):
+            breaker.call(self._flaky([requests.exceptions.Timeout()])[0])
+        clock.now = 31
+        with pytest.raises(requests.exceptions.Timeout):
+            breaker.call(self._flaky([requests.exceptions.Timeout()])[0])
+        assert breaker.state == CircuitBreaker.OPEN
+        clock.now = 40
+        with pytest.raises(CircuitOpenError):
+            breaker.call(self._flaky([])[0])
+    
+    def test_client_errors_do_not_open_breaker(self):
+        """Тест что ответы вроде 404 (сервис работает) не размыкают выключатель."""
+        breaker = CircuitBreaker(failure_threshold=1)
+        with pytest.raises(gspread.exceptions.APIError):
+            breaker.call(self._flaky([_api_error(404)])[0])
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_sheet_client_retries_and_opens_breaker(self, monkeypatch):
+        """Тест повторов и выключателя в SheetClient."""
+        monkeypatch.setattr(sheets_client.gspread, "Client", _FakeGspreadClient)
+        monkeypatch.setattr(sheets_client, "AuthorizedSession", lambda credentials, **kwargs: sheets_client.requests.Session())
+        monkeypatch.setattr(sheets_client, "RETRY_BASE_DELAY", 0)
+        breaker = CircuitBreaker(failure_threshold=1)
+        client = SheetClient(_FakeCredentials, "sheet-id", "Sheet1", timeout=2.5, retries=2, breaker=breaker)
+        
+        func, calls = self._flaky([_api_error(503)], result=SAMPLE_VALUES)
+        assert client.call(lambda worksheet: func()) == SAMPLE_VALUES
+        assert client.stats["retries"] == 1
+        assert client.client().timeout == 2.5
+        
+        func, calls = self._flaky([_api_error(503)] * 3)
+        with pytest.raises(gspread.exceptions.APIError):
+            client.call(lambda worksheet: func())
+        assert len(calls) == 3
+        with pytest.raises(CircuitOpenError):
+            client.call(lambda worksheet: func())
+        assert len(calls) == 3
+    
+    def test_bot_reports_unavailable_backend(self, monkeypatch):
+        """Тест что пользователь получает понятный ответ без текста внутренней ошибки."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        class _Backend:
+            async def get_index(self):
+                raise BackendUnavailableError("APIError: [503]: secret details")
+        
+        monkeypatch.setattr(bot, "backend", _Backend())
+        update = _FakeUpdate(1)
+        update.message.text = add_valid_luhn_checksum('01234567891')
+        asyncio.run(bot.handle_message(update, None))
+        assert update.message.replies == [bot.UNAVAILABLE_REPLY]
+
+
+class TestAsyncLookup:
+    """Тесты для асинхронного поиска по серийному номеру."""
+    
+    @pytest.fixture(autouse=True)
+    def reset_index(self, monkeypatch):
+        monkeypatch.setattr(google_sheets, "_index", None)
+        monkeypatch.setattr(google_sheets, "SNAPSHOT_PATH", "")
+    
+    def test_cold_lookup_runs_in_executor(self, monkeypatch):
+        """Тест что загрузка снимка не выполняется в потоке цикла событий."""
+        threads = []
+        
+        def fake_fetch():
+            threads.append(threading.current_thread())
+            return SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        
+        monkeypatch.setattr(google_sheets, "_fetch_index", fake_fetch)
+        data = asyncio.run(google_sheets.get_data_by_serial_number_async('0123-4567-8912'))
+        assert data['Модель'] == 'Сатурн'
+        assert threads and threads[0] is not threading.main_thread()
+    
+    def test_concurrent_lookups(self, monkeypatch):
+        """Тест нескольких одновременных запросов."""
+        monkeypatch.setattr(google_sheets, "_fetch_index",
+                            lambda: SerialIndex.from_values(SAMPLE_VALUES, serial_column=1))
+        
+        async def lookup_all():
+            return await asyncio.gather(
+                google_sheets.get_data_by_serial_number_async('012345678912'),
+                google_sheets.get_data_by_serial_number_async('012345678913'),
+                google_sheets.get_data_by_serial_number_async('999999999999'),
+            )
+        
+        first, second, missing = asyncio.run(lookup_all())
+        assert first['Модель'] == 'Сатурн'
+        assert second['Модель'] == 'Юпитер'
+        assert missing is None
+    
+    def test_concurrent_cold_lookups_fetch_once(self, monkeypatch):
+        """Тест что одновременные запросы при пустом снимке скачивают лист один раз."""
+        monkeypatch.setattr(google_sheets, "_fetch_flight", SingleFlight())
+        fetches = []
+        
+        def slow_fetch():
+            fetches.append(1)
+            threading.Event().wait(0.05)
+            return SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        
+        monkeypatch.setattr(google_sheets, "_fetch_index", slow_fetch)
+        
+        async def lookup_all():
+            return await asyncio.gather(*[
+                google_sheets.get_data_by_serial_number_async('012345678912') for _ in range(10)
+            ])
+        
+        results = asyncio.run(lookup_all())
+        assert all(data['Модель'] == 'Сатурн' for data in results)
+        assert len(fetches) == 1
+        assert google_sheets.get_fetch_stats() == {"originated": 1, "coalesced": 9}
+    
+    @staticmethod
+    def _open_circuit():
+        raise CircuitOpenError(30)
+    
+    def test_unavailable_without_snapshot(self, monkeypatch):
+        """Тест что без снимка недоступность Google превращается в BackendUnavailableError."""
+        monkeypatch.setattr(google_sheets, "_fetch_index", self._open_circuit)
+        with pytest.raises(BackendUnavailableError):
+            asyncio.run(google_sheets.get_index_async())
+    
+    def test_open_circuit_keeps_snapshot(self, monkeypatch):
+        """Тест что при разомкнутом выключателе бот отвечает по последнему снимку."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        monkeypatch.setattr(google_sheets, "_index", index)
+        monkeypatch.setattr(google_sheets, "_fetch_index", self._open_circuit)
+        with pytest.raises(CircuitOpenError):
+            google_sheets.refresh_index()
+        assert asyncio.run(google_sheets.get_index_async()) is index
+    
+    def test_backend_reload_reports_open_circuit(self, monkeypatch):
+        """Тест что обновление при разомкнутом выключателе сообщает о недоступности источника."""
+        monkeypatch.setattr(google_sheets, "_index", SerialIndex.from_values(SAMPLE_VALUES, serial_column=1))
+        monkeypatch.setattr(google_sheets, "_fetch_index", self._open_circuit)
+        with pytest.raises(BackendUnavailableError):
+            google_sheets.SheetsBackend().reload()
+
+
+class TestSingleFlight:
+    """Тесты для объединения одновременных запросов."""
+    
+    def test_threads_share_one_call(self):
+        """Тест что потоки с одинаковым ключом ждут один запрос."""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            return 42
+        
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", func)))
+        leader.start()
+        started.wait(1)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", func))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        while flight.stats["coalesced"] < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(1)
+        
+        assert results == [42, 42, 42, 42]
+        assert len(calls) == 1
+        assert flight.stats == {"originated": 1, "coalesced": 3}
+    
+    def test_exception_is_shared_and_key_released(self):
+        """Тест что ошибка передается ожидающим, а следующий вызов выполняется заново."""
+        flight = SingleFlight()
+        
+        def fail():
+            raise ValueError("boom")
+        
+        with pytest.raises(ValueError):
+            flight.do("key", fail)
+        assert flight.do("key", lambda: "ok") == "ok"
+        assert flight.stats["originated"] == 2
+
+
+class _FakeSheetSource:
+    """Фейковый источник данных для синхронизации."""
+    
+    def __init__(self, values, revision="r1"):
+        self.values = values
+        self.revision = revision
+        self.downloads = 0
+        # Ошибки, которые выбрасываются при следующих проверках ревизии
+        self.errors = []
+    
+    def get_revision(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.revision is None:
+            raise RuntimeError("Drive API недоступен")
+        return self.revision
+    
+    def iter_chunks(self, chunk_rows=3):
+        self.downloads += 1
+        values = [list(row) for row in self.values]
+        for start in range(0, len(values), chunk_rows):
+            yield values[start:start + chunk_rows]
+
+
+class _FakeRangeWorksheet:
+    """Фейковый лист, который отдает значения по диапазону строк."""
+    
+    def __init__(self, values, requested):
+        self.values = values
+        self.requested = requested
+    
+    def get_values(self, range_name):
+        first, last = (int(bound) for bound in range_name.split(":"))
+        self.requested.append((first, last))
+        if first == 1:
+            # Первый диапазон отвечает медленнее остальных
+            time.sleep(0.01)
+        return [list(row) for row in self.values[first - 1:last]]
+
+
+class _FakeRangeClient:
+    """Фейковый SheetClient для постраничного скачивания."""
+    
+    def __init__(self, values):
+        self.values = values
+        self.requested = []
+    
+    def row_count(self):
+        # Размер сетки больше числа заполненных строк
+        return len(self.values) + 7
+    
+    def call(self, func):
+        return func(_FakeRangeWorksheet(self.values, self.requested))
+
+
+class TestChunkedSheetSource:
+    """Тесты для постраничного скачивания листа."""
+    
+    def _values(self, rows):
+        return [['Серийный номер', 'Модель']] + [[f"{n:012d}", f"Модель {n}"] for n in range(rows)]
+    
+    def test_chunks_are_ordered_and_cover_sheet(self):
+        """Тест что диапазоны покрывают лист и приходят по порядку при параллельном скачивании."""
+        values = self._values(23)
+        client = _FakeRangeClient(values)
+        chunks = list(GspreadSheetSource(client, chunk_rows=5, parallelism=3).iter_chunks())
+        assert [row for chunk in chunks for row in chunk] == values
+        assert sorted(client.requested) == [(1, 5), (6, 10), (11, 15), (16, 20), (21, 25), (26, 30), (31, 31)]
+    
+    def test_sync_builds_index_from_chunks(self):
+        """Тест построения снимка из постраничных данных."""
+        client = _FakeRangeClient(self._values(23))
+        source = GspreadSheetSource(client, chunk_rows=5, parallelism=2)
+        source.get_revision = lambda: "r1"
+        index = SheetSync(source, serial_column=1, block_rows=4).sync(None)
+        assert len(index) == 23
+        assert index.get('000000000022') == {'Модель': 'Модель 22'}
+    
+    def test_closing_stops_fetching(self):
+        """Тест что при прерванном чтении оставшиеся диапазоны не скачиваются."""
+        client = _FakeRangeClient(self._values(100))
+        chunks = GspreadSheetSource(client, chunk_rows=5, parallelism=2).iter_chunks()
+        next(chunks)
+        chunks.close()
+        assert len(client.requested) <= 3
+
+
+class TestSheetSync:
+    """Тесты для инкрементальной синхронизации снимка."""
+    
+    def _values(self, rows):
+        return [['Серийный номер', 'Модель']] + [[f"{n:012d}", f"Модель {n}"] for n in range(rows)]
+    
+    def test_unchanged_revision_skips_download(self):
+        """Тест что при той же ревизии лист не скачивается."""
+        source = _FakeSheetSource(self._values(10))
+        sync = SheetSync(source, serial_column=1, block_rows=4)
+        index = sync.sync(None)
+        assert sync.sync(index) is index
+        assert source.downloads == 1
+        assert sync.stats["unchanged"] == 1
+    
+    def test_changed_block_is_counted(self):
+        """Тест что после изменения ревизии лист скачивается целиком, а изменившиеся блоки подсчитываются."""
+        source = _FakeSheetSource(self._values(10))
+        sync = SheetSync(source, serial_column=1, block_rows=4)
+        index = sync.sync(None)
+        assert sync.stats["blocks_changed"] == 3
+        
+        source.values[6][1] = 'Новая модель'
+        source.revision = "r2"
+        new_index = sync.sync(index)
+        assert new_index.get('000000000005') == {'Модель': 'Новая модель'}
+        assert new_index.get('000000000009') == {'Модель': 'Модель 9'}
+        assert new_index.revision == "r2"
+        assert sync.stats["blocks_changed"] == 4
+        assert sync.stats["blocks_unchanged"] == 2
+        # Старый снимок не изменился
+        assert index.get('000000000005') == {'Модель': 'Модель 5'}
+    
+    def test_header_change_rebuilds_everything(self):
+        """Тест что при изменении заголовков все блоки считаются изменившимися."""
+        source = _FakeSheetSource(self._values(10))
+        sync = SheetSync(source, serial_column=1, block_rows=4)
+        index = sync.sync(None)
+        source.values[0][1] = 'Изделие'
+        source.revision = "r2"
+        new_index = sync.sync(index)
+        assert new_index.get('000000000001') == {'Изделие': 'Модель 1'}
+        assert sync.stats["blocks_unchanged"] == 0
+    
+    def test_without_revision_always_downloads(self):
+        """Тест что без Drive API лист скачивается при каждой синхронизации."""
+        source = _FakeSheetSource(self._values(3), revision=None)
+        sync = SheetSync(source, serial_column=1)
+        index = sync.sync(None)
+        sync.sync(index)
+        assert source.downloads == 2
+    
+    def test_transient_revision_error_keeps_check(self):
+        """Тест что после временного сбоя Drive API проверка ревизии продолжает работать."""
+        source = _FakeSheetSource(self._values(3))
+        source.errors = [requests.exceptions.Timeout("Drive API"), _api_error(503)]
+        sync = SheetSync(source, serial_column=1)
+        index = sync.sync(None)
+        assert sync.sync(index) is index
+        # Ревизия снова получена: лист скачивается один раз, чтобы запомнить ее, дальше не скачивается
+        for _ in range(3):
+            assert sync.sync(index) is index
+        assert sync.stats["downloads"] == 3 and sync.stats["unchanged"] == 2
+    
+    def test_permanent_revision_error_disables_check(self):
+        """Тест что без доступа к Drive API проверка отключается, а квота Drive API - временная ошибка."""
+        quota = gspread.exceptions.APIError(_FakeResponse(403, text='{"reason": "userRateLimitExceeded"}'))
+        source = _FakeSheetSource(self._values(3))
+        source.errors = [quota]
+        sync = SheetSync(source, serial_column=1)
+        index = sync.sync(sync.sync(None))
+        assert sync.sync(index) is index
+        
+        source.errors = [_api_error(403)]
+        sync = SheetSync(source, serial_column=1)
+        index = sync.sync(None)
+        sync.sync(index)
+        assert sync.stats["downloads"] == 2 and sync.stats["unchanged"] == 0
+    
+    def test_open_circuit_skips_sync(self):
+        """Тест что при разомкнутом выключателе синхронизация пропускается, а не скачивает лист."""
+        source = _FakeSheetSource(self._values(3))
+        sync = SheetSync(source, serial_column=1)
+        index = sync.sync(None)
+        source.errors = [CircuitOpenError(30)]
+        with pytest.raises(CircuitOpenError):
+            sync.sync(index)
+        assert sync.sync(index) is index
+        assert source.downloads == 1
+    
+    def test_duplicates_across_blocks(self):
+        """Тест что при дубликатах в разных блоках остается первая строка."""
+        values = self._values(6)
+        values.append(['000000000001', 'Дубликат'])
+        sync = SheetSync(_FakeSheetSource(values), serial_column=1, block_rows=4)
+        assert sync.sync(None).get('000000000001') == {'Модель': 'Модель 1'}
+    
+    def test_new_revision_with_same_values_keeps_index(self):
+        """Тест что при новой ревизии без изменений значений снимок не перестраивается."""
+        source = _FakeSheetSource(self._values(10))
+        sync = SheetSync(source, serial_column=1, block_rows=4)
+        index = sync.sync(None)
+        source.revision = "r2"
+        assert sync.sync(index) is index
+        assert index.revision == "r2"
+        assert source.downloads == 2
+
+
+class TestFederation:
+    """Тесты для объединения нескольких таблиц в один снимок."""
+    
+    def _sources(self):
+        first = _FakeSheetSource([
+            ['Серийный номер', 'Модель'],
+            ['000000000001', 'Модель A'],
+            ['000000000002', 'Модель B'],
+        ], revision="a1")
+        second = _FakeSheetSource([
+            ['Партия', 'Серийный номер', 'Склад'],
+            ['П1', '000000000002', 'Москва'],
+            ['П2', '000000000003', 'Казань'],
+        ], revision="b1")
+        return first, second
+    
+    def _federation(self, first, second):
+        return FederatedSync([
+            SheetSync(first, serial_column=1),
+            SheetSync(second, serial_column=2, ignore_columns={1}),
+        ])
+    
+    def test_merge_with_priority(self):
+        """Тест что строки всех источников объединяются, при дубликатах побеждает первый источник."""
+        federation = self._federation(*self._sources())
+        index = federation.sync(None)
+        assert len(index) == 3
+        assert index.get('000000000002') == {'Модель': 'Модель B'}
+        assert index.get('000000000003') == {'Склад': 'Казань'}
+        assert index.revision == "a1|b1"
+    
+    def test_unchanged_sources_keep_snapshot(self):
+        """Тест что без изменений в источниках возвращается тот же снимок."""
+        first, second = self._sources()
+        federation = self._federation(first, second)
+        index = federation.sync(None)
+        assert federation.sync(index) is index
+        assert (first.downloads, second.downloads) == (1, 1)
+    
+    def test_only_changed_source_is_downloaded(self):
+        """Тест что скачивается только изменившийся источник."""
+        first, second = self._sources()
+        federation = self._federation(first, second)
+        index = federation.sync(None)
+        second.values[2][2] = 'Самара'
+        second.revision = "b2"
+        new_index = federation.sync(index)
+        assert new_index is not index
+        assert new_index.get('000000000003') == {'Склад': 'Самара'}
+        assert new_index.revision == "a1|b2"
+        assert (first.downloads, second.downloads) == (1, 2)
+    
+    def test_restored_snapshot_checked_by_revisions(self):
+        """Тест что снимок с диска не перекачивается, если ревизии источников не изменились."""
+        first, second = self._sources()
+        restored = SerialIndex({'000000000001': {'Модель': 'Модель A'}}, revision="a1|b1")
+        federation = self._federation(first, second)
+        assert federation.sync(restored) is restored
+        assert (first.downloads, second.downloads) == (0, 0)
+    
+    def test_restored_snapshot_after_transient_revision_error(self):
+        """Тест что временный сбой Drive API при проверке снимка с диска не отключает проверку ревизий."""
+        first, second = self._sources()
+        first.errors = [requests.exceptions.Timeout("Drive API")]
+        restored = SerialIndex({'000000000001': {'Модель': 'Модель A'}}, revision="a1|b1")
+        federation = self._federation(first, second)
+        index = federation.sync(restored)
+        assert len(index) == 3
+        for _ in range(3):
+            assert federation.sync(index) is index
+        assert (first.downloads, second.downloads) == (1, 1)
+    
+    def test_parse_sheet_sources(self):
+        """Тест разбора SHEET_SOURCES."""
+        default = SheetSourceConfig("default-id")
+        assert parse_sheet_sources("", default) == [default]
+        assert parse_sheet_sources("", SheetSourceConfig(None)) == []
+        sources = parse_sheet_sources(
+            '[{"sheet_id": "a"}, {"sheet_id": "b", "sheet_name": "2024", "serial_column": 2, "ignore_columns": "1, 3"}]',
+            default,
+        )
+        assert sources == [
+            SheetSourceConfig("a"),
+            SheetSourceConfig("b", "2024", 2, frozenset({1, 3})),
+        ]
+        with pytest.raises(ValueError):
+            parse_sheet_sources('[{"sheet_name": "2024"}]')
+        with pytest.raises(ValueError):
+            parse_sheet_sources('not json')
+
+
+class TestSnapshotStore:
+    """Тесты для сохранения снимка таблицы на диск."""
+    
+    def test_roundtrip(self, tmp_path):
+        """Тест сохранения и загрузки снимка."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        index.revision = "r1"
+        save_snapshot(index, path)
+        
+        loaded = load_snapshot(path)
+        assert len(loaded) == len(index)
+        assert loaded.get('012345678913') == index.get('012345678913')
+        assert loaded.revision == "r1"
+        assert loaded.built_at == index.built_at
+    
+    def test_touch_updates_checked_at(self, tmp_path):
+        """Тест обновления времени сверки без перезаписи данных."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        save_snapshot(index, path)
+        index.checked_at += 100
+        touch_snapshot(index, path)
+        assert load_snapshot(path).checked_at == index.checked_at
+    
+    def test_columns_file_is_mapped(self, tmp_path, monkeypatch):
+        """Тест что при загрузке снимок отображается из столбцового файла, а строки базы не разбираются."""
+        import snapshot_store
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        save_snapshot(index, path)
+        index.revision = "r2"
+        index.checked_at += 100
+        touch_snapshot(index, path)
+        
+        monkeypatch.setattr(snapshot_store, "ColumnarRowsBuilder", None)
+        loaded = load_snapshot(path)
+        assert dict(loaded.items()) == dict(index.items())
+        assert (loaded.revision, loaded.checked_at) == ("r2", index.checked_at)
+    
+    def test_columns_file_fallback(self, tmp_path):
+        """Тест что без столбцового файла или при его расхождении с базой снимок читается из базы."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        old = SerialIndex.from_values(SAMPLE_VALUES[:2], serial_column=1)
+        save_snapshot(old, path)
+        stale_columns = (tmp_path / "old.idx")
+        stale_columns.write_bytes(open(columns_path(path), "rb").read())
+        
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        index.built_at += 1
+        save_snapshot(index, path)
+        os.replace(stale_columns, columns_path(path))
+        assert len(load_snapshot(path)) == 2
+        
+        os.remove(columns_path(path))
+        assert len(load_snapshot(path)) == 2
+        # Снимок без столбцового файла получает его при следующей сверке с таблицей
+        touch_snapshot(index, path)
+        assert os.path.exists(columns_path(path))
+    
+    def test_missing_or_broken_file(self, tmp_path):
+        """Тест отсутствующего и поврежденного файла."""
+        assert load_snapshot(str(tmp_path / "missing.sqlite3")) is None
+        broken = tmp_path / "broken.sqlite3"
+        broken.write_bytes(b"not a database")
+        assert load_snapshot(str(broken)) is None
+    
+    def test_served_when_google_unavailable(self, tmp_path, monkeypatch):
+        """Тест что при недоступном Google бот отвечает по сохраненному снимку."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        index.checked_at -= 7200
+        save_snapshot(index, path)
+        
+        def unavailable():
+            raise ConnectionError("Google недоступен")
+        
+        monkeypatch.setattr(google_sheets, "_index", None)
+        monkeypatch.setattr(google_sheets, "SNAPSHOT_PATH", path)
+        monkeypatch.setattr(google_sheets, "SNAPSHOT_MAX_STALENESS", 3600)
+        monkeypatch.setattr(google_sheets, "_fetch_index", unavailable)
+        
+        assert google_sheets.load_saved_snapshot() is True
+        with pytest.raises(ConnectionError):
+            google_sheets.refresh_index()
+        assert google_sheets.get_data_by_serial_number('012345678912')['Модель'] == 'Сатурн'
+        assert google_sheets.is_snapshot_stale() is True
+
+
+class TestLookupBackends:
+    """Тесты для локальных источников данных (SQLite и CSV)."""
+    
+    CSV_TEXT = (
+        "\ufeffСерийный номер;Модель;Комментарий;_internal\n"
+        "012345678912;Сатурн;\"Строка 1\nСтрока 2; с разделителем\";x\n"
+        "0123-4567-8913;Юпитер;;x\n"
+        "012345678912;Дубликат;;x\n"
+    )
+    
+    def _write_csv(self, tmp_path):
+        path = tmp_path / "catalog.csv"
+        path.write_bytes(self.CSV_TEXT.encode("utf-8"))
+        return str(path)
+    
+    def _check(self, backend):
+        assert len(backend) == 2
+        assert backend.get('012345678912') == {'Модель': 'Сатурн', 'Комментарий': 'Строка 1\nСтрока 2; с разделителем'}
+        assert backend.get('0123-4567-8913') == {'Модель': 'Юпитер', 'Комментарий': ''}
+        assert backend.get('999999999999') is None
+        assert backend.get_rendered('012345678913', lambda serial, data: f"{serial}: {data['Модель']}") == '012345678913: Юпитер'
+        assert asyncio.run(backend.get_index()) is backend
+        assert backend.find_existing(['999999999999', '012345678913', '012345678912']) == ['012345678913', '012345678912']
+        assert backend.complete('0123-4567', 10) == ['012345678912', '012345678913']
+        assert backend.complete('01234567891', 1) == ['012345678912']
+        assert backend.complete('9', 10) == []
+    
+    def test_csv_backend(self, tmp_path):
+        """Тест поиска в CSV файле, отображенном в память."""
+        backend = CsvBackend(self._write_csv(tmp_path), serial_column=1)
+        backend.start()
+        self._check(backend)
+    
+    def test_sqlite_backend(self, tmp_path):
+        """Тест поиска в базе SQLite, построенной из CSV файла."""
+        db_path = str(tmp_path / "catalog.sqlite3")
+        assert import_csv(self._write_csv(tmp_path), db_path, serial_column=1) == 2
+        backend = SqliteBackend(db_path)
+        backend.start()
+        self._check(backend)
+        assert backend.snapshot_age() < 60
+        # Поиск из другого потока использует свое соединение
+        results = []
+        thread = threading.Thread(target=lambda: results.append(backend.get('012345678913')))
+        thread.start()
+        thread.join()
+        assert results == [{'Модель': 'Юпитер', 'Комментарий': ''}]
+    
+    def test_sqlite_backend_reload(self, tmp_path):
+        """Тест что после замены файла базы reload() видит новые данные."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        save_snapshot(SerialIndex.from_values(SAMPLE_VALUES, serial_column=1), path)
+        backend = SqliteBackend(path)
+        backend.start()
+        assert backend.get('012345678912')['Модель'] == 'Сатурн'
+        
+        values = [SAMPLE_VALUES[0], ['012345678912', '2026-02-01', 'Новый', '', 'Венера']]
+        save_snapshot(SerialIndex.from_values(values, serial_column=1), path)
+        backend.reload()
+        assert backend.get('012345678912')['Модель'] == 'Венера'
+        assert len(backend) == 1
+    
+    def test_sqlite_backend_follows_snapshot(self, tmp_path):
+        """Тест что источник по снимку другого экземпляра бота замечает замену файла и устаревание."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        save_snapshot(index, path)
+        backend = SqliteBackend(path, poll=5, max_staleness=3600)
+        backend.start()
+        assert backend.refresh_interval == 5 and not backend.is_stale()
+        generation = backend._generation
+        backend.reload()
+        assert backend._generation == generation
+        
+        # Плановое обновление (IndexRefresher) переоткрывает замененный файл
+        values = [SAMPLE_VALUES[0], ['012345678912', '2026-02-01', 'Новый', '', 'Венера']]
+        stale = SerialIndex.from_values(values, serial_column=1)
+        stale.checked_at -= 7200
+        save_snapshot(stale, path)
+        asyncio.run(IndexRefresher(backend, backend.refresh_interval).refresh())
+        assert backend.get('012345678912')['Модель'] == 'Венера'
+        assert backend.is_stale()
+        # База без ограничения возраста (например, из CSV) не устаревает
+        assert not SqliteBackend(path).is_stale()
+        
+        os.remove(path)
+        with pytest.raises(BackendUnavailableError):
+            backend.reload()
+        assert backend.get('012345678912')['Модель'] == 'Венера'
+
+    def test_sqlite_backend_wal_and_close(self, tmp_path):
+        """Тест что снимок сохраняется в режиме WAL, а close() закрывает соединения всех потоков."""
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        index.checked_at -= 7200
+        save_snapshot(index, path)
+        backend = SqliteBackend(path, max_staleness=3600)
+        backend.start()
+        assert backend._connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert backend.is_stale()
+
+        # Время сверки видно открытому соединению без переоткрытия базы
+        index.mark_checked()
+        touch_snapshot(index, path)
+        assert not backend.is_stale()
+
+        connections = []
+        worker = threading.Thread(target=lambda: connections.append(backend._connection()))
+        worker.start()
+        worker.join()
+        backend.close()
+        for connection in [backend._local.connection] + connections:
+            with pytest.raises(sqlite3.ProgrammingError):
+                connection.execute("SELECT 1")
+        assert backend.get('012345678912')['Модель'] == 'Сатурн'
+
+    def test_create_backend(self, tmp_path):
+        """Тест выбора источника данных по имени."""
+        assert create_backend("sheets").name == "sheets"
+        assert isinstance(create_backend("csv", self._write_csv(tmp_path)), CsvBackend)
+        assert isinstance(create_backend("sqlite", str(tmp_path / "db.sqlite3")), SqliteBackend)
+        with pytest.raises(ValueError):
+            create_backend("excel")
+        with pytest.raises(ValueError):
+            SqliteBackend(str(tmp_path / "missing.sqlite3")).start()
+    
+    def test_bot_uses_backend(self, tmp_path, monkeypatch):
+        """Тест что бот отвечает по выбранному источнику данных."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        serial = add_valid_luhn_checksum('01234567891')
+        path = tmp_path / "catalog.csv"
+        path.write_text(f"Серийный номер,Модель\n{serial},Сатурн\n", encoding="utf-8")
+        backend = CsvBackend(str(path))
+        backend.start()
+        monkeypatch.setattr(bot, "backend", backend)
+        
+        update = _FakeUpdate(1)
+        update.message.text = serial
+        asyncio.run(bot.handle_message(update, None))
+        assert 'Сатурн' in update.message.replies[0]
+
+
+class TestSuggestions:
+    """Тесты для подсказок по номерам с опечаткой."""
+    
+    def _brute_force(self, serial):
+        """Все замены одной цифры и перестановки соседних цифр с верной контрольной суммой."""
+        candidates = set()
+        for position in range(len(serial)):
+            for digit in "0123456789":
+                candidates.add(serial[:position] + digit + serial[position + 1:])
+            if position + 1 < len(serial):
+                candidates.add(serial[:position] + serial[position + 1] + serial[position] + serial[position + 2:])
+        candidates.discard(serial)
+        return {candidate for candidate in candidates if validate_luhn_checksum(candidate)}
+    
+    @pytest.mark.parametrize("serial", ['012345678912', '012345678913', '900000000009', '555555555555', '109876543210'])
+    def test_corrections_match_brute_force(self, serial):
+        """Тест что кандидаты совпадают с полным перебором."""
+        candidates = luhn_corrections(serial)
+        assert len(candidates) == len(set(candidates))
+        assert set(candidates) == self._brute_force(serial)
+    
+    def test_transpositions_come_first(self):
+        """Тест что перестановки соседних цифр предлагаются раньше замен."""
+        serial = add_valid_luhn_checksum('01234567891')
+        typo = serial[:3] + serial[4] + serial[3] + serial[5:]
+        assert not validate_luhn_checksum(typo)
+        candidates = luhn_corrections(typo)
+        assert serial in candidates
+        changed = [sum(a != b for a, b in zip(candidate, typo)) for candidate in candidates]
+        assert changed == sorted(changed, reverse=True)
+        assert changed.index(1) > candidates.index(serial)
+    
+    def test_suggest_only_existing(self):
+        """Тест что предлагаются только номера из снимка, не больше limit."""
+        serial = add_valid_luhn_checksum('01234567891')
+        typo = serial[:-1] + str((int(serial[-1]) + 1) % 10)
+        index = SerialIndex({serial: {'Модель': 'Сатурн'}, '999999999999': {'Модель': 'Марс'}})
+        assert suggest_serials(typo, index) == [serial]
+        assert suggest_serials(typo, index, limit=0) == []
+        assert suggest_serials('123', index) == []
+    
+    def test_bot_offers_buttons(self, monkeypatch):
+        """Тест что при опечатке бот предлагает кнопки с номерами из базы."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        serial = add_valid_luhn_checksum('01234567891')
+        index = SerialIndex({serial: {'Модель': 'Сатурн'}})
+        
+        class _Backend:
+            async def get_index(self):
+                return index
+        
+        monkeypatch.setattr(bot, "backend", _Backend())
+        update = _FakeUpdate(1)
+        update.message.text = serial[:-1] + str((int(serial[-1]) + 1) % 10)
+        asyncio.run(bot.handle_message(update, None))
+        assert 'Возможно, вы имели в виду' in update.message.replies[0]
+        button = update.message.markups[0].inline_keyboard[0][0]
+        assert button.callback_data == bot.SUGGESTION_CALLBACK_PREFIX + serial
+        
+        # Нажатие на кнопку ищет выбранный номер
+        class _Query:
+            data = button.callback_data
+            message = _FakeMessage()
+            
+            async def answer(self):
+                pass
+        
+        query = _Query()
+        update.callback_query = query
+        monkeypatch.setattr(bot, "backend", type("B", (_Backend,), {"is_stale": lambda self: False})())
+        asyncio.run(bot.handle_suggestion(update, None))
+        assert 'Сатурн' in query.message.replies[0]
+
+    def test_miss_from_stale_snapshot_is_marked(self, monkeypatch):
+        """Тест что ответ «не найден» по устаревшему снимку тоже получает предупреждение."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+
+        class _Backend:
+            async def get_index(self):
+                return SerialIndex({})
+
+            def is_stale(self):
+                return True
+
+            def snapshot_age(self):
+                return 7200
+
+        monkeypatch.setattr(bot, "backend", _Backend())
+        update = _FakeUpdate(1, add_valid_luhn_checksum('01234567891'))
+        asyncio.run(bot.handle_message(update, None))
+        assert 'не найден' in update.message.replies[0]
+        assert update.message.replies[0].endswith("_Данные могут быть устаревшими: обновлены 120 мин назад_")
+
+
+class _FakeInlineQuery:
+    def __init__(self, query_id, text, user_id=1):
+        self.id = query_id
+        self.query = text
+        self.from_user = _FakeUser(user_id)
+        self.answers = []
+    
+    async def answer(self, results, **kwargs):
+        self.answers.append((results, kwargs))
+
+
+class _FakeInlineUpdate:
+    def __init__(self, inline_query):
+        self.inline_query = inline_query
+
+
+class TestInlineMode:
+    """Тесты для inline режима."""
+    
+    def _index(self):
+        serials = add_valid_luhn_checksums([f"01234567{n:03d}" for n in range(30)])
+        return serials, SerialIndex({serial: {'Модель': f'Модель {n}'} for n, serial in enumerate(serials)})
+    
+    def test_prefix_results(self):
+        """Тест результатов для неполного номера."""
+        serials, index = self._index()
+        results = inline_results(index, '0123456700', lambda serial, data: f"{serial}: {data['Модель']}", limit=5)
+        assert [result.id for result in results] == serials[:5]
+        assert results[0].title == format_serial_number(serials[0])
+        assert results[0].description == 'Модель 0'
+        assert results[0].input_message_content.message_text == f"{format_serial_number(serials[0])}: Модель 0"
+    
+    def test_full_number_with_typo(self):
+        """Тест что для полного номера с опечаткой предлагаются похожие номера."""
+        serials, index = self._index()
+        typo = serials[3][:-1] + str((int(serials[3][-1]) + 1) % 10)
+        results = inline_results(index, typo, lambda serial, data: serial)
+        assert serials[3] in [result.id for result in results]
+        assert [result.id for result in inline_results(index, serials[3], lambda serial, data: serial)] == [serials[3]]
+    
+    def test_debouncer_drops_superseded_queries(self):
+        """Тест что обрабатывается только последний запрос пользователя."""
+        debouncer = QueryDebouncer(delay=0.01)
+        
+        async def scenario():
+            return await asyncio.gather(
+                debouncer.settle(1, 'a'),
+                debouncer.settle(1, 'b'),
+                debouncer.settle(2, 'c'),
+            )
+        
+        assert asyncio.run(scenario()) == [False, True, True]
+        debouncer.finish(1, 'b')
+        assert not debouncer.is_current(1, 'b')
+    
+    def test_bot_inline_query(self, monkeypatch):
+        """Тест обработчика inline запросов: короткий, устаревший и обработанный запросы."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        serials, index = self._index()
+        
+        class _Backend:
+            async def get_index(self):
+                return index
+        
+        monkeypatch.setattr(bot, "backend", _Backend())
+        monkeypatch.setattr(bot, "inline_debouncer", QueryDebouncer(delay=0.01))
+        
+        short = _FakeInlineQuery('1', '01')
+        first = _FakeInlineQuery('2', '012345')
+        second = _FakeInlineQuery('3', '0123456700')
+        
+        async def scenario():
+            await bot.handle_inline_query(_FakeInlineUpdate(short), None)
+            await asyncio.gather(
+                bot.handle_inline_query(_FakeInlineUpdate(first), None),
+                bot.handle_inline_query(_FakeInlineUpdate(second), None),
+            )
+        
+        asyncio.run(scenario())
+        assert short.answers[0][0] == [] and short.answers[0][1]['button'] is not None
+        assert first.answers == []
+        results, kwargs = second.answers[0]
+        assert [result.id for result in results] == serials[:10]
+        assert kwargs['cache_time'] == bot.INLINE_CACHE_TIME
+
+
+class TestReplyCache:
+    """Тесты для кэша готовых ответов."""
+    
+    def test_lru_eviction(self):
+        """Тест вытеснения давно не использованных записей."""
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert cache.stats["evictions"] == 1
+    
+    def test_ttl(self):
+        """Тест устаревания записей."""
+        cache = LRUCache(maxsize=2, ttl=-1)
+        cache.put('a', 1)
+        assert cache.get('a') is None
+    
+    def test_reply_rendered_once_per_snapshot(self):
+        """Тест что ответ форматируется один раз и не переживает замену снимка."""
+        renders = []
+        
+        def render(serial, data):
+            renders.append(serial)
+            return google_sheets.format_reply(serial, data)
+        
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        first = index.get_rendered('0123-4567-8912', render)
+        assert index.get_rendered('0123-4567-8912', render) is first
+        assert first.startswith('✅ *Серийный номер:* 0123-4567-8912')
+        assert '*Модель*\nСатурн' in first
+        assert index.get_rendered('9999-9999-9999', render) is None
+        assert len(renders) == 1
+        
+        new_index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        new_index.get_rendered('0123-4567-8912', render)
+        assert len(renders) == 2
+
+
+class TestNegativeLookup:
+    """Тесты для фильтра Блума и кэша отсутствующих номеров."""
+    
+    def test_bloom_has_no_false_negatives(self):
+        """Тест что все добавленные номера находятся фильтром."""
+        keys = [f"{n * 7919:012d}" for n in range(2000)]
+        bloom = BloomFilter.from_keys(keys, capacity=len(keys))
+        assert all(key in bloom for key in keys)
+    
+    def test_bloom_false_positive_rate(self):
+        """Тест что доля ложных срабатываний близка к заданной."""
+        keys = [f"{n * 7919:012d}" for n in range(2000)]
+        bloom = BloomFilter.from_keys(keys, capacity=len(keys), error_rate=0.01)
+        others = [f"{n * 7919 + 1:012d}" for n in range(5000)]
+        false_positives = sum(key in bloom for key in others)
+        assert false_positives / len(others) < 0.03
+        assert bloom.false_positive_rate < 0.02
+        assert bloom.memory_bytes < 4000
+    
+    def test_leading_zeros_are_distinguished(self):
+        """Тест что номера, отличающиеся ведущими нулями, не совпадают по хешу."""
+        bloom = BloomFilter.from_keys(['012345678912'], capacity=1000)
+        assert '12345678912' not in bloom
+    
+    def test_false_positive_is_cached(self, monkeypatch):
+        """Тест что промах после ложного срабатывания фильтра попадает в кэш промахов."""
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        monkeypatch.setattr(index.bloom, "__class__", type("AlwaysBloom", (BloomFilter,), {
+            "__contains__": lambda self, key: True,
+        }))
+        assert index.get('999999999999') is None
+        assert index.get('999999999999') is None
+        stats = index.membership_stats()
+        assert stats["negative_cache_size"] == 1
+        assert stats["negative_cache_hits"] == 1
+        assert stats["bloom_items"] == 2
+
+
+class TestBulkLookup:
+    """Тесты для пакетного поиска серийных номеров."""
+    
+    def test_split_candidates(self):
+        """Тест разбиения сообщения со списком номеров."""
+        text = "0123-4567-8912\n0123 4567 8913, 012345678914;\n\n012345678915 012345678916"
+        assert split_serial_candidates(text) == [
+            '0123-4567-8912', '0123 4567 8913', '012345678914', '012345678915', '012345678916',
+        ]
+    
+    def test_single_serial_is_not_split(self):
+        """Тест что одиночный номер с пробелами не разбивается."""
+        assert split_serial_candidates("  0123 4567 8912  ") == ['0123 4567 8912']
+    
+    def test_text_around_single_serial(self):
+        """Тест что части сообщения без цифр не превращают поиск одного номера в пакетный."""
+        for text in ("Привет, проверьте номер 012345678911", "Серийник:\n012345678911", "SN 012345678911, спасибо"):
+            assert len(split_serial_candidates(text)) == 1
+        assert split_serial_candidates("Номера:\n012345678911\n012345678912\nСпасибо") == ['012345678911', '012345678912']
+    
+    def test_text_around_single_serial_is_one_lookup(self, monkeypatch):
+        """Тест что сообщение с одним номером и текстом вокруг получает обычный ответ, а не CSV файл."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        class _Backend:
+            async def get_index(self):
+                return SerialIndex.from_values([['SN', 'Модель'], ['012345678911', 'Сатурн']], serial_column=1)
+            
+            def is_stale(self):
+                return False
+        
+        monkeypatch.setattr(bot, "backend", _Backend())
+        update = _FakeUpdate(1, "SN 012345678911, спасибо")
+        asyncio.run(bot.handle_message(update, None))
+        assert len(update.message.replies) == 1 and "Сатурн" in update.message.replies[0]
+    
+    def test_parse_serial_numbers_matches_single(self):
+        """Тест что пакетный разбор совпадает с поштучным."""
+        inputs = [add_valid_luhn_checksum('12345678901'), '12345', '', add_valid_luhn_checksum('98765432109')[:-1] + '0',
+                  'SN' + add_valid_luhn_checksum('55555555555')]
+        assert parse_serial_numbers(inputs) == [parse_serial_number(value) for value in inputs]
+    
+    def test_extract_from_csv(self):
+        """Тест извлечения номеров из CSV файла с заголовком."""
+        content = "Серийный номер;Комментарий\n0123-4567-8912;первый\n\n012345678913;второй\n".encode("utf-8-sig")
+        assert extract_serials_from_file(content, "shipment.CSV") == ['0123-4567-8912', '012345678913']
+    
+    def test_extract_from_txt_cp1251(self):
+        """Тест извлечения номеров из текстового файла в кодировке Windows-1251."""
+        content = "Номера:\n012345678912\nПартия А 012345678913\n".encode("cp1251")
+        assert extract_serials_from_file(content, "list.txt") == ['012345678912', 'Партия А 012345678913']
+    
+    def test_bulk_lookup_csv(self):
+        """Тест формирования CSV файла с результатами."""
+        serial = add_valid_luhn_checksum('01234567891')
+        values = [SAMPLE_VALUES[0], [serial] + SAMPLE_VALUES[1][1:]]
+        index = SerialIndex.from_values(values, serial_column=1)
+        missing = add_valid_luhn_checksum('99999999999')
+        content, counts = bulk_lookup(index, [serial, missing, '123'])
+        assert counts == {"found": 1, "not_found": 1, "invalid": 1}
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8-sig"))))
+        assert rows[0] == ['Ввод', 'Серийный номер', 'Статус', 'Дата производства', 'Производитель', 'Модель']
+        assert rows[1] == [serial, f"{serial[0:4]}-{serial[4:8]}-{serial[8:12]}", 'найден',
+                           '2026-01-01', 'Вася Иванов', 'Сатурн']
+        assert rows[2][2] == 'не найден'
+        assert rows[3] == ['123', '', 'Серийный номер должен содержать ровно 12 цифр']
+    
+    def test_bulk_lookup_10k(self):
+        """Тест что пакет из 10 000 номеров обрабатывается целиком и строки ответа идут в порядке ввода."""
+        serials = add_valid_luhn_checksums([f"{n:011d}" for n in range(10000)])
+        values = [['Серийный номер', 'Модель']] + [[serial, 'Модель'] for serial in serials[::2]]
+        index = SerialIndex.from_values(values, serial_column=1)
+        content, counts = bulk_lookup(index, serials)
+        assert counts == {"found": 5000, "not_found": 5000, "invalid": 0}
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8-sig"))))[1:]
+        assert [row[0] for row in rows] == serials
+        assert [row[2] for row in rows] == ['найден', 'не найден'] * 5000
+
+
+class _FakeApplication:
+    """Фейковое приложение бота с очередью обновлений."""
+    
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+        self.bot = None
+
+
+class TestWebhook:
+    """Тесты для приема обновлений в режиме webhook."""
+    
+    UPDATE = {"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "012345678912",
+    }}
+    
+    def _post(self, headers=None, data=None):
+        application = _FakeApplication()
+        
+        async def post():
+            app = create_web_app(application, "/telegram", secret_token="secret")
+            async with TestClient(TestServer(app)) as client:
+                response = await client.post("/telegram", json=data, headers=headers or {})
+                return response.status
+        
+        return asyncio.run(post()), application.update_queue
+    
+    def test_update_is_queued(self):
+        """Тест что обновление попадает в очередь бота."""
+        status, queue = self._post({SECRET_HEADER: "secret"}, self.UPDATE)
+        assert status == 200
+        assert queue.get_nowait().message.text == "012345678912"
+    
+    def test_wrong_secret_is_rejected(self):
+        """Тест что запрос без секретного токена отклоняется."""
+        for headers in ({SECRET_HEADER: "wrong"}, {}):
+            status, queue = self._post(headers, self.UPDATE)
+            assert status == 403
+            assert queue.empty()
+
+    def test_metrics_per_worker(self, monkeypatch):
+        """Тест что при нескольких воркерах метрики отдаются на своем порту каждого воркера, а не на общем."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        import webhook
+        from aiohttp import web
+
+        servers = []
+
+        class _Runner:
+            async def cleanup(self):
+                servers.append("cleanup")
+
+        async def start_metrics_server(host, port, setup_web_app=None):
+            servers.append(port)
+            return _Runner()
+
+        async def serve_webhook(application, **kwargs):
+            app = web.Application()
+            kwargs["setup_web_app"](app)
+            servers.append(sorted(resource.canonical for resource in app.router.resources()))
+
+        monkeypatch.setattr(bot, "start_metrics_server", start_metrics_server)
+        monkeypatch.setattr(webhook, "serve_webhook", serve_webhook)
+        monkeypatch.setattr(bot, "METRICS_PORT", 9100)
+        monkeypatch.setattr(bot, "REFRESH_HOOK_TOKEN", "")
+
+        monkeypatch.setattr(bot, "WEBHOOK_WORKERS", 3)
+        asyncio.run(bot._serve_webhook_worker(None, 2))
+        assert servers == [9102, [], "cleanup"]
+
+        servers.clear()
+        monkeypatch.setattr(bot, "WEBHOOK_WORKERS", 1)
+        asyncio.run(bot._serve_webhook_worker(None, 0))
+        assert servers == [["/metrics"]]
+
+
+class _FakeMessage:
+    def __init__(self, text=""):
+        self.text = text
+        self.replies = []
+        self.markups = []
+    
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        self.markups.append(kwargs.get('reply_markup'))
+
+
+class _FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class _FakeUpdate:
+    def __init__(self, user_id, text=""):
+        self.effective_user = _FakeUser(user_id)
+        self.effective_chat = None
+        self.message = _FakeMessage(text)
+        self.effective_message = self.message
+        self.callback_query = None
+
+
+class TestRateLimit:
+    """Тесты для ограничения частоты запросов и справедливой очереди."""
+    
+    def test_token_bucket(self):
+        """Тест пополнения ведра токенов."""
+        bucket = TokenBucket(rate=1, burst=2)
+        now = bucket.updated_at
+        assert bucket.try_acquire(now)
+        assert bucket.try_acquire(now)
+        assert not bucket.try_acquire(now)
+        assert bucket.try_acquire(now + 1)
+    
+    def test_limiter_is_per_user(self):
+        """Тест что лимит одного пользователя не влияет на другого."""
+        limiter = RateLimiter(rate=0, burst=3)
+        assert [limiter.allow(1) for _ in range(4)] == [True, True, True, False]
+        assert limiter.allow(2)
+        assert limiter.stats == {"allowed": 4, "throttled": 1}
+    
+    def test_limiter_bounds_memory(self):
+        """Тест что число хранимых пользователей ограничено."""
+        limiter = RateLimiter(rate=1, burst=1, max_users=10)
+        for user_id in range(100):
+            limiter.allow(user_id)
+        assert len(limiter._buckets) == 10
+    
+    def test_fair_round_robin(self):
+        """Тест что свободные слоты раздаются пользователям по кругу."""
+        order = []
+        
+        async def run():
+            scheduler = FairScheduler(concurrency=1)
+            gate = asyncio.Event()
+            
+            async def job(user_id, number):
+                async with scheduler.slot(user_id):
+                    if number == 0:
+                        await gate.wait()
+                    order.append((user_id, number))
+            
+            # Пользователь "spam" ставит в очередь много запросов раньше остальных
+            tasks = [asyncio.create_task(job("spam", number)) for number in range(4)]
+            await asyncio.sleep(0)
+            tasks += [asyncio.create_task(job("alice", 1)), asyncio.create_task(job("bob", 1))]
+            await asyncio.sleep(0)
+            gate.set()
+            await asyncio.gather(*tasks)
+            return scheduler
+        
+        scheduler = asyncio.run(run())
+        assert order[:4] == [("spam", 0), ("spam", 1), ("alice", 1), ("bob", 1)]
+        assert scheduler.active == 0 and scheduler.waiting == 0
+    
+    def test_cancelled_waiter_releases_queue(self):
+        """Тест что отмененный запрос не занимает слот."""
+        async def run():
+            scheduler = FairScheduler(concurrency=1)
+            await scheduler.acquire("a")
+            waiter = asyncio.create_task(scheduler.acquire("b"))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            scheduler.release()
+            return scheduler
+        
+        scheduler = asyncio.run(run())
+        assert scheduler.active == 0 and scheduler.waiting == 0
+    
+    def test_throttled_user_gets_cached_reply(self):
+        """Тест что пользователь сверх лимита получает готовый ответ без поиска."""
+        calls = []
+        
+        async def handler(update, context):
+            calls.append(update)
+        
+        wrapped = rate_limited(RateLimiter(rate=0, burst=1), FairScheduler(concurrency=2))(handler)
+        updates = [_FakeUpdate(1) for _ in range(3)]
+        
+        async def run():
+            for update in updates:
+                await wrapped(update, None)
+        
+        asyncio.run(run())
+        assert calls == [updates[0]]
+        assert updates[1].message.replies == [THROTTLED_REPLY]
+        # Повторное уведомление не отправляется
+        assert updates[2].message.replies == []
+
+    def test_throttled_button_press_is_answered(self):
+        """Тест что нажатие кнопки сверх лимита получает ответ на нажатие, а не новое сообщение."""
+        class _Query:
+            def __init__(self):
+                self.answers = []
+
+            async def answer(self, text=None):
+                self.answers.append(text)
+
+        calls = []
+
+        async def handler(update, context):
+            calls.append(update)
+
+        wrapped = rate_limited(RateLimiter(rate=0, burst=1), FairScheduler(concurrency=2))(handler)
+        updates = [_FakeUpdate(1) for _ in range(3)]
+        for update in updates:
+            update.callback_query = _Query()
+
+        async def run():
+            for update in updates:
+                await wrapped(update, None)
+
+        asyncio.run(run())
+        assert calls == [updates[0]]
+        assert updates[1].callback_query.answers == [THROTTLED_REPLY]
+        # Без повторного уведомления нажатие все равно получает ответ
+        assert updates[2].callback_query.answers == [None]
+        assert all(update.message.replies == [] for update in updates)
+
+
+class TestMetrics:
+    """Тесты для метрик в формате Prometheus."""
+    
+    def test_histogram_buckets(self):
+        """Тест распределения значений по корзинам гистограммы."""
+        histogram = Histogram("latency_seconds", "Задержка", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        with histogram.time():
+            pass
+        lines = histogram.render()
+        assert 'latency_seconds_bucket{le="0.1"} 3' in lines
+        assert 'latency_seconds_bucket{le="1.0"} 4' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 5' in lines
+        assert 'latency_seconds_count 5' in lines
+    
+    def test_registry_render(self):
+        """Тест формата вывода счетчиков и показателей."""
+        registry = Registry()
+        requests_counter = registry.register(Counter("requests_total", "Запросы", label="result"))
+        requests_counter.inc("hit")
+        requests_counter.inc("hit")
+        registry.register(Gauge("rows", "Строки", lambda: 10))
+        registry.register(Gauge("stats", "Статистика", lambda: {"a": 1, "b\"": 2}, label="kind"))
+        registry.register(Gauge("broken", "Ошибка", lambda: 1 / 0))
+        text = registry.render()
+        assert '# TYPE requests_total counter' in text
+        assert 'requests_total{result="hit"} 2' in text
+        assert 'rows 10' in text
+        assert 'stats{kind="b\\""} 2' in text
+        assert 'broken' not in text
+    
+    def test_handle_message_is_instrumented(self, monkeypatch):
+        """Тест что обработчик сообщений считает попадания, промахи и ошибки ввода."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        serial = add_valid_luhn_checksum('01234567891')
+        values = [SAMPLE_VALUES[0], [serial] + SAMPLE_VALUES[1][1:]]
+        monkeypatch.setattr(google_sheets, "_index", SerialIndex.from_values(values, serial_column=1))
+        
+        class MessageUpdate(_FakeUpdate):
+            def __init__(self, text):
+                super().__init__(1)
+                self.message.text = text
+        
+        before = {result: LOOKUPS.value(result) for result in ("hit", "miss", "invalid")}
+        updates = [MessageUpdate(serial), MessageUpdate(add_valid_luhn_checksum('99999999999')), MessageUpdate('123')]
+        
+        async def run():
+            for update in updates:
+                await bot.handle_message(update, None)
+        
+        asyncio.run(run())
+        assert updates[0].message.replies[0].startswith('✅')
+        assert 'не найден' in updates[1].message.replies[0]
+        for result in ("hit", "miss", "invalid"):
+            assert LOOKUPS.value(result) == before[result] + 1
+        assert metrics.TELEGRAM_SEND_SECONDS.count >= 3
+
+
+class TestSettings:
+    """Тесты для разбора настроек из переменных окружения."""
+    
+    def test_defaults(self):
+        """Тест значений по умолчанию без переменных окружения."""
+        settings = load_settings({})
+        assert settings == Settings()
+        assert settings.snapshot_path == "data/sheet_snapshot.sqlite3"
+        assert settings.bot_token is None
+    
+    def test_types_and_normalization(self):
+        """Тест приведения типов, регистра и пустых значений."""
+        settings = load_settings({
+            "SHEET_CHUNK_ROWS": "100",
+            "SHEETS_TIMEOUT": "2.5",
+            "LOOKUP_BACKEND": "SQLite",
+            "WEBHOOK_SECRET": "",
+            "SNAPSHOT_PATH": "",
+            "SHEETS_RETRIES": "",
+            "IGNORE_COLUMNS": "2, 5,",
+        })
+        assert settings.sheet_chunk_rows == 100
+        assert settings.sheets_timeout == 2.5
+        assert settings.lookup_backend == "sqlite"
+        assert settings.webhook_secret is None
+        # Пустой путь снимка означает "не сохранять", пустое число - значение по умолчанию
+        assert settings.snapshot_path == ""
+        assert settings.sheets_retries == 3
+        assert settings.ignored_columns == frozenset({2, 5})
+    
+    def test_invalid_value_names_variable(self):
+        """Тест что ошибка называет переменную окружения."""
+        with pytest.raises(ValueError, match="SHEET_CHUNK_ROWS"):
+            load_settings({"SHEET_CHUNK_ROWS": "много"})
+        for value in ("0", "-5"):
+            with pytest.raises(ValueError, match="INDEX_REFRESH_INTERVAL должно быть больше 0"):
+                load_settings({"INDEX_REFRESH_INTERVAL": value})
+
+
+class TestCli:
+    """Тесты для командной строки (проверка работоспособности и поиск номера)."""
+    
+    SERIAL = add_valid_luhn_checksum('01234567891')
+    
+    def _settings(self, tmp_path, checked_ago=0.0, **overrides):
+        path = str(tmp_path / "snapshot.sqlite3")
+        index = SerialIndex.from_values([SAMPLE_VALUES[0], [self.SERIAL] + SAMPLE_VALUES[1][1:]], serial_column=1)
+        index.checked_at -= checked_ago
+        save_snapshot(index, path)
+        values = dict(bot_token="test", sheet_id="sheet", sheet_pat="{}", snapshot_path=path)
+        values.update(overrides)
+        return Settings(**values)
+    
+    def test_check_ok(self, tmp_path):
+        """Тест успешной проверки по сохраненному снимку."""
+        problems, summary = cli.check_health(self._settings(tmp_path))
+        assert problems == []
+        assert "1 номеров" in summary
+    
+    def test_check_problems(self, tmp_path):
+        """Тест проверки без токена, без снимка и с устаревшим снимком."""
+        problems, _ = cli.check_health(self._settings(tmp_path, bot_token=None,
+                                                      snapshot_path=str(tmp_path / "missing.sqlite3")))
+        assert any("BOT_TOKEN" in problem for problem in problems)
+        assert any("не найден" in problem for problem in problems)
+        
+        problems, _ = cli.check_health(self._settings(tmp_path, checked_ago=7200))
+        assert len(problems) == 1 and "устарел" in problems[0]
+    
+    def test_lookup(self, tmp_path):
+        """Тест поиска найденного номера, номера с опечаткой и номера неверной длины."""
+        settings = self._settings(tmp_path)
+        found, response = cli.lookup(settings, self.SERIAL)
+        assert found and response.startswith('✅') and 'Сатурн' in response
+        
+        typo = self.SERIAL[:-1] + str((int(self.SERIAL[-1]) + 1) % 10)
+        found, response = cli.lookup(settings, typo)
+        assert not found and format_serial_number(self.SERIAL) in response
+        
+        assert cli.lookup(settings, '123') == (False, "❌ Серийный номер должен содержать ровно 12 цифр")
+    
+    def test_lookup_does_not_import_heavy_modules(self, tmp_path):
+        """Тест что поиск из командной строки не загружает telegram, gspread и google.auth."""
+        import subprocess
+        import sys
+        path = self._settings(tmp_path).snapshot_path
+        code = (
+            "import sys, cli; exit_code = cli.main(['lookup', sys.argv[1]]); "
+            "heavy = [name for name in ('telegram', 'gspread', 'google.auth', 'aiohttp') if name in sys.modules]; "
+            "print(exit_code, heavy)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code, self.SERIAL],
+            env=dict(os.environ, SNAPSHOT_PATH=path, LOOKUP_BACKEND="sheets"),
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        assert result.stdout.splitlines()[-1] == "0 []"
+
+
+class _FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+    
+    def run_repeating(self, callback, interval, first, name=None):
+        self.jobs.append(("repeating", callback, first, interval))
+    
+    def run_once(self, callback, when, name=None):
+        self.jobs.append(("once", callback, when))
+
+
+class _RefreshBackend:
+    refresh_interval = 300
+    
+    def __init__(self, age=None, error=None):
+        self.age = age
+        self.error = error
+        self.threads = []
+        self.from_source = 0
+    
+    def snapshot_age(self):
+        return self.age
+    
+    def reload(self):
+        self.threads.append(threading.current_thread())
+        if self.error is not None:
+            raise self.error
+    
+    def reload_from_source(self):
+        self.from_source += 1
+        self.reload()
+    
+    async def get_index(self):
+        return SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+
+
+class TestIndexRefresh:
+    """Тесты для прогрева и обновления данных через JobQueue."""
+    
+    def test_warmup_schedule(self):
+        """Тест что прогрев выполняется сразу, а свежий снимок с диска обновляется в срок."""
+        queue = _FakeJobQueue()
+        IndexRefresher(_RefreshBackend(), 300).start(queue)
+        IndexRefresher(_RefreshBackend(age=100), 300).start(queue)
+        IndexRefresher(_RefreshBackend(), None).start(queue)
+        # Без расписания данные только прогреваются
+        assert [(job[0], job[2]) for job in queue.jobs] == [("repeating", 0), ("repeating", 200), ("once", 0)]
+        with pytest.raises(RuntimeError):
+            IndexRefresher(_RefreshBackend(), 300).start(None)
+    
+    def test_refresh_runs_off_event_loop(self):
+        """Тест что данные перестраиваются в пуле потоков, а не в цикле событий."""
+        backend = _RefreshBackend()
+        refresher = IndexRefresher(backend, 300)
+        duration = asyncio.run(refresher.refresh())
+        assert backend.threads[0] is not threading.main_thread()
+        assert duration >= 0 and refresher.stats["succeeded"] == 1
+    
+    def test_requests_are_coalesced(self):
+        """Тест что серия запросов до начала обновления выполняется одним обновлением."""
+        backend = _RefreshBackend()
+        queue = _FakeJobQueue()
+        refresher = IndexRefresher(backend, None, delay=5)
+        refresher.start(queue)
+        assert [refresher.request_refresh() for _ in range(3)] == [True, False, False]
+        assert [(kind, when) for kind, _, when in queue.jobs] == [("once", 0), ("once", 5)]
+        
+        asyncio.run(queue.jobs[1][1](None))
+        assert len(backend.threads) == 1 and backend.from_source == 1
+        assert refresher.request_refresh() is True
+        assert refresher.stats["requested"] == 4 and refresher.stats["coalesced"] == 2
+    
+    def test_failed_refresh_keeps_schedule(self):
+        """Тест что ошибка обновления не останавливает задачу по расписанию."""
+        for error in (BackendUnavailableError("Google недоступен"), RuntimeError("ошибка")):
+            refresher = IndexRefresher(_RefreshBackend(error=error), 300)
+            asyncio.run(refresher._run_scheduled(None))
+            assert refresher.stats["failed"] == 1
+    
+    def test_http_hook(self):
+        """Тест HTTP хука: секрет проверяется, повторный вызов объединяется с запланированным."""
+        refresher = IndexRefresher(_RefreshBackend(), None)
+        refresher.start(_FakeJobQueue())
+        
+        async def post():
+            from aiohttp import web
+            app = web.Application()
+            add_refresh_route(app, refresher, "secret", "/refresh")
+            async with TestClient(TestServer(app)) as client:
+                statuses = [(await client.post("/refresh", headers={REFRESH_TOKEN_HEADER: "wrong"})).status]
+                for _ in range(2):
+                    response = await client.post("/refresh", headers={REFRESH_TOKEN_HEADER: "secret"})
+                    statuses.append((response.status, (await response.json())["scheduled"]))
+                return statuses
+        
+        assert asyncio.run(post()) == [403, (202, True), (202, False)]
+    
+    def test_reload_command(self, monkeypatch):
+        """Тест команды /reload: данные обновляются сразу, ошибка сообщается администратору."""
+        os.environ.setdefault("BOT_TOKEN", "test")
+        import bot
+        
+        backend = _RefreshBackend()
+        monkeypatch.setattr(bot, "backend", backend)
+        monkeypatch.setattr(bot, "refresher", IndexRefresher(backend, None))
+        update = _FakeUpdate(1)
+        asyncio.run(bot.reload_command(update, None))
+        assert update.message.replies[-1].startswith("✅") and "номеров: 2" in update.message.replies[-1]
+        assert backend.from_source == 1
+        
+        backend.error = RuntimeError("квота")
+        asyncio.run(bot.reload_command(update, None))
+        assert update.message.replies[-1] == "❌ Не удалось обновить данные: квота"
+
+
+class TestSharedIndex:
+    """Тесты для общего снимка, отображенного в память несколькими процессами."""
+    
+    VALUES = SAMPLE_VALUES + [['12-34', '2026-01-04', 'Коля', '', 'Венера']]
+    
+    def test_roundtrip(self, tmp_path):
+        """Тест что снимок из файла отвечает так же, как исходный."""
+        path = str(tmp_path / "shared.bin")
+        index = SerialIndex.from_values(self.VALUES, serial_column=1)
+        index.revision = "r1"
+        save_shared_index(index, path)
+        
+        mapped = SharedIndexFile(path).index
+        assert dict(mapped.items()) == dict(index.items())
+        assert mapped.get('0123-4567-8913') == {'Дата производства': '2026-01-02', 'Производитель': 'Петя Петров', 'Модель': 'Юпитер'}
+        assert mapped.get('1234') == index.get('1234')
+        assert mapped.get('999999999999') is None
+        assert mapped.complete('0123', 5) == index.complete('0123', 5)
+        assert mapped.find_existing(['1234', '000000000000', '012345678912']) == ['1234', '012345678912']
+        assert (mapped.revision, mapped.built_at, mapped.checked_at) == ("r1", index.built_at, index.checked_at)
+    
+    def test_empty_index(self, tmp_path):
+        """Тест пустого снимка."""
+        path = str(tmp_path / "shared.bin")
+        save_shared_index(SerialIndex({}), path)
+        mapped = SharedIndexFile(path).index
+        assert len(mapped) == 0 and mapped.get('012345678912') is None
+    
+    def test_backend_follows_published_snapshots(self, tmp_path):
+        """Тест что воркер видит время сверки без перечитывания и отображает новый снимок после подмены."""
+        path = str(tmp_path / "shared.bin")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        index.checked_at -= 7200
+        save_shared_index(index, path)
+        backend = create_backend("shared", path)
+        backend.start()
+        old = asyncio.run(backend.get_index())
+        assert len(backend) == 2 and backend.is_stale()
+        
+        index.mark_checked()
+        touch_shared_index(index, path)
+        backend.reload()
+        assert not backend.is_stale() and asyncio.run(backend.get_index()) is old
+        
+        save_shared_index(SerialIndex.from_values(self.VALUES, serial_column=1), path)
+        backend.reload()
+        assert asyncio.run(backend.get_index()).get('1234') is not None
+        # Запросы, начатые до подмены, дочитывают старый снимок
+        assert old.get('012345678912') is not None and old.get('1234') is None
+    
+    def test_backend_unavailable_until_published(self, tmp_path):
+        """Тест что до публикации снимка воркер сообщает о недоступности, а затем подхватывает снимок."""
+        path = str(tmp_path / "shared.bin")
+        backend = SharedIndexBackend(path)
+        backend.start()
+        assert backend.snapshot_age() is None
+        with pytest.raises(BackendUnavailableError):
+            asyncio.run(backend.get_index())
+        
+        (tmp_path / "shared.bin").write_bytes(b"not a snapshot")
+        with pytest.raises(BackendUnavailableError):
+            backend.reload()
+        
+        save_shared_index(SerialIndex.from_values(SAMPLE_VALUES, serial_column=1), path)
+        assert asyncio.run(backend.get_index()).get('012345678912') is not None
+    
+    def test_loader_publishes_and_touches(self, tmp_path, monkeypatch):
+        """Тест что загрузчик публикует новый снимок, а для неизменившегося обновляет время сверки."""
+        path = str(tmp_path / "shared.bin")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        stop = threading.Event()
+        refreshes = []
+        
+        def refresh_index():
+            refreshes.append(time.time())
+            index.checked_at = refreshes[-1]
+            if len(refreshes) == 3:
+                stop.set()
+            return index
+        
+        monkeypatch.setattr(google_sheets, "load_saved_snapshot", lambda: False)
+        monkeypatch.setattr(google_sheets, "get_snapshot_age", lambda: None)
+        monkeypatch.setattr(google_sheets, "refresh_index", refresh_index)
+        run_loader(path, interval=0.01, stop=stop)
+        
+        assert len(refreshes) == 3
+        mapped = SharedIndexFile(path)
+        assert mapped.index.get('012345678912') is not None
+        assert mapped.checked_at() == refreshes[-1]
+
+    def test_reload_from_source_goes_through_loader(self, tmp_path, monkeypatch):
+        """Тест что /reload и HTTP хук воркера заставляют загрузчик сверить снимок с таблицей сразу."""
+        path = str(tmp_path / "shared.bin")
+        index = SerialIndex.from_values(SAMPLE_VALUES, serial_column=1)
+        refreshes = []
+
+        def refresh_index():
+            refreshes.append(time.time())
+            index.checked_at = refreshes[-1]
+            return index
+
+        monkeypatch.setattr(google_sheets, "load_saved_snapshot", lambda: True)
+        monkeypatch.setattr(google_sheets, "get_index", lambda: index)
+        # Снимок свежий: по расписанию загрузчик обратился бы к таблице только через interval
+        monkeypatch.setattr(google_sheets, "get_snapshot_age", lambda: 0.0)
+        monkeypatch.setattr(google_sheets, "refresh_index", refresh_index)
+        stop = threading.Event()
+        loader = threading.Thread(target=run_loader, args=(path,), kwargs={"interval": 300, "stop": stop, "poll": 0.01})
+        loader.start()
+        try:
+            backend = SharedIndexBackend(path, request_timeout=5)
+            duration = asyncio.run(IndexRefresher(backend, None).refresh(from_source=True))
+        finally:
+            stop.set()
+            loader.join()
+        assert len(refreshes) == 1 and duration >= 0
+        assert backend.snapshot_age() < 5
+        assert not os.path.exists(refresh_request_path(path))
+
+        # Загрузчик не ответил: воркер сообщает об ошибке, а не о сверке с таблицей
+        with pytest.raises(BackendUnavailableError, match="не сверил"):
+            SharedIndexBackend(path, request_timeout=0.05).reload_from_source()
+        assert os.path.exists(refresh_request_path(path))
+
+    def test_cli_check(self, tmp_path):
+        """Тест проверки работоспособности по общему снимку."""
+        import cli
+        path = str(tmp_path / "shared.bin")
+        settings = Settings(bot_token="test", sheet_id="sheet", sheet_pat="{}", lookup_backend="shared",
+                            shared_index_path=path)
+        problems, _ = cli.check_health(settings)
+        assert problems and "не найден" in problems[0]
+        
+        serial = add_valid_luhn_checksum('12345678901')
+        save_shared_index(SerialIndex.from_values([SAMPLE_VALUES[0], [serial] + SAMPLE_VALUES[1][1:]], serial_column=1), path)
+        problems, summary = cli.check_health(settings)
+        assert problems == [] and "1 номеров" in summary
+        found, response = cli.lookup(settings, serial)
+        assert found and "Сатурн" in response
@@ -0,0 +1,119 @@
+"""
+Модуль для работы бота в режиме webhook:
+- встроенный aiohttp сервер, принимающий обновления от Telegram
+- несколько процессов-воркеров на одном порту (SO_REUSEPORT)
+"""
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import signal
+from typing import Callable, List, Optional
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает секретный токен webhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Ключ, под которым в aiohttp приложении хранится приложение бота
+APPLICATION_KEY = web.AppKey("application", Application)
+
+
+def create_web_app(application: Application, path: str, secret_token: Optional[str] = None) -> web.Application:
+    """
+    Создает aiohttp приложение, которое принимает обновления Telegram по адресу path
+    и передает их в очередь обновлений бота.
+    """
+    expected = secret_token.encode() if secret_token else None
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if expected and not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), expected):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        # Отвечаем сразу: обновление обрабатывается ботом асинхронно
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return web.Response()
+
+    app = web.Application()
+    app[APPLICATION_KEY] = application
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def serve_webhook(application: Application, listen: str, port: int, path: str,
+                        webhook_url: Optional[str], allowed_updates: List[str],
+                        secret_token: Optional[str] = None, reuse_port: bool = False,
+                        setup_web_app: Optional[Callable[[web.Application], None]] = None) -> None:
+    """
+    Запускает бота и aiohttp сервер и работает до получения SIGINT/SIGTERM.
+    Если webhook_url указан, регистрирует webhook в Telegram.
+    setup_web_app позволяет добавить в сервер дополнительные маршруты.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    web_app = create_web_app(application, path, secret_token)
+    if setup_web_app is not None:
+        setup_web_app(web_app)
+
+    async with application:
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                allowed_updates=allowed_updates,
+                secret_token=secret_token,
+            )
+        await application.start()
+
+        runner = web.AppRunner(web_app)
+        await runner.setup()
+        site = web.TCPSite(runner, listen, port, reuse_port=reuse_port)
+        await site.start()
+        logger.info("Webhook сервер слушает %s:%d%s", listen, port, path)
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()
+            await application.stop()
+
+
+def run_workers(worker: Callable[[int], None], workers: int,
+                loader: Optional[Callable[[], None]] = None) -> None:
+    """
+    Запускает worker(номер) в нескольких процессах и ждет их завершения.
+    Процессы слушают один порт (SO_REUSEPORT), ядро распределяет соединения между ними.
+    loader запускается в отдельном процессе рядом с воркерами (загрузчик общего снимка).
+    """
+    if workers <= 1 and loader is None:
+        worker(0)
+        return
+
+    processes = [
+        multiprocessing.Process(target=worker, args=(number,), name=f"bot-worker-{number}")
+        for number in range(workers)
+    ]
+    if loader is not None:
+        processes.append(multiprocessing.Process(target=loader, name="index-loader"))
+    for process in processes:
+        process.start()
+
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        terminate(signal.SIGINT, None)
+        for process in processes:
+            process.join()